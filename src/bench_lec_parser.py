@@ -0,0 +1,61 @@
+import logging
+import os
+import tempfile
+import timeit
+
+import legacy
+import lec_parser
+
+# Per line cost of parse_line against the old parse_tag_position. With logging off the two are about even on POS
+# lines, parse_line only pulls ahead once the old path's per line logging is written. parse_tag_position throws DIST
+# lines away unread, parse_line reads every anchor off them, so that row is the cost of the lec mode rather than a
+# like for like comparison.
+LINES = [b"POS,0,14A2,1.23,0.45,0.67,55,x0D\r\n",
+         b"POS,0,0C31,3.10,2.05,1.12,71,x1A\r\n",
+         b"POS,0,14A2,nan,nan,nan,0,x00\r\n",
+         b"DIST,4,AN0,1151,0.00,0.00,0.00,2.47,AN1,0CA8,4.00,0.00,0.00,3.01,AN2,111C,0.00,3.00,0.00,2.12,"
+         b"AN3,1C2D,4.00,3.00,0.00,2.90,POS,1.52,1.71,0.92,63\r\n"]
+
+
+def bench(parse_once, number=20000):
+    return min(timeit.repeat(parse_once, number=number, repeat=5)) / number * 1e9
+
+
+def parse_tag_position_with_floats(line):
+    # What the old path paid per line: parse, then float() every field later on in the filter step.
+    tag_pos = legacy.parse_tag_position(line)
+    if tag_pos is None:
+        return None
+    return float(tag_pos[0]), float(tag_pos[1]), float(tag_pos[2])
+
+
+def report(title):
+    print(title)
+    for line in LINES:
+        old = bench(lambda: parse_tag_position_with_floats(line))
+        new = bench(lambda: lec_parser.parse_line(line))
+        print(f"  {line[:16]!r:24} parse_tag_position + float() {old:7.0f} ns   parse_line {new:7.0f} ns "
+              f"({old / new:.1f}x)")
+
+
+def run():
+    root = logging.getLogger()
+    # A handler on the root logger keeps logging.info() from installing its default stderr handler.
+    root.handlers = [logging.NullHandler()]
+    root.setLevel(logging.WARNING)
+    report("logging disabled")
+
+    # parse_tag_position logs every line at INFO, this is what it costs when written synchronously to a file.
+    with tempfile.TemporaryDirectory() as directory:
+        handler = logging.FileHandler(os.path.join(directory, "uwb_data.log"))
+        root.handlers = [handler]
+        root.setLevel(logging.INFO)
+        try:
+            report("logging to file at INFO")
+        finally:
+            root.handlers = []
+            handler.close()
+
+
+if __name__ == "__main__":
+    run()
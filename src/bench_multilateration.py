@@ -0,0 +1,159 @@
+import argparse
+import logging
+import math
+import time
+
+import numpy as np
+
+import capture
+import lec_parser
+import multilateration
+
+RATE_HZ = 10
+BATCH = 256
+# The DWM1001 reports at most four anchors per lec line and solves on board from those.
+MODULE_ANCHORS = 4
+
+LAYOUTS = {
+    "4 ceiling": [(0.0, 0.0, 2.5), (8.0, 0.0, 2.5), (8.0, 6.0, 2.5), (0.0, 6.0, 2.5)],
+    "8 two heights": [(x, y, z) for x, y in ((0.0, 0.0), (8.0, 0.0), (8.0, 6.0), (0.0, 6.0)) for z in (0.3, 2.5)],
+    "16 grid": [(x, y, z) for x in (0.0, 4.0, 8.0) for y in (0.0, 6.0) for z in (0.3, 2.5)] +
+               [(4.0, 3.0, 2.5), (0.0, 3.0, 2.5), (8.0, 3.0, 2.5), (4.0, 3.0, 0.3)],
+}
+
+
+def walking(t):
+    angle = t * 1.4 / 2.0
+    return 4.0 + 2.0 * math.cos(angle), 3.0 + 2.0 * math.sin(angle), 1.2 + 0.1 * math.sin(t * 3.0)
+
+
+def synthesize(anchors, duration, noise, seed=0):
+    # lec samples whose ranges are the true ones plus gaussian noise printed to the centimetre, like the module
+    # does, and the ground truth.
+    rng = np.random.default_rng(seed)
+    anchors = np.asarray(anchors)
+    timestamps = np.arange(0.0, duration, 1.0 / RATE_HZ)
+    truth = np.array([walking(t) for t in timestamps])
+    distances = np.linalg.norm(truth[:, None, :] - anchors[None], axis=2)
+    distances = np.round(distances + rng.normal(0.0, noise, distances.shape), 2)
+    anchor_ids = tuple(f"{0x1000 + i:04X}" for i in range(len(anchors)))
+    samples = [lec_parser.TagSample("14A2", math.nan, math.nan, math.nan, 80, anchor_ids,
+                                    tuple(map(tuple, anchors)), tuple(row)) for row in distances]
+    return samples, truth
+
+
+def nearest(sample, count):
+    # The sample as the module would see it, ranges to the count nearest anchors only.
+    order = sorted(range(len(sample.distances)), key=sample.distances.__getitem__)[:count]
+    return lec_parser.TagSample(sample.tag_id, sample.x, sample.y, sample.z, sample.quality,
+                                tuple(sample.anchor_ids[i] for i in order),
+                                tuple(sample.anchor_positions[i] for i in order),
+                                tuple(sample.distances[i] for i in order))
+
+
+def percentiles(values):
+    if len(values) == 0:
+        return "no samples"
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return f"p50 {p50 * 100:5.1f}  p95 {p95 * 100:5.1f}  p99 {p99 * 100:5.1f} cm"
+
+
+def solve_sequence(samples, anchor_positions):
+    # What the live loop does: one locate() per sample, each warm started from the previous solution.
+    multilaterator = multilateration.Multilaterator(anchor_positions)
+    positions = np.full((len(samples), 3), np.nan)
+    started = time.perf_counter()
+    for row, sample in enumerate(samples):
+        located = multilaterator.locate({sample.tag_id: (0.0, sample)})
+        if located:
+            positions[row] = located[sample.tag_id].position
+    elapsed = time.perf_counter() - started
+    return positions, len(samples) / elapsed
+
+
+def solve_batched(samples, anchor_positions):
+    # Many tags at once: every sample a separate problem in one gauss_newton call per BATCH.
+    initial = multilateration.Multilaterator(anchor_positions).initial
+    problems = [(np.asarray(sample.anchor_positions), np.asarray(sample.distances)) for sample in samples]
+    size = max(len(distances) for _, distances in problems)
+    anchors = np.zeros((len(problems), size, 3))
+    distances = np.zeros((len(problems), size))
+    mask = np.zeros((len(problems), size))
+    for row, (sample_anchors, sample_distances) in enumerate(problems):
+        anchors[row, :len(sample_distances)] = sample_anchors
+        distances[row, :len(sample_distances)] = sample_distances
+        mask[row, :len(sample_distances)] = 1.0
+
+    positions = np.empty((len(problems), 3))
+    started = time.perf_counter()
+    for start in range(0, len(problems), BATCH):
+        end = start + BATCH
+        positions[start:end], _ = multilateration.gauss_newton(anchors[start:end], distances[start:end],
+                                                               np.tile(initial, (len(anchors[start:end]), 1)),
+                                                               mask[start:end])
+    elapsed = time.perf_counter() - started
+    return positions, len(problems) / elapsed
+
+
+def errors(positions, reference):
+    found = ~np.isnan(positions).any(axis=1)
+    return np.linalg.norm(positions[found] - reference[found], axis=1), int(np.count_nonzero(~found))
+
+
+def run_synthetic(duration, noise):
+    for layout, anchors in LAYOUTS.items():
+        samples, truth = synthesize(anchors, duration, noise)
+        print(f"{layout} anchors, {len(samples)} samples, {noise * 100:.0f} cm range noise")
+
+        positions, rate = solve_sequence(samples, anchors)
+        error, failed = errors(positions, truth)
+        print(f"  host, all anchors      {rate:9.0f} solves/s   error vs truth {percentiles(error)}"
+              f"{f'   {failed} rejected' if failed else ''}")
+
+        module_view = [nearest(sample, MODULE_ANCHORS) for sample in samples]
+        positions, rate = solve_sequence(module_view, anchors)
+        error, failed = errors(positions, truth)
+        print(f"  host, {MODULE_ANCHORS} nearest only  {rate:9.0f} solves/s   error vs truth {percentiles(error)}"
+              f"{f'   {failed} rejected' if failed else ''}")
+
+        positions, rate = solve_batched(samples, anchors)
+        error, failed = errors(positions, truth)
+        print(f"  batch of {BATCH}, cold  {rate:9.0f} solves/s   error vs truth {percentiles(error)}")
+
+
+def run_capture(path):
+    # On real data there is no ground truth, the module's own position is the reference.
+    records = capture.load_capture(path)
+    samples = [capture.record_to_sample(record) for record in records]
+    samples = [sample for sample in samples if len(sample.distances) >= multilateration.MIN_ANCHORS]
+    if not samples:
+        print(f"{path} has no samples with at least {multilateration.MIN_ANCHORS} ranges")
+        return
+    anchor_positions = sorted({position for sample in samples for position in sample.anchor_positions})
+
+    positions, rate = solve_sequence(samples, anchor_positions)
+    module = np.array([sample.position for sample in samples])
+    with_module = ~np.isnan(module).any(axis=1)
+    difference, failed = errors(positions[with_module], module[with_module])
+    print(f"{path}: {len(samples)} samples with ranges, {int(np.count_nonzero(with_module))} with a module position")
+    print(f"  host {rate:9.0f} solves/s   distance to module position {percentiles(difference)}"
+          f"{f'   {failed} rejected' if failed else ''}")
+
+
+def run(duration=60.0, noise=0.05, capture_path=None):
+    root = logging.getLogger()
+    root.handlers = [logging.NullHandler()]
+    root.setLevel(logging.WARNING)
+
+    run_synthetic(duration, noise)
+    if capture_path:
+        run_capture(capture_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark host side multilateration from lec anchor ranges")
+    parser.add_argument("-d", "--duration", type=float, default=60.0, help="Seconds of synthetic tag data")
+    parser.add_argument("-n", "--noise", type=float, default=0.05, help="Range noise sigma, m")
+    parser.add_argument("-c", "--capture", help="Also compare against the module's positions in this capture file")
+    args = parser.parse_args()
+    run(args.duration, args.noise, args.capture)
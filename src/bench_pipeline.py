@@ -0,0 +1,303 @@
+import argparse
+import datetime
+import glob
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+import dmx_mock
+import dmx_scheduler
+import kalman_filter as kf
+import legacy
+import lec_parser
+import main
+import tracker
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench_results")
+
+TAG_ID = "14A2"
+RATE_HZ = 10
+STAGES = ("parse", "filter", "aim", "dmx")
+# Relative change flagged when comparing against the previous run. Timings are noisy, the errors are seeded.
+THROUGHPUT_TOLERANCE = 0.2
+ERROR_TOLERANCE = 0.1
+
+
+def walking(t):
+    # 1.4 m/s around a 2 m circle in the middle of the stage.
+    angle = t * 1.4 / 2.0
+    return 4.0 + 2.0 * math.cos(angle), 3.0 + 2.0 * math.sin(angle), 1.2
+
+
+def running(t):
+    # Figure eight peaking around 5 m/s with sharp turns at the ends.
+    angle = t * 1.2
+    return 4.0 + 3.5 * math.sin(angle), 3.0 + 1.5 * math.sin(2 * angle), 1.2
+
+
+def jittering(t):
+    # Mostly standing, swaying a few centimetres.
+    return 4.0 + 0.05 * math.sin(t * 2.0), 3.0 + 0.05 * math.cos(t * 1.3), 1.2
+
+
+SCENARIOS = {"walking": (walking, 0.0), "running": (running, 0.0), "jitter": (jittering, 0.05)}
+
+
+def synthesize(trajectory, duration, noise, outlier_rate=0.0, seed=0):
+    # Returns the lec lines, their timestamps and the ground truth. Outliers are 1 m multipath jumps with a poor
+    # quality factor, a few readings are lost the way the listener reports them.
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(0.0, duration, 1.0 / RATE_HZ)
+    truth = np.array([trajectory(t) for t in timestamps])
+    measured = truth + rng.normal(0.0, noise, truth.shape)
+
+    outliers = rng.random(len(timestamps)) < outlier_rate
+    directions = rng.normal(size=truth.shape)
+    measured[outliers] += directions[outliers] / np.linalg.norm(directions[outliers], axis=1)[:, None]
+    quality = np.where(outliers, 20, 80)
+    lost = rng.random(len(timestamps)) < 0.01
+
+    lines = []
+    for (x, y, z), q, missing in zip(measured, quality, lost):
+        if missing:
+            lines.append(f"POS,0,{TAG_ID},nan,nan,nan,0,x00\r\n".encode())
+        else:
+            lines.append(f"POS,0,{TAG_ID},{x:.2f},{y:.2f},{z:.2f},{q},x0D\r\n".encode())
+    return lines, timestamps, truth
+
+
+class LegacyPipeline:
+    # The original loop: string parsing, one random walk filter per axis and the scalar pan/tilt math, run from the
+    # unchanged legacy.py. Its aim error includes the old coarse channel overflow, the whole 16 bit value clamped to
+    # 255 there.
+    name = "legacy"
+
+    def __init__(self, light_system):
+        self.light_system = main.LIGHT_SYSTEMS[light_system]
+        self.fixture_position = self.light_system["position"]
+        self.filters = [kf.KalmanFilter(process_variance=1e-4, estimated_measurement_variance=0.1 ** 4)
+                        for _ in range(3)]
+        self.output = dmx_scheduler.DmxRefreshScheduler(dmx_mock.MockDMXInterface())
+        self.estimate = None
+
+    def parse(self, line):
+        return legacy.parse_tag_position(line)
+
+    def filter(self, tag_pos, timestamp):
+        self.estimate = legacy.filter_position(*self.filters, tag_pos)
+        return self.estimate
+
+    def aim(self, timestamp):
+        relative = tuple(axis - origin for axis, origin in zip(self.estimate, self.fixture_position))
+        return legacy.uwb_position_to_pan_tilt(relative, main.PAN_SCALE, main.PAN_OFFSET, main.TILT_SCALE,
+                                               main.TILT_OFFSET, self.light_system)
+
+    def dmx(self, values, timestamp):
+        pan_coarse, pan_fine, tilt_coarse, tilt_fine = values
+        self.output.set_channel(self.light_system["pan_channel"], pan_coarse)
+        self.output.set_channel(self.light_system["pan_fine_channel"], pan_fine)
+        self.output.set_channel(self.light_system["tilt_channel"], tilt_coarse)
+        self.output.set_channel(self.light_system["tilt_fine_channel"], tilt_fine)
+        self.output.publish(timestamp)
+
+
+class TrackerPipeline:
+    # What init() runs today: byte parser, constant velocity filter bank and the vectorized fixtures.
+    name = "tracker"
+
+    def __init__(self, light_system):
+        self.fixture_array = main.build_fixtures([light_system])
+        self.tracker = tracker.TagTracker(self.fixture_array,
+                                          kf.ConstantVelocityKalmanFilterBank(main.PROCESS_NOISE,
+                                                                              main.MEASUREMENT_NOISE),
+                                          min_quality=main.MIN_QUALITY)
+        self.output = dmx_scheduler.DmxRefreshScheduler(dmx_mock.MockDMXInterface())
+        self.universe = np.frombuffer(self.output.back_buffer, dtype=np.uint8)
+        self.estimate = None
+
+    def parse(self, line):
+        sample = lec_parser.parse_line(line)
+        if sample is None or not sample.has_position:
+            return None
+        return sample
+
+    def filter(self, sample, timestamp):
+        # The batch call init() makes for every take(), here with one sample.
+        accepted, _ = self.tracker.update_batch((sample.tag_id,), (sample.position,), (timestamp,), (sample.quality,))
+        if not accepted[0]:
+            return None
+        self.estimate = self.tracker.filter_bank.get_latest_estimated_measurement(sample.tag_id)
+        return self.estimate
+
+    def aim(self, timestamp):
+        targets, mask = self.tracker.targets(timestamp)
+        pan, tilt = self.fixture_array.pan_tilt(targets, mask)
+        return self.fixture_array.to_dmx(pan, tilt), mask
+
+    def dmx(self, values, timestamp):
+        values, mask = values
+        self.universe[self.fixture_array.channels[mask]] = values[mask]
+        self.output.publish(timestamp)
+
+
+PIPELINES = (LegacyPipeline, TrackerPipeline)
+
+
+def aim_error(fixture, universe, position):
+    # Degrees between the beam the fixture is actually sent to, read back from its 16 bit pan/tilt channels, and
+    # the line from the fixture to the performer. Equivalent pan/tilt solutions score the same.
+    pan_channel, pan_fine_channel, tilt_channel, tilt_fine_channel = fixture.channels
+    pan, tilt = fixture.angles(universe[pan_channel] << 8 | universe[pan_fine_channel],
+                               universe[tilt_channel] << 8 | universe[tilt_fine_channel])
+    wanted = np.asarray(position, dtype=float) - fixture.position
+    cosine = np.dot(fixture.direction(pan, tilt), wanted) / np.linalg.norm(wanted)
+    return math.degrees(math.acos(max(-1.0, min(1.0, cosine))))
+
+
+def percentiles(values, scale=1.0):
+    if len(values) == 0:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, (50, 95, 99)) * scale
+    return {"p50": round(float(p50), 4), "p95": round(float(p95), 4), "p99": round(float(p99), 4),
+            "max": round(float(np.max(values) * scale), 4)}
+
+
+def run_pipeline(pipeline, lines, timestamps, truth, light_system):
+    fixture = main.build_fixtures([light_system]).fixtures[0]
+    stage_ns = {stage: [] for stage in STAGES}
+    position_errors, aim_errors = [], []
+    clock = time.perf_counter_ns
+
+    started = clock()
+    for line, timestamp, position in zip(lines, timestamps, truth):
+        t0 = clock()
+        parsed = pipeline.parse(line)
+        t1 = clock()
+        stage_ns["parse"].append(t1 - t0)
+        if parsed is None:
+            continue
+
+        estimate = pipeline.filter(parsed, timestamp)
+        t2 = clock()
+        stage_ns["filter"].append(t2 - t1)
+        if estimate is None:
+            continue
+
+        values = pipeline.aim(timestamp)
+        t3 = clock()
+        pipeline.dmx(values, timestamp)
+        t4 = clock()
+        stage_ns["aim"].append(t3 - t2)
+        stage_ns["dmx"].append(t4 - t3)
+
+        position_errors.append(math.dist(estimate, position))
+        aim_errors.append(aim_error(fixture, pipeline.output.front_buffer, position))
+    elapsed = (clock() - started) / 1e9
+
+    return {"lines": len(lines),
+            "lines_per_sec": round(len(lines) / elapsed),
+            "stage_us": {stage: percentiles(samples, 1e-3) for stage, samples in stage_ns.items()},
+            "position_error_m": percentiles(position_errors),
+            "aim_error_deg": percentiles(aim_errors)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latest_results(results_dir):
+    paths = sorted(glob.glob(os.path.join(results_dir, "pipeline-*.json")))
+    if not paths:
+        return None, None
+    with open(paths[-1]) as infile:
+        return paths[-1], json.load(infile)
+
+
+def compare(previous, current):
+    # Pipelines whose throughput fell or whose p95 error grew by more than the tolerances.
+    regressions = []
+    for scenario, pipelines in current["scenarios"].items():
+        for name, result in pipelines.items():
+            before = previous.get("scenarios", {}).get(scenario, {}).get(name)
+            if before is None:
+                continue
+            if result["lines_per_sec"] < before["lines_per_sec"] * (1 - THROUGHPUT_TOLERANCE):
+                regressions.append(f"{scenario}/{name} lines/sec {before['lines_per_sec']} -> "
+                                   f"{result['lines_per_sec']}")
+            for metric in ("position_error_m", "aim_error_deg"):
+                if metric not in before:
+                    continue
+                old, new = before[metric]["p95"], result[metric]["p95"]
+                if old is not None and new is not None and new > old * (1 + ERROR_TOLERANCE) + 1e-3:
+                    regressions.append(f"{scenario}/{name} {metric} p95 {old} -> {new}")
+    return regressions
+
+
+def report(results):
+    for scenario, pipelines in results["scenarios"].items():
+        print(f"{scenario}")
+        for name, result in pipelines.items():
+            stages = "  ".join(f"{stage} {result['stage_us'][stage]['p50']}/{result['stage_us'][stage]['p99']}"
+                               for stage in STAGES)
+            print(f"  {name:8} {result['lines_per_sec']:8} lines/s   us p50/p99: {stages}")
+            print(f"  {'':8} error p95: position {result['position_error_m']['p95']} m, "
+                  f"aim {result['aim_error_deg']['p95']} deg")
+
+
+def run(duration=60.0, noise=0.03, outlier_rate=0.02, light_system="BadBoy", results_dir=RESULTS_DIR, save=True):
+    root = logging.getLogger()
+    # Both pipelines log from their hot path, keep that out of the numbers like bench_lec_parser does.
+    root.handlers = [logging.NullHandler()]
+    root.setLevel(logging.WARNING)
+
+    results = {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+               "revision": git_revision(),
+               "python": platform.python_version(),
+               "numpy": np.__version__,
+               "config": {"duration": duration, "rate_hz": RATE_HZ, "noise": noise, "outlier_rate": outlier_rate,
+                          "light_system": light_system},
+               "scenarios": {}}
+    for scenario, (trajectory, extra_noise) in SCENARIOS.items():
+        lines, timestamps, truth = synthesize(trajectory, duration, noise + extra_noise, outlier_rate)
+        results["scenarios"][scenario] = {pipeline.name: run_pipeline(pipeline(light_system), lines, timestamps,
+                                                                      truth, light_system)
+                                          for pipeline in PIPELINES}
+    report(results)
+
+    previous_path, previous = latest_results(results_dir)
+    if previous is not None and previous.get("config") != results["config"]:
+        print(f"not comparing with {os.path.basename(previous_path)}, it was run with {previous.get('config')}")
+    elif previous is not None:
+        regressions = compare(previous, results)
+        print(f"compared with {os.path.basename(previous_path)} ({previous.get('revision')}): "
+              f"{'; '.join(regressions) if regressions else 'no regressions'}")
+
+    if save:
+        os.makedirs(results_dir, exist_ok=True)
+        path = os.path.join(results_dir, f"pipeline-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, "w") as outfile:
+            json.dump(results, outfile, indent=2)
+        print(f"saved {path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parse, filter, pan/tilt and DMX on synthetic tags")
+    parser.add_argument("-d", "--duration", type=float, default=60.0, help="Seconds of synthetic tag data")
+    parser.add_argument("-n", "--noise", type=float, default=0.03, help="UWB position noise sigma, m")
+    parser.add_argument("-o", "--outlier-rate", type=float, default=0.02, help="Fraction of 1 m multipath jumps")
+    parser.add_argument("-l", "--light-system", default="BadBoy", help="Fixture to aim")
+    parser.add_argument("-r", "--results-dir", default=RESULTS_DIR, help="Where results are saved and compared")
+    parser.add_argument("--no-save", action="store_true", help="Only compare, do not save this run")
+    args = parser.parse_args()
+    run(args.duration, args.noise, args.outlier_rate, args.light_system, args.results_dir, not args.no_save)
@@ -0,0 +1,193 @@
+import json
+import logging
+import math
+import os
+from collections import namedtuple
+
+import numpy as np
+
+import fixtures
+
+logger = logging.getLogger(__name__)
+
+
+MIN_POINTS = 3  # six pose unknowns, every point gives two angles
+ITERATIONS = 100
+TOLERANCE = 1e-9
+STEP = 1e-6  # finite difference step, metres and degrees
+DEFAULT_POSES_PATH = "./../fixture_poses.json"
+POSE_KEYS = ("position", "orientation", "pitch", "roll")
+
+
+class PoseFit(namedtuple("PoseFit", "position orientation pitch roll residuals rms iterations")):
+    # position in metres, orientation (yaw), pitch and roll in degrees with the same meaning as the light system
+    # keys, so a fit can be merged into one. residuals are the angle in degrees between where each calibration point
+    # says the beam pointed and where the tag was.
+    __slots__ = ()
+
+    def light_system(self, system):
+        return dict(system, position=tuple(self.position), orientation=self.orientation, pitch=self.pitch,
+                    roll=self.roll)
+
+
+def rotation_matrices(yaw, pitch, roll):
+    # fixtures.rotation_matrix for arrays of angles, (P,) each to (P, 3, 3).
+    yaw, pitch, roll = np.radians(yaw), np.radians(pitch), np.radians(roll)
+    cy, sy, cp, sp, cr, sr = np.cos(yaw), np.sin(yaw), np.cos(pitch), np.sin(pitch), np.cos(roll), np.sin(roll)
+    return np.stack((np.stack((cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr), axis=-1),
+                     np.stack((sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr), axis=-1),
+                     np.stack((-sp, cp * sr, cp * cr), axis=-1)), axis=-2)
+
+
+def beam_directions(fixture, pans, tilts):
+    # Unit beam vectors in the fixture's own frame for arrays of pan/tilt angles, see Fixture.direction.
+    pans = np.radians((np.asarray(pans, dtype=float) - fixture.pan_offset) / fixture.pan_scale)
+    tilts = np.radians((np.asarray(tilts, dtype=float) - fixture.tilt_offset) / fixture.tilt_scale)
+    return np.stack((np.cos(tilts) * np.cos(pans), np.cos(tilts) * np.sin(pans), np.sin(tilts)), axis=-1)
+
+
+def direction_errors(parameters, beams, tag_positions):
+    # parameters (P, 6) as x, y, z, yaw, pitch, total roll. Returns (P, N, 3), the predicted beam direction minus the
+    # unit vector from the fixture to each tag position.
+    rotations = rotation_matrices(parameters[:, 3], parameters[:, 4], parameters[:, 5])
+    predicted = np.einsum("pij,nj->pni", rotations, beams)
+    wanted = tag_positions[None, :, :] - parameters[:, None, :3]
+    return predicted - wanted / np.linalg.norm(wanted, axis=2, keepdims=True)
+
+
+def wrap_degrees(angle):
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def solve_pose(fixture, tag_positions, pans, tilts, iterations=ITERATIONS, mounting_roll=0.0):
+    # Levenberg-Marquardt fit of the fixture's position and rotation to calibration points: tag positions and the
+    # pan/tilt angles that put the beam on them. Starts from fixture's current pose. The jacobian comes from a single
+    # vectorized evaluation of the six perturbed poses. mounting_roll is taken back out of the reported roll.
+    tag_positions = np.asarray(tag_positions, dtype=float).reshape(-1, 3)
+    if len(tag_positions) < MIN_POINTS:
+        raise ValueError(f"Calibration needs at least {MIN_POINTS} points, got {len(tag_positions)}")
+    beams = beam_directions(fixture, pans, tilts)
+
+    rotation = fixture.rotation
+    pitch = math.degrees(math.asin(max(-1.0, min(1.0, -rotation[2, 0]))))
+    yaw = math.degrees(math.atan2(rotation[1, 0], rotation[0, 0]))
+    roll = math.degrees(math.atan2(rotation[2, 1], rotation[2, 2]))
+    parameters = np.array([*fixture.position, yaw, pitch, roll])
+
+    steps = np.vstack((np.zeros(6), np.eye(6) * STEP))
+    damping = 1e-3
+    errors = direction_errors(parameters[None], beams, tag_positions)[0].ravel()
+    cost = errors @ errors
+    iteration = 0
+    for iteration in range(1, iterations + 1):
+        evaluated = direction_errors(parameters + steps, beams, tag_positions).reshape(7, -1)
+        jacobian = ((evaluated[1:] - evaluated[0]) / STEP).T
+        normal = jacobian.T @ jacobian
+        gradient = jacobian.T @ evaluated[0]
+        while True:
+            step = np.linalg.solve(normal + damping * np.diag(np.diag(normal) + 1e-12), -gradient)
+            candidate = parameters + step
+            candidate_errors = direction_errors(candidate[None], beams, tag_positions)[0].ravel()
+            candidate_cost = candidate_errors @ candidate_errors
+            if candidate_cost < cost or damping > 1e12:
+                break
+            damping *= 10.0
+        if candidate_cost >= cost:
+            break
+        converged = cost - candidate_cost < TOLERANCE * max(cost, 1e-12)
+        parameters, errors, cost = candidate, candidate_errors, candidate_cost
+        damping = max(damping / 10.0, 1e-12)
+        if converged:
+            break
+
+    # Chord length between unit vectors to the angle between them.
+    chords = np.linalg.norm(errors.reshape(-1, 3), axis=1)
+    residuals = np.degrees(2.0 * np.arcsin(np.minimum(chords / 2.0, 1.0)))
+    return PoseFit(position=tuple(float(axis) for axis in parameters[:3]),
+                   orientation=float(wrap_degrees(parameters[3])),
+                   pitch=float(wrap_degrees(parameters[4])),
+                   roll=float(wrap_degrees(parameters[5] - mounting_roll)),
+                   residuals=tuple(float(residual) for residual in residuals),
+                   rms=float(np.sqrt(np.mean(residuals ** 2))),
+                   iterations=iteration)
+
+
+def load_poses(light_systems, path=DEFAULT_POSES_PATH):
+    # Merges saved calibrations into the light system dicts, a missing or broken file changes nothing.
+    try:
+        with open(path, "r") as infile:
+            poses = json.load(infile)
+    except (OSError, ValueError):
+        return []
+    loaded = []
+    for name, pose in poses.items():
+        if name in light_systems:
+            light_systems[name] = dict(light_systems[name], **{key: pose[key] for key in POSE_KEYS if key in pose})
+            loaded.append(name)
+    return loaded
+
+
+def save_pose(name, fit, path=DEFAULT_POSES_PATH):
+    try:
+        with open(path, "r") as infile:
+            poses = json.load(infile)
+    except (OSError, ValueError):
+        poses = {}
+    poses[name] = {"position": list(fit.position), "orientation": fit.orientation, "pitch": fit.pitch,
+                   "roll": fit.roll, "rms": fit.rms}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as outfile:
+        json.dump(poses, outfile, indent=2)
+    os.replace(tmp_path, path)
+
+
+class CalibrationSession:
+    # Collects (tag position, DMX pan/tilt) points per light system while the show runs, fits the pose and hands the
+    # recompiled fixture to the tracker, which aims with it from the next sample or frame. Used from the GUI thread.
+    def __init__(self, tag_tracker, light_systems, compile_options=None, poses_path=DEFAULT_POSES_PATH):
+        self.tag_tracker = tag_tracker
+        self.light_systems = light_systems
+        self.compile_options = compile_options or {}
+        self.poses_path = poses_path
+        self.points = {name: [] for name in tag_tracker.fixture_array.names}
+
+    @property
+    def names(self):
+        return list(self.points)
+
+    def fixture(self, name):
+        return self.tag_tracker.fixture_array.fixtures[self.tag_tracker.fixture_array.index[name]]
+
+    def add_point(self, name, tag_position, pan_value, tilt_value):
+        # pan_value and tilt_value are the 16 bit DMX values that put the beam on the tag.
+        if name not in self.points:
+            raise ValueError(f"Unknown light system '{name}'. Please select from {self.names}")
+        for value in (pan_value, tilt_value):
+            if not 0 <= value <= fixtures.DMX_16BIT_MAX:
+                raise ValueError(f"Invalid DMX value {value}, it must be between 0 and {fixtures.DMX_16BIT_MAX}")
+        self.points[name].append((tuple(float(axis) for axis in tag_position), int(pan_value), int(tilt_value)))
+        return len(self.points[name])
+
+    def remove_last(self, name):
+        if self.points[name]:
+            self.points[name].pop()
+
+    def clear(self, name):
+        self.points[name] = []
+
+    def solve(self, name):
+        fixture = self.fixture(name)
+        positions, pan_values, tilt_values = zip(*self.points[name]) if self.points[name] else ((), (), ())
+        pans, tilts = fixture.angles(np.asarray(pan_values, dtype=float), np.asarray(tilt_values, dtype=float))
+        mounting_roll = fixtures.MOUNTINGS[self.light_systems[name].get("mounting", "floor")]
+        return solve_pose(fixture, positions, pans, tilts, mounting_roll=mounting_roll)
+
+    def apply(self, name, fit):
+        # Updates the light system, swaps the recompiled fixture into the running tracker and saves the pose.
+        system = self.light_systems[name] = fit.light_system(self.light_systems[name])
+        self.tag_tracker.replace_fixture(fixtures.Fixture.compile(name, system, **self.compile_options))
+        if self.poses_path:
+            save_pose(name, fit, self.poses_path)
+        logger.info("calibrated %s: position %s, orientation %.1f, pitch %.1f, roll %.1f, rms %.2f deg over %d points",
+                    name, fit.position, fit.orientation, fit.pitch, fit.roll, fit.rms, len(fit.residuals))
+        return system
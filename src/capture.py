@@ -0,0 +1,237 @@
+import os
+import struct
+import threading
+import time
+import logging
+
+import numpy as np
+
+import lec_parser
+import serial_reader
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b"SEGCAP"
+VERSION = 1
+MAX_ANCHORS = 8
+HEADER = struct.Struct("<6sHII")  # magic, version, record size, reserved
+HEADER_SIZE = 16
+
+# One fixed size record per parsed sample, quality -1 means the line had none.
+RECORD = np.dtype([("timestamp", "<f8"),
+                   ("tag_id", "S8"),
+                   ("position", "<f8", (3,)),
+                   ("quality", "<i2"),
+                   ("anchor_count", "u1"),
+                   ("reserved", "u1"),
+                   ("anchor_ids", "S4", (MAX_ANCHORS,)),
+                   ("anchor_positions", "<f4", (MAX_ANCHORS, 3)),
+                   ("distances", "<f4", (MAX_ANCHORS,))])
+
+FLUSH_INTERVAL = 1.0
+
+
+class CaptureFormatError(Exception):
+    pass
+
+
+def header():
+    return HEADER.pack(MAGIC, VERSION, RECORD.itemsize, 0).ljust(HEADER_SIZE, b"\0")
+
+
+def check_header(data):
+    if len(data) < HEADER_SIZE:
+        raise CaptureFormatError("capture file is too short to hold a header")
+    magic, version, record_size, _ = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.itemsize:
+        raise CaptureFormatError(f"not a version {VERSION} capture file (magic {magic!r}, version {version}, "
+                                 f"record size {record_size})")
+
+
+class CaptureWriter:
+    # Append only, a crashed show still leaves every record written before the crash readable. The UWB sources write
+    # from their reader thread, a write after close() is dropped.
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._lock = threading.Lock()
+        self._record = np.zeros(1, dtype=RECORD)
+        self._next_flush = 0.0
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, "rb") as infile:
+                check_header(infile.read(HEADER_SIZE))
+        self.file = open(path, "ab")
+        if not exists:
+            self.file.write(header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, timestamp, sample):
+        with self._lock:
+            if not self.file.closed:
+                self._write(timestamp, sample)
+
+    def _write(self, timestamp, sample):
+        record = self._record[0]
+        record["timestamp"] = timestamp
+        record["tag_id"] = (sample.tag_id or "").encode("ascii", "replace")[:8]
+        record["position"] = sample.position
+        record["quality"] = -1 if sample.quality is None else sample.quality
+
+        count = min(len(sample.distances), MAX_ANCHORS)
+        record["anchor_count"] = count
+        record["anchor_ids"] = [anchor_id.encode("ascii", "replace")[:4] for anchor_id in sample.anchor_ids[:count]] + \
+            [b""] * (MAX_ANCHORS - count)
+        record["anchor_positions"][:count] = sample.anchor_positions[:count] if sample.anchor_positions else 0.0
+        record["anchor_positions"][count:] = 0.0
+        record["distances"][:count] = sample.distances[:count]
+        record["distances"][count:] = 0.0
+
+        self.file.write(self._record.data)
+        self.records += 1
+        if timestamp >= self._next_flush:
+            self.file.flush()
+            self._next_flush = timestamp + FLUSH_INTERVAL
+
+    def close(self):
+        with self._lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+def load_capture(path):
+    # Memory maps the records, nothing is read until it is touched.
+    with open(path, "rb") as infile:
+        check_header(infile.read(HEADER_SIZE))
+    size = os.path.getsize(path) - HEADER_SIZE
+    count = size // RECORD.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def record_to_sample(record):
+    count = int(record["anchor_count"])
+    quality = int(record["quality"])
+    x, y, z = (float(axis) for axis in record["position"])
+    anchor_positions = tuple(tuple(float(axis) for axis in position) for position in record["anchor_positions"][:count])
+    return lec_parser.TagSample(record["tag_id"].decode("ascii", "replace") or None, x, y, z,
+                                None if quality < 0 else quality,
+                                tuple(anchor_id.decode("ascii", "replace") for anchor_id in record["anchor_ids"][:count]),
+                                anchor_positions if any(any(position) for position in anchor_positions) else (),
+                                tuple(float(distance) for distance in record["distances"][:count]))
+
+
+class ReplaySource:
+    # Feeds a capture back through the tracker with the same start/stop/take/stats contract as the live sources.
+    # speed 1 is real time, 2 twice as fast and 0 as fast as the tracker takes samples, in which case nothing is
+    # coalesced. Sample timestamps keep their recorded spacing, shifted so the replay starts at clock().
+    def __init__(self, path, speed=1.0, loop=False):
+        if speed < 0:
+            raise ValueError(f"Invalid replay speed {speed}, it must be >= 0")
+        self.path = path
+        self.records = load_capture(path)
+        self.speed = speed
+        self.loop = loop
+        self.samples = serial_reader.LatestSamples()
+        self.replayed = 0
+        self.finished = threading.Event()
+        self._offset = 0.0
+        self._started = None
+        self._virtual_now = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def anchor_positions(self):
+        for record in self.records[:100]:
+            sample = record_to_sample(record)
+            if sample.anchor_positions:
+                return list(sample.anchor_positions)
+        return []
+
+    def clock(self):
+        # Replay time on the same timeline as the sample timestamps.
+        if not self.speed and self._virtual_now is not None:
+            return self._virtual_now
+        now = time.monotonic()
+        if self._started is None:
+            return now
+        return self._started + (now - self._started) * self.speed
+
+    def take(self, timeout=None):
+        return self.samples.take(timeout)
+
+    def stats(self):
+        return {"replayed": self.replayed, "records": len(self.records), "coalesced": self.samples.coalesced}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self.finished.clear()
+        self.samples.closed = False
+        self._thread = threading.Thread(target=self._run, name="uwb-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        if len(self.records) == 0:
+            self.finished.set()
+            self.samples.close()
+            return
+
+        while not self._stop_event.is_set():
+            first = float(self.records[0]["timestamp"])
+            started = time.monotonic()
+            self._offset = started - first
+            self._started = started
+
+            for record in self.records:
+                if self._stop_event.is_set():
+                    return
+                recorded = float(record["timestamp"])
+                if self.speed:
+                    due = started + (recorded - first) / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0 and self._stop_event.wait(delay):
+                        return
+                else:
+                    self._virtual_now = recorded + self._offset
+                    # Lossless: hand over one sample at a time and wait for the tracker to take it.
+                    while not self.samples.wait_taken(0.1):
+                        if self._stop_event.is_set():
+                            return
+
+                sample = record_to_sample(record)
+                self.samples.put(sample.tag_id, (recorded + self._offset, sample))
+                self.replayed += 1
+
+            if not self.loop:
+                break
+
+        self.finished.set()
+        # Wakes the tracker out of take() so the run ends now rather than after its timeout.
+        self.samples.close()
+        logger.info("replay of %s finished, %d samples", self.path, self.replayed)
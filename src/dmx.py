@@ -1,15 +1,10 @@
+import abc
 import serial
 from typing import Union
 import logging
-import datetime
+import time
 
-TERMINAL_LOGGING = False
-
-
-def log(line):
-    if TERMINAL_LOGGING:
-        print(datetime.datetime.now().strftime("%H:%M:%S"), line)
-    logging.info(line)
+logger = logging.getLogger(__name__)
 
 
 DMX_OPEN = bytes([126])
@@ -18,11 +13,60 @@ DMX_INTENSITY = bytes([6, 1, 2])
 DMX_INIT1 = bytes([3, 2, 0, 0, 0])
 DMX_INIT2 = bytes([10, 2, 0, 0, 0])
 
+UNIVERSE_SIZE = 513  # start code plus 512 channels
+DMX_DATA_START = len(DMX_OPEN + DMX_INTENSITY)
+DMX_BLACKOUT = bytes(UNIVERSE_SIZE - 1)
+DMX_KEEPALIVE_INTERVAL = 1.0  # seconds between frames re-sent even when nothing changed
+
+
+# What DmxRefreshScheduler and send_dmx drive. Channel 0 is the start code and 1 to 512 the slots of the first
+# universe, backends with more universes take the universe as a keyword on the setters.
+class DmxInterface(abc.ABC):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @abc.abstractmethod
+    def set_channel(self, chan: int, intensity: Union[int, bytes]):
+        pass
+
+    @abc.abstractmethod
+    def set_channels(self, start: int, values):
+        pass
+
+    @abc.abstractmethod
+    def blackout(self):
+        pass
+
+    # Sends the frame, returns whether anything went out.
+    @abc.abstractmethod
+    def update_lighting(self, force: bool = False):
+        pass
 
-class DmxPy:
-    def __init__(self, serial_port: str):
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class DmxPy(DmxInterface):
+    def __init__(self, serial_port: str, keepalive_interval: float = DMX_KEEPALIVE_INTERVAL):
         self.serial = None
-        self.dmxData = [bytes([0])] * 513  # 128 plus "spacer".
+        self.keepalive_interval = keepalive_interval
+        # Whole Enttec frame (open, label, length, universe, close) lives in one buffer so a frame is a single write.
+        self.frame = bytearray(DMX_OPEN + DMX_INTENSITY + bytes(UNIVERSE_SIZE) + DMX_CLOSE)
+        self.dmxData = memoryview(self.frame)[DMX_DATA_START:DMX_DATA_START + UNIVERSE_SIZE]
+
+        # Channels [dirty_start, dirty_end) changed since the last transmitted frame, dirty_start is None when clean.
+        self.dirty_start = None
+        self.dirty_end = 0
+        self.last_sent = None
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+        self.bytes_written = 0
 
         try:
             self.serial = serial.Serial(serial_port, baudrate=57600)
@@ -32,28 +76,65 @@ class DmxPy:
             print(f"Error: could not open Serial Port, exception: {ex}")
             raise ex
 
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
+    def close(self):
         if self.serial:
             self.serial.close()
 
     def set_channel(self, chan: int, intensity: Union[int, bytes]):
         chan = max(0, min(chan, 512))
+        if isinstance(intensity, bytes):
+            intensity = intensity[0]
         intensity = max(0, min(intensity, 255))
 
-        if isinstance(intensity, int):
-            intensity = bytes([intensity])
+        logger.debug("setting channel %s to value %s", chan, intensity)
+        if self.dmxData[chan] != intensity:
+            self.dmxData[chan] = intensity
+            self.mark_dirty(chan, chan + 1)
+
+    def set_channels(self, start: int, values):
+        start = max(0, min(start, 512))
+        end = min(start + len(values), UNIVERSE_SIZE)
+        if not isinstance(values, (bytes, bytearray, memoryview)):
+            values = bytes(max(0, min(value, 255)) for value in values[:end - start])
 
-        log(f"setting channel {chan} to value {intensity}")
-        self.dmxData[chan] = intensity
+        values = values[:end - start]
+        if self.dmxData[start:end] != values:
+            self.dmxData[start:end] = values
+            self.mark_dirty(start, end)
 
     def blackout(self):
-        for i in range(1, 512, 1):
-            self.dmxData[i] = bytes([0])
+        if self.dmxData[1:] != DMX_BLACKOUT:
+            self.dmxData[1:] = DMX_BLACKOUT
+            self.mark_dirty(1, UNIVERSE_SIZE)
+
+    def mark_dirty(self, start: int, end: int):
+        if self.dirty_start is None:
+            self.dirty_start, self.dirty_end = start, end
+        else:
+            self.dirty_start = min(self.dirty_start, start)
+            self.dirty_end = max(self.dirty_end, end)
+
+    @property
+    def dirty(self):
+        return self.dirty_start is not None
+
+    def update_lighting(self, force: bool = False):
+        now = time.monotonic()
+        if not force and not self.dirty and self.last_sent is not None \
+                and now - self.last_sent < self.keepalive_interval:
+            self.frames_suppressed += 1
+            return False
+
+        self.serial.write(self.frame)
+        logger.debug("writing dmx frame")
+        self.frames_sent += 1
+        self.bytes_written += len(self.frame)
+        self.last_sent = now
+        self.dirty_start = None
+        self.dirty_end = 0
+        return True
 
-    def update_lighting(self):
-        sdata = b''.join(self.dmxData)
-        self.serial.write(DMX_OPEN + DMX_INTENSITY + sdata + DMX_CLOSE)
-        log(f"writing to channels {sdata}")
\ No newline at end of file
+    def stats(self):
+        return {"frames_sent": self.frames_sent,
+                "frames_suppressed": self.frames_suppressed,
+                "bytes_written": self.bytes_written}
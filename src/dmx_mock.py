@@ -1,24 +1,26 @@
 import logging
-import datetime
 
-TERMINAL_LOGGING = False
+import dmx
 
+logger = logging.getLogger(__name__)
 
-def log(line):
-    if TERMINAL_LOGGING:
-        print(datetime.datetime.now().strftime("%H:%M:%S"), line)
-    logging.info(line)
 
-
-class MockDMXInterface:
+class MockDMXInterface(dmx.DmxInterface):
     def __init__(self):
-        log("Mock DMX interface initialized")
+        logger.info("Mock DMX interface initialized")
 
     def set_channel(self, channel, value):
-        log(f"Sending value {value} to channel {channel}")
+        logger.debug("Sending value %s to channel %s", value, channel)
+
+    def set_channels(self, start, values):
+        logger.debug("Sending %d values starting at channel %d", len(values), start)
 
     def blackout(self):
         print("blackout")
 
     def render(self):
         print("render")
+
+    def update_lighting(self, force=False):
+        logger.debug("Mock DMX frame sent")
+        return True
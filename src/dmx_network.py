@@ -0,0 +1,272 @@
+import abc
+import logging
+import socket
+import struct
+import time
+import uuid
+from typing import Union
+
+import dmx
+
+logger = logging.getLogger(__name__)
+
+
+DMX_CHANNELS = 512
+
+ARTNET_PORT = 6454
+ARTNET_BROADCAST = "255.255.255.255"
+ARTNET_HEADER = b"Art-Net\x00"
+ARTNET_OP_DMX = 0x5000
+ARTNET_OP_SYNC = 0x5200
+ARTNET_VERSION = 14
+ARTNET_MAX_UNIVERSE = 0x7FFF  # 15 bit port address, net, sub-net and universe
+
+SACN_PORT = 5568
+SACN_IDENTIFIER = b"ASC-E1.17\x00\x00\x00"
+SACN_SOURCE_NAME = b"seguidor"
+SACN_PRIORITY = 100
+SACN_MAX_UNIVERSE = 63999
+SACN_DATA_LENGTH = 638
+SACN_SYNC_LENGTH = 49
+VECTOR_ROOT_E131_DATA = 0x00000004
+VECTOR_ROOT_E131_EXTENDED = 0x00000008
+VECTOR_E131_DATA_PACKET = 0x00000002
+VECTOR_E131_EXTENDED_SYNCHRONIZATION = 0x00000001
+VECTOR_DMP_SET_PROPERTY = 0x02
+
+
+def artnet_dmx_packet(universe):
+    return bytearray(ARTNET_HEADER + struct.pack("<H", ARTNET_OP_DMX) + struct.pack(">HBB", ARTNET_VERSION, 0, 0) +
+                     struct.pack("<H", universe) + struct.pack(">H", DMX_CHANNELS) + bytes(DMX_CHANNELS))
+
+
+def artnet_sync_packet():
+    return bytearray(ARTNET_HEADER + struct.pack("<H", ARTNET_OP_SYNC) + struct.pack(">HBB", ARTNET_VERSION, 0, 0))
+
+
+def sacn_root_layer(packet, length, vector, cid):
+    struct.pack_into(">HH12sHI16s", packet, 0, 0x0010, 0x0000, SACN_IDENTIFIER, 0x7000 | (length - 16), vector, cid)
+
+
+def sacn_data_packet(universe, cid, source_name=SACN_SOURCE_NAME, priority=SACN_PRIORITY, sync_address=0):
+    packet = bytearray(SACN_DATA_LENGTH)
+    sacn_root_layer(packet, SACN_DATA_LENGTH, VECTOR_ROOT_E131_DATA, cid)
+    struct.pack_into(">HI64sBHBBH", packet, 38, 0x7000 | (SACN_DATA_LENGTH - 38), VECTOR_E131_DATA_PACKET,
+                     source_name, priority, sync_address, 0, 0, universe)
+    # Set property of DMX512 slots: start code plus 512 channels from address 0, one apart.
+    struct.pack_into(">HBBHHHB", packet, 115, 0x7000 | (SACN_DATA_LENGTH - 115), VECTOR_DMP_SET_PROPERTY, 0xA1,
+                     0x0000, 0x0001, DMX_CHANNELS + 1, 0)
+    return packet
+
+
+def sacn_sync_packet(cid, sync_address):
+    packet = bytearray(SACN_SYNC_LENGTH)
+    sacn_root_layer(packet, SACN_SYNC_LENGTH, VECTOR_ROOT_E131_EXTENDED, cid)
+    struct.pack_into(">HIBHH", packet, 38, 0x7000 | (SACN_SYNC_LENGTH - 38), VECTOR_E131_EXTENDED_SYNCHRONIZATION, 0,
+                     sync_address, 0)
+    return packet
+
+
+def sacn_multicast_address(universe):
+    return f"239.255.{universe >> 8}.{universe & 0xFF}"
+
+
+# Common part of the UDP backends. Every universe owns one preallocated packet and the setters write the channels
+# straight into it, so a frame is one sendto per universe that changed (every universe on keepalive) without building
+# anything. With sync on a sync packet follows, receivers hold the data packets until it arrives and so switch all
+# universes of a frame at once.
+class NetworkDmxInterface(dmx.DmxInterface):
+    DATA_OFFSET = None
+    SEQUENCE_OFFSET = None
+    MIN_UNIVERSE = 0
+    MAX_UNIVERSE = None
+
+    def __init__(self, universes, port, sync=None, keepalive_interval=dmx.DMX_KEEPALIVE_INTERVAL):
+        universes = tuple(universes)
+        if not universes:
+            raise ValueError("At least one universe is needed")
+        for universe in universes:
+            if not self.MIN_UNIVERSE <= universe <= self.MAX_UNIVERSE:
+                raise ValueError(f"Invalid universe {universe}, it must be between {self.MIN_UNIVERSE} and "
+                                 f"{self.MAX_UNIVERSE}")
+        if len(set(universes)) != len(universes):
+            raise ValueError(f"Duplicate universe in {universes}")
+
+        self.universes = universes
+        self.index = {universe: i for i, universe in enumerate(universes)}
+        self.port = port
+        # Syncing a single universe only adds a packet, by default it is on when there is more than one.
+        self.sync = len(universes) > 1 if sync is None else sync
+        self.keepalive_interval = keepalive_interval
+
+        self.packets = [self.data_packet(universe) for universe in universes]
+        self.data = [memoryview(packet)[self.DATA_OFFSET:self.DATA_OFFSET + DMX_CHANNELS] for packet in self.packets]
+        self.destinations = [(self.address(universe), port) for universe in universes]
+        self.sequences = [0] * len(universes)
+        self.dirty = [False] * len(universes)
+        self.sync_packet = self.build_sync_packet()
+
+        self.last_sent = None
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+        self.packets_sent = 0
+        self.bytes_written = 0
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    @abc.abstractmethod
+    def data_packet(self, universe):
+        pass
+
+    @abc.abstractmethod
+    def build_sync_packet(self):
+        pass
+
+    @abc.abstractmethod
+    def address(self, universe):
+        pass
+
+    def next_sequence(self, sequence):
+        return (sequence + 1) & 0xFF
+
+    def universe_data(self, universe=None):
+        return self.data[0 if universe is None else self.index[universe]]
+
+    def set_channel(self, chan: int, intensity: Union[int, bytes], universe=None):
+        # Channel 0 is the start code, which is always 0 for dimmer data and so not settable here.
+        chan = min(chan, DMX_CHANNELS)
+        if chan < 1:
+            return
+        if isinstance(intensity, bytes):
+            intensity = intensity[0]
+        intensity = max(0, min(intensity, 255))
+
+        i = 0 if universe is None else self.index[universe]
+        if self.data[i][chan - 1] != intensity:
+            self.data[i][chan - 1] = intensity
+            self.dirty[i] = True
+
+    def set_channels(self, start: int, values, universe=None):
+        start = min(start, DMX_CHANNELS)
+        if start < 1:
+            values = values[1 - start:]
+            start = 1
+        end = min(start + len(values), DMX_CHANNELS + 1)
+        if not isinstance(values, (bytes, bytearray, memoryview)):
+            values = bytes(max(0, min(value, 255)) for value in values[:end - start])
+
+        values = values[:end - start]
+        i = 0 if universe is None else self.index[universe]
+        if self.data[i][start - 1:end - 1] != values:
+            self.data[i][start - 1:end - 1] = values
+            self.dirty[i] = True
+
+    def blackout(self):
+        blackout = bytes(DMX_CHANNELS)
+        for i, data in enumerate(self.data):
+            if data != blackout:
+                data[:] = blackout
+                self.dirty[i] = True
+
+    def update_lighting(self, force: bool = False):
+        now = time.monotonic()
+        keepalive = self.last_sent is None or now - self.last_sent >= self.keepalive_interval
+        if not force and not keepalive and not any(self.dirty):
+            self.frames_suppressed += 1
+            return False
+
+        for i, packet in enumerate(self.packets):
+            if force or keepalive or self.dirty[i]:
+                self.sequences[i] = self.next_sequence(self.sequences[i])
+                packet[self.SEQUENCE_OFFSET] = self.sequences[i]
+                self.send(packet, self.destinations[i])
+                self.dirty[i] = False
+        if self.sync:
+            self.send_sync()
+
+        logger.debug("sent dmx frame to universes %s", self.universes)
+        self.frames_sent += 1
+        self.last_sent = now
+        return True
+
+    def send(self, packet, destination):
+        self.socket.sendto(packet, destination)
+        self.packets_sent += 1
+        self.bytes_written += len(packet)
+
+    def send_sync(self):
+        self.send(self.sync_packet, self.destinations[0])
+
+    def stats(self):
+        return {"frames_sent": self.frames_sent,
+                "frames_suppressed": self.frames_suppressed,
+                "packets_sent": self.packets_sent,
+                "bytes_written": self.bytes_written}
+
+    def close(self):
+        self.socket.close()
+
+
+# Art-Net 4 ArtDmx to a node, or broadcast when no host is given. universes are 15 bit port addresses. The sequence
+# runs 1 to 255, 0 would tell the node not to reorder.
+class ArtNetInterface(NetworkDmxInterface):
+    DATA_OFFSET = 18
+    SEQUENCE_OFFSET = 12
+    MAX_UNIVERSE = ARTNET_MAX_UNIVERSE
+
+    def __init__(self, host=ARTNET_BROADCAST, universes=(0,), port=ARTNET_PORT, sync=None,
+                 keepalive_interval=dmx.DMX_KEEPALIVE_INTERVAL):
+        self.host = host or ARTNET_BROADCAST
+        super().__init__(universes, port, sync, keepalive_interval)
+
+    def data_packet(self, universe):
+        return artnet_dmx_packet(universe)
+
+    def build_sync_packet(self):
+        return artnet_sync_packet()
+
+    def address(self, universe):
+        return self.host
+
+    def next_sequence(self, sequence):
+        return sequence % 255 + 1
+
+
+# sACN (E1.31) data packets, multicast to each universe's group unless a host is given. With sync on every data
+# packet names sync_universe, which defaults to the first universe, and the E1.31-2016 sync packet goes to it.
+class SacnInterface(NetworkDmxInterface):
+    DATA_OFFSET = 126
+    SEQUENCE_OFFSET = 111
+    SYNC_SEQUENCE_OFFSET = 44
+    MIN_UNIVERSE = 1
+    MAX_UNIVERSE = SACN_MAX_UNIVERSE
+
+    def __init__(self, host=None, universes=(1,), port=SACN_PORT, sync=None, sync_universe=None, cid=None,
+                 source_name=SACN_SOURCE_NAME, priority=SACN_PRIORITY, keepalive_interval=dmx.DMX_KEEPALIVE_INTERVAL):
+        if not 0 <= priority <= 200:
+            raise ValueError(f"Invalid sACN priority {priority}, it must be between 0 and 200")
+        self.host = host
+        self.cid = cid or uuid.uuid4().bytes
+        self.source_name = source_name
+        self.priority = priority
+        universes = tuple(universes)
+        self.sync_universe = sync_universe or (universes[0] if universes else 0)
+        self.sync_sequence = 0
+        super().__init__(universes, port, sync, keepalive_interval)
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+
+    def data_packet(self, universe):
+        return sacn_data_packet(universe, self.cid, self.source_name, self.priority,
+                                self.sync_universe if self.sync else 0)
+
+    def build_sync_packet(self):
+        return sacn_sync_packet(self.cid, self.sync_universe)
+
+    def address(self, universe):
+        return self.host or sacn_multicast_address(universe)
+
+    def send_sync(self):
+        self.sync_sequence = self.next_sequence(self.sync_sequence)
+        self.sync_packet[self.SYNC_SEQUENCE_OFFSET] = self.sync_sequence
+        self.send(self.sync_packet, (self.address(self.sync_universe), self.port))
@@ -0,0 +1,157 @@
+import threading
+import time
+import logging
+import statistics
+from collections import deque
+
+from metrics import DISABLED
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_RATE_HZ = 40
+UNIVERSE_SIZE = 513  # start code plus 512 channels, same layout as DmxPy.dmxData
+OUTPUT_DELAY_SMOOTHING = 0.1
+
+
+class DmxRefreshScheduler:
+    def __init__(self, dmx_interface, rate_hz=DEFAULT_RATE_HZ, stats_window=256, report_interval=5.0,
+                 frame_callback=None, metrics=None, clock=time.monotonic):
+        if rate_hz <= 0:
+            raise ValueError(f"Invalid DMX refresh rate {rate_hz}, it must be greater than 0")
+
+        self.dmx_interface = dmx_interface
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.report_interval = report_interval
+        # Called with the frame time on the sender thread right before each frame, so the caller can render the
+        # universe at output rate instead of input rate.
+        self.frame_callback = frame_callback
+        self.metrics = metrics or DISABLED
+        # Frame times handed to the callback and compared with published timestamps come from the sample source's
+        # clock, which for a replay runs at the replay speed. Frames are still paced in real time.
+        self.clock = clock
+
+        # The tracker writes into the back buffer and publishes an immutable copy, the sender thread only ever
+        # reads the published front buffer, so neither side has to take a lock.
+        self.back_buffer = bytearray(UNIVERSE_SIZE)
+        # (frame, timestamp) swapped as one reference, so a frame is never paired with another frame's timestamp.
+        self.front = (bytes(UNIVERSE_SIZE), None)
+        self._sent_frame = self.front[0]
+        # Smoothed time from the sample behind a published frame to that frame going out.
+        self.output_delay = 0.0
+
+        self.frame_count = 0
+        self.late_frames = 0
+        self.send_errors = 0
+        self._intervals = deque(maxlen=stats_window)
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def set_channel(self, chan: int, intensity: int):
+        chan = max(0, min(chan, UNIVERSE_SIZE - 1))
+        self.back_buffer[chan] = max(0, min(int(intensity), 255))
+
+    def publish(self, timestamp=None):
+        self.front = (bytes(self.back_buffer), timestamp)
+
+    @property
+    def front_buffer(self):
+        return self.front[0]
+
+    @property
+    def front_timestamp(self):
+        return self.front[1]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="dmx-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def send_frame(self, now=None):
+        timed = self.metrics.enabled
+        if timed:
+            started = time.perf_counter()
+        frame, timestamp = self.front
+        if frame is not self._sent_frame:
+            if frame != self._sent_frame:
+                self.dmx_interface.set_channels(1, memoryview(frame)[1:])
+            if now is not None and timestamp is not None:
+                delay = max(now - timestamp, 0.0)
+                self.output_delay += OUTPUT_DELAY_SMOOTHING * (delay - self.output_delay)
+                if timed:
+                    self.metrics.observe("dmx_output", delay)
+        self._sent_frame = frame
+        self.dmx_interface.update_lighting()
+        if timed:
+            self.metrics.observe("dmx_write", time.perf_counter() - started)
+
+    def stats(self):
+        intervals = list(self._intervals)
+        if len(intervals) < 2:
+            return {"frames": self.frame_count, "late_frames": self.late_frames, "send_errors": self.send_errors,
+                    "fps": 0.0, "jitter_ms": 0.0, "max_interval_ms": 0.0}
+
+        mean_interval = statistics.fmean(intervals)
+        return {"frames": self.frame_count,
+                "late_frames": self.late_frames,
+                "send_errors": self.send_errors,
+                "fps": 1.0 / mean_interval if mean_interval > 0 else 0.0,
+                "jitter_ms": statistics.pstdev(intervals) * 1000,
+                "max_interval_ms": max(intervals) * 1000}
+
+    def _run(self):
+        next_deadline = time.monotonic()
+        next_report = next_deadline + self.report_interval
+        last_frame = None
+
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now < next_deadline:
+                self._stop_event.wait(next_deadline - now)
+                continue
+
+            try:
+                frame_time = self.clock()
+                if self.frame_callback is not None:
+                    self.frame_callback(frame_time)
+                self.send_frame(frame_time)
+            except Exception as ex:
+                self.send_errors += 1
+                logger.warning("dmx refresh exception %s", ex)
+
+            if last_frame is not None:
+                self._intervals.append(now - last_frame)
+            last_frame = now
+            self.frame_count += 1
+
+            next_deadline += self.period
+            if now - next_deadline > self.period:
+                # Fell behind by more than a whole frame, skip ahead instead of bursting frames to catch up.
+                self.late_frames += 1
+                next_deadline = now + self.period
+
+            if self.report_interval and now >= next_report:
+                stats = self.stats()
+                logger.info("dmx refresh %.1f fps, jitter %.2f ms, late frames %d", stats["fps"], stats["jitter_ms"],
+                            stats["late_frames"])
+                output_stats = self.dmx_interface.stats()
+                if output_stats:
+                    logger.info("dmx output %s", output_stats)
+                next_report = now + self.report_interval
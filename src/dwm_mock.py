@@ -0,0 +1,157 @@
+import math
+import threading
+import time
+
+import dwm_shell
+import dwm_tlv
+
+DEFAULT_ANCHORS = ((0x1151, (0.0, 0.0, 2.5)), (0x0CA8, (8.0, 0.0, 2.5)), (0x111C, (8.0, 6.0, 2.5)),
+                   (0x1C2D, (0.0, 6.0, 2.5)))
+
+
+def walking_in_circles(timestamp, center=(4.0, 3.0, 1.2), radius=2.0, speed=1.4):
+    angle = timestamp * speed / radius
+    return center[0] + radius * math.cos(angle), center[1] + radius * math.sin(angle), center[2]
+
+
+class MockDWM1001Serial:
+    # Stands in for the serial port of a DWM1001 tag speaking the UART TLV API. Answers dwm_loc_get with the
+    # position returned by trajectory(time) and ranges to the configured anchors.
+    def __init__(self, node_id=0xDECA0000000014A2, trajectory=walking_in_circles, anchors=DEFAULT_ANCHORS,
+                 quality=90, clock=time.monotonic):
+        self.node_id = node_id
+        self.trajectory = trajectory
+        self.anchors = anchors
+        self.quality = quality
+        self.clock = clock
+        self.start_time = clock()
+        self.requests = []
+        self._response = bytearray()
+        self._lock = threading.Lock()
+
+    @property
+    def in_waiting(self):
+        return len(self._response)
+
+    def write(self, data):
+        data = bytes(data)
+        self.requests.append(data)
+        with self._lock:
+            self._response += self.respond(data)
+        return len(data)
+
+    def read(self, size=1):
+        with self._lock:
+            data = bytes(self._response[:size])
+            del self._response[:size]
+        return data
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._response.clear()
+
+    def close(self):
+        pass
+
+    def respond(self, request):
+        if request == dwm_tlv.DWM_LOC_GET:
+            return self.ok() + self.loc_get_payload(self.trajectory(self.clock() - self.start_time))
+        if request == dwm_tlv.DWM_NODE_ID_GET:
+            return self.ok() + bytes([dwm_tlv.TLV_NODE_ID, dwm_tlv.NODE_ID.size]) + dwm_tlv.NODE_ID.pack(self.node_id)
+        return bytes([dwm_tlv.TLV_RET_VAL, 1, 1])
+
+    @staticmethod
+    def ok():
+        return bytes([dwm_tlv.TLV_RET_VAL, 1, 0])
+
+    def loc_get_payload(self, position):
+        payload = bytes([dwm_tlv.TLV_POS_XYZ, dwm_tlv.POSITION.size]) + self.pack_position(position, self.quality)
+
+        entry = dwm_tlv.TAG_RANGE.size + dwm_tlv.POSITION.size
+        ranges = bytearray([dwm_tlv.TLV_RNG_AN_POS_DIST, 1 + len(self.anchors) * entry, len(self.anchors)])
+        for address, anchor in self.anchors:
+            distance = math.dist(position, anchor)
+            ranges += dwm_tlv.TAG_RANGE.pack(address, round(distance * 1000), self.quality)
+            ranges += self.pack_position(anchor, 100)
+        return payload + bytes(ranges)
+
+    @staticmethod
+    def pack_position(position, quality):
+        x, y, z = (round(axis * 1000) for axis in position)
+        return dwm_tlv.POSITION.pack(x, y, z, quality)
+
+
+class MockDWM1001ShellSerial:
+    # Stands in for the serial port of a DWM1001 tag in shell mode. state is "api" for a freshly powered node,
+    # "shell" at the prompt or "streaming" after lec. Streams one DIST line per read while streaming.
+    def __init__(self, state="api", panid=0x3A9E, node_id=0xDECA0000000014A2, anchors=DEFAULT_ANCHORS,
+                 position=(4.0, 3.0, 1.2)):
+        self.state = state
+        self.panid = panid
+        self.node_id = node_id
+        self.anchors = anchors
+        self.position = position
+        self.requests = []
+        self.returns = 0
+        self._response = bytearray()
+
+    @property
+    def in_waiting(self):
+        return len(self._response)
+
+    def write(self, data):
+        data = bytes(data)
+        self.requests.append(data)
+        self._response += self.respond(data)
+        return len(data)
+
+    def read(self, size=1):
+        if self.state == "streaming" and not self._response:
+            self._response += self.lec_line()
+        data = bytes(self._response[:size])
+        del self._response[:size]
+        return data
+
+    def reset_input_buffer(self):
+        self._response.clear()
+
+    def close(self):
+        pass
+
+    def respond(self, request):
+        if self.state == "api":
+            # Two returns in a row switch to the shell, anything else resets the count.
+            self.returns = self.returns + request.count(b"\r") if request.strip(b"\r") == b"" else 0
+            if self.returns < 2:
+                return b""
+            self.state = "shell"
+            return b"DWM1001 TWR Real Time Location System\r\n\r\nHelp      :  ? or help\r\n\r\n" + dwm_shell.PROMPT
+        if self.state == "streaming":
+            self.state = "shell"
+            self._response.clear()
+            return b"\r\n" + dwm_shell.PROMPT
+
+        command = request.strip(b"\r").decode()
+        echo = command.encode() + b"\r\n"
+        if command == "lec":
+            self.state = "streaming"
+            return echo
+        if command == "si":
+            return echo + (f"[000011.270 INF] sys: fw2 fw_ver=x01030001 cfg_ver=x00010700\r\n"
+                           f"[000011.270 INF] uwb0: panid=x{self.panid:04X} addr=x{self.node_id:016X}\r\n"
+                           f"[000011.270 INF] mode: tn (act,twr,np,le)\r\n").encode() + dwm_shell.PROMPT
+        if command == "la":
+            lines = [f"[000005.690 INF] AN: cnt={len(self.anchors)} seq=x03\r\n"]
+            for index, (address, (x, y, z)) in enumerate(self.anchors):
+                lines.append(f"[000005.690 INF] {index}) id=DECA0000000{address:05X} seat={index} seens=0 rssi=-81 "
+                             f"cl=00000000 nbr=00000000 pos={x:.2f}:{y:.2f}:{z:.2f}\r\n")
+            return echo + "".join(lines).encode() + dwm_shell.PROMPT
+        return echo + dwm_shell.PROMPT
+
+    def lec_line(self):
+        parts = [f"DIST,{len(self.anchors)}"]
+        for index, (address, anchor) in enumerate(self.anchors):
+            parts.append(f"AN{index},{address:04X},{anchor[0]:.2f},{anchor[1]:.2f},{anchor[2]:.2f},"
+                         f"{math.dist(self.position, anchor):.2f}")
+        parts.append("POS,{:.2f},{:.2f},{:.2f},80".format(*self.position))
+        return (",".join(parts) + "\r\n").encode()
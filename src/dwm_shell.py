@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# DWM1001 shell mode, see the DWM1001 Firmware API Guide section 6.
+PROMPT = b"dwm> "
+ENTER_SHELL = b"\r\r"  # two returns within a second switch a freshly powered node from UART API to shell mode
+DEFAULT_TIMEOUT = 0.5
+PROBE_TIMEOUT = 0.2  # an idle shell answers a return within milliseconds
+DEFAULT_RETRIES = 3
+DEFAULT_CACHE_PATH = "./../anchor_cache.json"
+
+ANCHOR_POSITION = re.compile(r"pos=([\d.-]+):([\d.-]+):([\d.-]+)")
+NETWORK = re.compile(r"panid=x([0-9A-Fa-f]+)")
+NODE = re.compile(r"addr=x([0-9A-Fa-f]+)")
+
+
+class ShellError(Exception):
+    pass
+
+
+def parse_anchor_positions(response_lines):
+    anchor_positions = []
+    for line in response_lines:
+        match = ANCHOR_POSITION.search(line)
+        if match:
+            anchor_positions.append(tuple(float(match.group(axis)) for axis in (1, 2, 3)))
+    return anchor_positions
+
+
+def parse_device_key(response_lines):
+    # "si" prints the PAN id of the network and the address of the node, together they identify a setup.
+    text = "\n".join(response_lines)
+    network, node = NETWORK.search(text), NODE.search(text)
+    if network is None or node is None:
+        return None
+    return f"{network.group(1).upper()}:{node.group(1).upper()}"
+
+
+class AnchorCache:
+    # Anchor lists by device key, in a small JSON file next to ui.json. A missing or broken file is an empty cache.
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        anchors = self._load().get(key)
+        if not anchors:
+            return None
+        return [tuple(anchor) for anchor in anchors]
+
+    def put(self, key, anchor_positions):
+        entries = self._load()
+        entries[key] = [list(anchor) for anchor in anchor_positions]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump(entries, outfile, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class DWM1001Shell:
+    # Brings a DWM1001 tag from whatever state it is in (UART API, idle shell or still streaming from the last run)
+    # to streaming "lec" output, waiting on the shell prompt instead of sleeping. Every step has a timeout and is
+    # retried. Bytes that arrive after the lec echo are kept in pending for the reader to start with.
+    def __init__(self, ser, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, cache=None, clock=time.monotonic):
+        if retries < 1:
+            raise ValueError(f"Invalid retries {retries}, it must be at least 1")
+        self.ser = ser
+        self.timeout = timeout
+        self.retries = retries
+        self.cache = cache
+        self.clock = clock
+        self.pending = b""
+        self.device_key = None
+        self.anchors_cached = False
+
+    def read_until(self, pattern, timeout):
+        # Returns everything read up to and including the end of pattern, the rest stays in pending.
+        buffer = bytearray(self.pending)
+        self.pending = b""
+        deadline = self.clock() + timeout
+        while True:
+            end = buffer.find(pattern)
+            if end >= 0:
+                end += len(pattern)
+                self.pending = bytes(buffer[end:])
+                return bytes(buffer[:end])
+            if self.clock() >= deadline:
+                self.pending = bytes(buffer)
+                return None
+            chunk = self.ser.read(max(1, self.ser.in_waiting))
+            if chunk:
+                buffer += chunk
+            else:
+                time.sleep(0.001)
+
+    def command(self, command, expect=PROMPT, timeout=None):
+        # Sends command and returns the response lines between the echo and the expected pattern.
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(1, self.retries + 1):
+            self.pending = b""
+            self.ser.write(command)
+            response = self.read_until(expect, timeout)
+            if response is not None:
+                lines = response.decode(errors="replace").splitlines()
+                logger.debug("shell %r answered in %d lines", command, len(lines))
+                return [line.strip() for line in lines[1:] if line.strip() and not line.startswith(PROMPT.decode())]
+            logger.info("shell %r got no %r within %.2f s, attempt %d of %d", command, expect, timeout, attempt,
+                        self.retries)
+        raise ShellError(f"DWM1001 did not answer {command!r} after {self.retries} attempts")
+
+    def enter_shell(self):
+        # A single return gets a prompt from an idle shell and stops an output stream left running. A node still
+        # in UART API mode ignores it and needs the double return, which also prints the shell banner.
+        self.ser.reset_input_buffer()
+        self.ser.write(b"\r")
+        if self.read_until(PROMPT, min(self.timeout, PROBE_TIMEOUT)) is not None:
+            return
+        self.command(ENTER_SHELL, timeout=max(self.timeout, 1.0))
+
+    def system_info(self):
+        self.device_key = parse_device_key(self.command(b"si\r"))
+        return self.device_key
+
+    def anchor_positions(self, refresh=False):
+        if self.cache is not None and self.device_key is not None and not refresh:
+            anchor_positions = self.cache.get(self.device_key)
+            if anchor_positions:
+                self.anchors_cached = True
+                logger.info("anchors of %s from the cache", self.device_key)
+                return anchor_positions
+
+        anchor_positions = parse_anchor_positions(self.command(b"la\r"))
+        self.anchors_cached = False
+        if anchor_positions and self.cache is not None and self.device_key is not None:
+            self.cache.put(self.device_key, anchor_positions)
+        return anchor_positions
+
+    def start_stream(self):
+        self.command(b"lec\r", expect=b"lec\r\n")
+
+    def initialize(self, refresh_anchors=False):
+        # Returns the anchor positions, with the node streaming lec output when it returns.
+        self.enter_shell()
+        self.system_info()
+        anchor_positions = self.anchor_positions(refresh_anchors)
+        self.start_stream()
+        return anchor_positions
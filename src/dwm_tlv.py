@@ -0,0 +1,185 @@
+import struct
+import threading
+import time
+import logging
+
+import lec_parser
+import serial_reader
+from metrics import DISABLED
+
+logger = logging.getLogger(__name__)
+
+
+# DWM1001 UART API, see the DWM1001 Firmware API Guide section 5.
+DWM_LOC_GET = bytes([0x0C, 0x00])
+DWM_NODE_ID_GET = bytes([0x30, 0x00])
+
+TLV_RET_VAL = 0x40
+TLV_POS_XYZ = 0x41
+TLV_NODE_ID = 0x30
+TLV_RNG_AN_DIST = 0x48  # anchor node: 8 byte anchor addresses, no anchor positions
+TLV_RNG_AN_POS_DIST = 0x49  # tag node: 2 byte anchor addresses plus anchor positions
+
+POSITION = struct.Struct("<iiiB")  # x, y, z in mm, quality factor
+TAG_RANGE = struct.Struct("<HIB")  # anchor address, distance in mm, quality factor
+ANCHOR_RANGE = struct.Struct("<QIB")
+NODE_ID = struct.Struct("<Q")
+
+DEFAULT_POLL_RATE_HZ = 10
+
+
+class TlvError(Exception):
+    pass
+
+
+def decode_position(payload, offset=0):
+    x, y, z, quality = POSITION.unpack_from(payload, offset)
+    return x / 1000, y / 1000, z / 1000, quality
+
+
+def decode_loc_get(response, tag_id=None):
+    # response holds the TLVs after a successful return value: POS_XYZ followed by the ranging TLV.
+    view = memoryview(response)
+    if len(view) < 2 + POSITION.size or view[0] != TLV_POS_XYZ or view[1] != POSITION.size:
+        raise TlvError(f"unexpected dwm_loc_get position TLV {bytes(view[:2]).hex()}")
+    x, y, z, quality = decode_position(view, 2)
+
+    anchor_ids, anchor_positions, distances = [], [], []
+    offset = 2 + POSITION.size
+    if len(view) >= offset + 3:
+        kind, length, count = view[offset], view[offset + 1], view[offset + 2]
+        entry = TAG_RANGE.size + POSITION.size if kind == TLV_RNG_AN_POS_DIST else ANCHOR_RANGE.size
+        if kind not in (TLV_RNG_AN_POS_DIST, TLV_RNG_AN_DIST) or length != 1 + count * entry or \
+                len(view) < offset + 2 + length:
+            raise TlvError(f"unexpected dwm_loc_get ranging TLV {bytes(view[offset:offset + 3]).hex()}")
+
+        offset += 3
+        for _ in range(count):
+            if kind == TLV_RNG_AN_POS_DIST:
+                address, distance, _ = TAG_RANGE.unpack_from(view, offset)
+                anchor_ids.append(f"{address:04X}")
+                anchor_positions.append(decode_position(view, offset + TAG_RANGE.size)[:3])
+            else:
+                address, distance, _ = ANCHOR_RANGE.unpack_from(view, offset)
+                anchor_ids.append(f"{address & 0xFFFF:04X}")
+            distances.append(distance / 1000)
+            offset += entry
+
+    return lec_parser.TagSample(tag_id, x, y, z, quality, tuple(anchor_ids), tuple(anchor_positions),
+                                tuple(distances))
+
+
+class DWM1001TlvTransport:
+    # Polls dwm_loc_get over the UART API at a fixed rate on its own thread. Samples are handed out with the same
+    # take() contract as serial_reader.SerialReader so the tracking loop does not care which transport it reads, and
+    # like it writes every polled sample to capture.
+    def __init__(self, ser, rate_hz=DEFAULT_POLL_RATE_HZ, tag_id=None, metrics=None, capture=None):
+        if rate_hz <= 0:
+            raise ValueError(f"Invalid poll rate {rate_hz}, it must be greater than 0")
+        self.ser = ser
+        self.period = 1.0 / rate_hz
+        self.tag_id = tag_id
+        self.metrics = metrics or DISABLED
+        self.capture = capture
+        self.samples = serial_reader.LatestSamples()
+        self.polls = 0
+        self.errors = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def request(self, command):
+        self.ser.write(command)
+        header = self._read_exactly(3)
+        if header[0] != TLV_RET_VAL or header[1] != 1:
+            raise TlvError(f"unexpected response {header.hex()} to {command.hex()}")
+        if header[2] != 0:
+            raise TlvError(f"command {command.hex()} failed with error {header[2]}")
+
+    def read_tlv(self):
+        kind, length = self._read_exactly(2)
+        return kind, self._read_exactly(length)
+
+    def node_id(self):
+        self.request(DWM_NODE_ID_GET)
+        kind, value = self.read_tlv()
+        if kind != TLV_NODE_ID or len(value) != NODE_ID.size:
+            raise TlvError(f"unexpected dwm_node_id_get TLV {kind:#x}")
+        return NODE_ID.unpack(value)[0]
+
+    def loc_get(self):
+        self.request(DWM_LOC_GET)
+        position = self._read_exactly(2 + POSITION.size)
+        ranging_header = self._read_exactly(2)
+        ranging = self._read_exactly(ranging_header[1])
+        return decode_loc_get(position + ranging_header + ranging, self.tag_id)
+
+    def poll(self):
+        started = time.monotonic()
+        sample = self.loc_get()
+        now = time.monotonic()
+        self.metrics.observe("uwb_poll", now - started)
+        self.polls += 1
+        if sample.has_position or sample.distances:
+            if self.capture is not None:
+                self.capture.write(now, sample)
+            self.samples.put(sample.tag_id, (now, sample))
+        return sample
+
+    def clock(self):
+        return time.monotonic()
+
+    def take(self, timeout=None):
+        return self.samples.take(timeout)
+
+    def stats(self):
+        return {"polls": self.polls, "errors": self.errors, "coalesced": self.samples.coalesced}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.tag_id is None:
+            # Short id, the same four hex digits the shell and the listener print.
+            self.tag_id = f"{self.node_id() & 0xFFFF:04X}"
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="uwb-tlv", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _read_exactly(self, size):
+        data = self.ser.read(size)
+        if len(data) != size:
+            raise TlvError(f"timeout, expected {size} bytes, got {len(data)}")
+        return data
+
+    def _resync(self):
+        # Drop whatever is left of a broken response so the next request starts on a TLV boundary.
+        time.sleep(self.period / 2)
+        self.ser.reset_input_buffer()
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now < next_poll:
+                self._stop_event.wait(next_poll - now)
+                continue
+            next_poll = max(next_poll + self.period, now)
+
+            try:
+                self.poll()
+            except Exception as ex:
+                self.errors += 1
+                logger.warning("uwb tlv exception %s", ex)
+                self._resync()
@@ -0,0 +1,246 @@
+import math
+
+import numpy as np
+
+DMX_16BIT_MAX = 65535
+MOUNTINGS = {"floor": 0.0, "hung": 180.0}  # roll of the way the fixture is rigged, hung is upside down on a truss
+PAN_TURNS = (-2, -1, 0, 1, 2)  # whole pan turns tried around each solution, enough for ranges up to 720 degrees
+OUT_OF_RANGE_COST = 1e6  # per degree outside a range, so a reachable solution always wins
+
+
+def rotation_matrix(yaw=0.0, pitch=0.0, roll=0.0):
+    # Fixture frame to stage frame, in degrees: roll about the fixture's front (x), then pitch about y, then yaw
+    # about the vertical.
+    yaw, pitch, roll = math.radians(yaw), math.radians(pitch), math.radians(roll)
+    cy, sy, cp, sp, cr, sr = math.cos(yaw), math.sin(yaw), math.cos(pitch), math.sin(pitch), math.cos(roll), \
+        math.sin(roll)
+    return np.array([[cy, -sy, 0.0], [sy, cy, 0.0], [0.0, 0.0, 1.0]]) @ \
+        np.array([[cp, 0.0, sp], [0.0, 1.0, 0.0], [-sp, 0.0, cp]]) @ \
+        np.array([[1.0, 0.0, 0.0], [0.0, cr, -sr], [0.0, sr, cr]])
+
+
+class Fixture:
+    # One light system compiled once: where it hangs and how it is rotated, its angle scales and limits and the
+    # affine angle to 16 bit DMX coefficients. pan and tilt are the last commanded angles, aim() picks the solution
+    # that needs the least motor travel from them. Until the first aim the head is assumed at its range minimums.
+    __slots__ = ("name", "position", "rotation", "pan_scale", "pan_offset", "tilt_scale", "tilt_offset",
+                 "pan_min", "pan_max", "tilt_min", "tilt_max", "pan_dmx_scale", "pan_dmx_offset", "tilt_dmx_scale",
+                 "tilt_dmx_offset", "channels", "pan", "tilt")
+
+    def __init__(self, name, position, rotation, pan_scale, pan_offset, tilt_scale, tilt_offset, pan_range,
+                 tilt_range, pan_dmx_range, tilt_dmx_range, channels):
+        self.name = name
+        self.position = np.asarray(position, dtype=float)
+        self.rotation = np.asarray(rotation, dtype=float)
+        self.pan_scale, self.pan_offset = float(pan_scale), float(pan_offset)
+        self.tilt_scale, self.tilt_offset = float(tilt_scale), float(tilt_offset)
+        self.pan_min, self.pan_max = float(pan_range[0]), float(pan_range[1])
+        self.tilt_min, self.tilt_max = float(tilt_range[0]), float(tilt_range[1])
+        if self.pan_max <= self.pan_min or self.tilt_max <= self.tilt_min:
+            raise ValueError(f"Invalid pan {pan_range} or tilt {tilt_range} range for light system '{name}'")
+
+        # value = angle * scale + offset maps the angle range onto the DMX range.
+        self.pan_dmx_scale = (pan_dmx_range[1] - pan_dmx_range[0]) / (self.pan_max - self.pan_min)
+        self.pan_dmx_offset = pan_dmx_range[0] - self.pan_min * self.pan_dmx_scale
+        self.tilt_dmx_scale = (tilt_dmx_range[1] - tilt_dmx_range[0]) / (self.tilt_max - self.tilt_min)
+        self.tilt_dmx_offset = tilt_dmx_range[0] - self.tilt_min * self.tilt_dmx_scale
+
+        self.channels = tuple(int(channel) for channel in channels)  # pan coarse, pan fine, tilt coarse, tilt fine
+        self.pan, self.tilt = self.pan_min, self.tilt_min
+
+    @classmethod
+    def compile(cls, name, system, position=(0, 0, 0), pan_scale=1, pan_offset=0, tilt_scale=1, tilt_offset=0):
+        mounting = system.get("mounting", "floor")
+        if mounting not in MOUNTINGS:
+            raise ValueError(f"Unknown mounting '{mounting}' for light system '{name}'. Please select from "
+                             f"{list(MOUNTINGS.keys())}")
+        rotation = rotation_matrix(system.get("orientation", 0), system.get("pitch", 0),
+                                   system.get("roll", 0) + MOUNTINGS[mounting])
+        return cls(name=name,
+                   position=system.get("position", position),
+                   rotation=rotation,
+                   pan_scale=system.get("pan_scale", pan_scale),
+                   pan_offset=system.get("pan_offset", pan_offset),
+                   tilt_scale=system.get("tilt_scale", tilt_scale),
+                   tilt_offset=system.get("tilt_offset", tilt_offset),
+                   pan_range=system["pan_range"],
+                   tilt_range=system["tilt_range"],
+                   pan_dmx_range=system["pan_dmx_range"],
+                   tilt_dmx_range=system["tilt_dmx_range"],
+                   channels=(system["pan_channel"], system["pan_fine_channel"], system["tilt_channel"],
+                             system["tilt_fine_channel"]))
+
+    def solutions(self, target):
+        # Every (pan, tilt) that points the beam at target: the direct one and the one flipped over the top, each
+        # a whole number of pan turns apart. Not all of them are inside the ranges.
+        x, y, z = self.rotation.T @ (np.asarray(target, dtype=float) - self.position)
+        pan = math.degrees(math.atan2(y, x))
+        tilt = math.degrees(math.atan2(z, math.hypot(x, y)))
+        return [((pan + flip + turn * 360.0) * self.pan_scale + self.pan_offset,
+                 (tilt if not flip else 180.0 - tilt) * self.tilt_scale + self.tilt_offset)
+                for flip in (0.0, 180.0) for turn in PAN_TURNS]
+
+    def travel(self, pan, tilt):
+        # Pan and tilt motors move at the same time, the slower axis decides.
+        outside = max(self.pan_min - pan, pan - self.pan_max, 0.0) + max(self.tilt_min - tilt, tilt - self.tilt_max,
+                                                                          0.0)
+        return max(abs(pan - self.pan), abs(tilt - self.tilt)) + outside * OUT_OF_RANGE_COST
+
+    def aim(self, target):
+        pan, tilt = min(self.solutions(target), key=lambda solution: self.travel(*solution))
+        self.pan = min(max(pan, self.pan_min), self.pan_max)
+        self.tilt = min(max(tilt, self.tilt_min), self.tilt_max)
+        return self.pan, self.tilt
+
+    def dmx_values(self, pan, tilt):
+        # pan coarse, pan fine, tilt coarse, tilt fine for angles clamped to the fixture's ranges.
+        pan = min(max(pan, self.pan_min), self.pan_max)
+        tilt = min(max(tilt, self.tilt_min), self.tilt_max)
+        pan_value = min(max(int(pan * self.pan_dmx_scale + self.pan_dmx_offset), 0), DMX_16BIT_MAX)
+        tilt_value = min(max(int(tilt * self.tilt_dmx_scale + self.tilt_dmx_offset), 0), DMX_16BIT_MAX)
+        return pan_value >> 8, pan_value & 0xFF, tilt_value >> 8, tilt_value & 0xFF
+
+    def angles(self, pan_value, tilt_value):
+        # Inverse of dmx_values for 16 bit values, e.g. read back from a universe.
+        return ((pan_value - self.pan_dmx_offset) / self.pan_dmx_scale,
+                (tilt_value - self.tilt_dmx_offset) / self.tilt_dmx_scale)
+
+    def direction(self, pan, tilt):
+        # Unit vector in stage coordinates the beam points along at these angles.
+        pan = math.radians((pan - self.pan_offset) / self.pan_scale)
+        tilt = math.radians((tilt - self.tilt_offset) / self.tilt_scale)
+        return self.rotation @ np.array([math.cos(tilt) * math.cos(pan), math.cos(tilt) * math.sin(pan),
+                                         math.sin(tilt)])
+
+
+class FixtureArray:
+    # The compiled fixtures stacked into arrays, aiming every fixture at once per sample or DMX frame. The array
+    # keeps its own current angles, the Fixture objects only start them.
+    def __init__(self, fixtures):
+        self.fixtures = list(fixtures)
+        self.names = [fixture.name for fixture in self.fixtures]
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        def stack(attribute):
+            return np.array([getattr(fixture, attribute) for fixture in self.fixtures], dtype=float)
+
+        self.positions = stack("position").reshape(-1, 3)
+        self.rotations = stack("rotation").reshape(-1, 3, 3)
+        self.pan_scales, self.pan_offsets = stack("pan_scale"), stack("pan_offset")
+        self.tilt_scales, self.tilt_offsets = stack("tilt_scale"), stack("tilt_offset")
+        self.pan_min, self.pan_max = stack("pan_min"), stack("pan_max")
+        self.tilt_min, self.tilt_max = stack("tilt_min"), stack("tilt_max")
+        self.pan_dmx_scales, self.pan_dmx_offsets = stack("pan_dmx_scale"), stack("pan_dmx_offset")
+        self.tilt_dmx_scales, self.tilt_dmx_offsets = stack("tilt_dmx_scale"), stack("tilt_dmx_offset")
+        self.angles = np.stack((stack("pan"), stack("tilt")))  # current pan and tilt rows
+
+        # Columns: pan coarse, pan fine, tilt coarse, tilt fine.
+        self.channels = np.array([fixture.channels for fixture in self.fixtures], dtype=np.intp).reshape(-1, 4)
+
+        # Every candidate solution is factor * raw angle in radians + constant, with pan in row 0 and tilt in row 1
+        # and one column per solution: PAN_TURNS direct ones then PAN_TURNS flipped over the top.
+        turns = len(PAN_TURNS)
+        pan_steps = np.tile(np.asarray(PAN_TURNS, dtype=float) * 360.0, 2) + np.repeat((0.0, 180.0), turns)
+        flip_signs = np.repeat((1.0, -1.0), turns)
+        self._factors = np.stack((np.repeat(self.pan_scales[:, None], 2 * turns, axis=1),
+                                  self.tilt_scales[:, None] * flip_signs)) * math.degrees(1.0)
+        self._constants = np.stack((self.pan_offsets[:, None] + self.pan_scales[:, None] * pan_steps,
+                                    self.tilt_offsets[:, None] + self.tilt_scales[:, None] *
+                                    np.repeat((0.0, 180.0), turns)))
+        self._minimums = np.stack((self.pan_min, self.tilt_min))
+        self._maximums = np.stack((self.pan_max, self.tilt_max))
+        self._rows = np.arange(len(self.fixtures))
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def pan(self):
+        return self.angles[0]
+
+    @pan.setter
+    def pan(self, value):
+        self.angles[0] = value
+
+    @property
+    def tilt(self):
+        return self.angles[1]
+
+    @tilt.setter
+    def tilt(self, value):
+        self.angles[1] = value
+
+    @classmethod
+    def from_light_systems(cls, light_systems, names, position=(0, 0, 0), pan_scale=1, pan_offset=0, tilt_scale=1,
+                           tilt_offset=0):
+        unknown = [name for name in names if name not in light_systems]
+        if unknown:
+            raise ValueError(f"Unknown light system(s) {unknown}. Please select from {list(light_systems.keys())}")
+        return cls([Fixture.compile(name, light_systems[name], position, pan_scale, pan_offset, tilt_scale,
+                                    tilt_offset) for name in names])
+
+    def with_fixture(self, fixture):
+        # A new array with fixture in place of the one of the same name, current angles carried over. Swapping the
+        # reference is how a recalibrated fixture reaches threads that are aiming with this array.
+        fixtures = list(self.fixtures)
+        fixtures[self.index[fixture.name]] = fixture
+        array = FixtureArray(fixtures)
+        array.angles[:] = self.angles
+        return array
+
+    def pan_tilt(self, targets, mask=None):
+        # targets is a single (x, y, z) shared by every fixture or one row per fixture. Fixtures in mask (all by
+        # default) remember the returned angles as their current position.
+        relative = np.asarray(targets, dtype=float) - self.positions
+        x, y, z = np.matmul(relative[:, None, :], self.rotations)[:, 0].T  # rotation transposed, stage to fixture
+        # np.stack and np.clip cost more than the math at these sizes, hence out= and minimum/maximum.
+        raw = np.empty((2, len(self)))
+        np.arctan2(y, x, out=raw[0])
+        np.arctan2(z, np.hypot(x, y), out=raw[1])
+        candidates = raw[:, :, None] * self._factors + self._constants
+
+        outside = np.maximum(self._minimums[:, :, None] - candidates, candidates - self._maximums[:, :, None])
+        travel = np.abs(candidates - self.angles[:, :, None]).max(axis=0)
+        best = np.argmin(travel + np.maximum(outside, 0.0).sum(axis=0) * OUT_OF_RANGE_COST, axis=1)
+
+        angles = np.minimum(np.maximum(candidates[:, self._rows, best], self._minimums), self._maximums)
+        if mask is None:
+            self.angles[:] = angles
+        else:
+            self.angles[:, mask] = angles[:, mask]
+        return angles[0], angles[1]
+
+    def to_dmx(self, pan, tilt):
+        value = np.empty((len(self), 2), dtype=np.int32)
+        value[:, 0] = pan * self.pan_dmx_scales + self.pan_dmx_offsets
+        value[:, 1] = tilt * self.tilt_dmx_scales + self.tilt_dmx_offsets
+        return split_dmx(np.minimum(np.maximum(value, 0), DMX_16BIT_MAX))
+
+    def dmx_positions(self, pan, tilt):
+        # 16 bit pan (row 0) and tilt (row 1) values before truncation, what the motion limiter works in.
+        values = np.empty((2, len(self)))
+        values[0] = pan * self.pan_dmx_scales + self.pan_dmx_offsets
+        values[1] = tilt * self.tilt_dmx_scales + self.tilt_dmx_offsets
+        return np.minimum(np.maximum(values, 0.0, out=values), DMX_16BIT_MAX, out=values)
+
+    def write_values(self, universe, values, mask=None):
+        # values is (N, 4) as from to_dmx, fixtures outside mask keep whatever they were last sent.
+        if mask is None:
+            universe[self.channels] = values
+        else:
+            universe[self.channels[mask]] = values[mask]
+        return values
+
+    def write_dmx(self, universe, targets, mask=None):
+        # universe is a writable uint8 array over the 513 byte DMX buffer (start code at index 0), fixtures
+        # outside mask keep whatever they were last sent.
+        pan, tilt = self.pan_tilt(targets, mask)
+        return self.write_values(universe, self.to_dmx(pan, tilt), mask)
+
+
+def split_dmx(value):
+    # (N, 2) integer 16 bit pan and tilt values to (N, 4) pan coarse, pan fine, tilt coarse, tilt fine bytes.
+    values = np.empty((len(value), 4), dtype=np.uint8)
+    values[:, 0::2] = value >> 8
+    values[:, 1::2] = value & 0xFF
+    return values
@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+
+DEFAULT_CAPACITY = 600  # one minute of positions at 10 Hz
+HEAT_LEVELS = 8
+
+
+class PositionHistory:
+    # Fixed size ring of (timestamp, x, y, z) rows per tag, memory does not grow with the length of the show.
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.buffers = {}
+        self.heads = {}
+        self.sizes = {}
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def __contains__(self, tag_id):
+        return tag_id in self.buffers
+
+    def append(self, tag_id, timestamp, position):
+        buffer = self.buffers.get(tag_id)
+        if buffer is None:
+            buffer = self.buffers[tag_id] = np.empty((self.capacity, 4))
+            self.heads[tag_id] = 0
+            self.sizes[tag_id] = 0
+
+        head = self.heads[tag_id]
+        buffer[head, 0] = timestamp
+        buffer[head, 1:] = position
+        self.heads[tag_id] = (head + 1) % self.capacity
+        self.sizes[tag_id] = min(self.sizes[tag_id] + 1, self.capacity)
+
+    def latest_timestamp(self, tag_id):
+        if not self.sizes.get(tag_id):
+            return None
+        return self.buffers[tag_id][self.heads[tag_id] - 1, 0]
+
+    def add_snapshot(self, snapshot):
+        # Appends every tag that moved on since the previous snapshot and forgets tags the tracker evicted.
+        # Returns the tags that got a new row.
+        for tag_id in [tag_id for tag_id in self.buffers if tag_id not in snapshot.tag_ids]:
+            self.forget(tag_id)
+
+        updated = []
+        for index, tag_id in enumerate(snapshot.tag_ids):
+            timestamp = snapshot.last_seen[index]
+            latest = self.latest_timestamp(tag_id)
+            if latest is None or timestamp > latest:
+                self.append(tag_id, timestamp, snapshot.positions[index])
+                updated.append(tag_id)
+        return updated
+
+    def forget(self, tag_id):
+        self.buffers.pop(tag_id, None)
+        self.heads.pop(tag_id, None)
+        self.sizes.pop(tag_id, None)
+
+    def rows(self, tag_id, count=None):
+        # Oldest first, a copy of at most count of the newest rows.
+        size = self.sizes.get(tag_id, 0)
+        if count is not None:
+            size = min(size, count)
+        if not size:
+            return np.empty((0, 4))
+        buffer, head = self.buffers[tag_id], self.heads[tag_id]
+        start = head - size
+        if start >= 0:
+            return buffer[start:head].copy()
+        return np.concatenate((buffer[start:], buffer[:head]))
+
+    def trail(self, tag_id, count=None):
+        return self.rows(tag_id, count)[:, 1:]
+
+
+class OccupancyGrid:
+    # Visit counts over a fixed area of the floor. Levels grow with log2 of the count, so a cell's colour depends
+    # on its own count only and a new visit never forces the rest of the heatmap to be redrawn.
+    def __init__(self, origin=(-2.0, -2.0), size=(24.0, 16.0), cell=0.25, levels=HEAT_LEVELS):
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.cell = cell
+        self.levels = levels
+        self.counts = np.zeros((math.ceil(size[1] / cell), math.ceil(size[0] / cell)), dtype=np.int64)
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def add(self, position):
+        # Returns (row, column) when the visit moved the cell to a new level, None otherwise.
+        column = math.floor((position[0] - self.origin[0]) / self.cell)
+        row = math.floor((position[1] - self.origin[1]) / self.cell)
+        rows, columns = self.counts.shape
+        if not (0 <= row < rows and 0 <= column < columns):
+            return None
+
+        count = int(self.counts[row, column]) + 1
+        self.counts[row, column] = count
+        if self.level(count) != self.level(count - 1):
+            return row, column
+        return None
+
+    def level(self, count):
+        return min(int(count).bit_length(), self.levels - 1)
+
+    def cell_center(self, row, column):
+        return self.origin[0] + (column + 0.5) * self.cell, self.origin[1] + (row + 0.5) * self.cell
+
+    def occupied(self):
+        rows, columns = np.nonzero(self.counts)
+        return [(int(row), int(column), int(self.counts[row, column])) for row, column in zip(rows, columns)]
+
+    def clear(self):
+        self.counts[:] = 0
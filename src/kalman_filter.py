@@ -1,3 +1,12 @@
+import abc
+
+import numpy as np
+
+GATE_CHI2_3DOF_999 = 16.27  # 99.9% of genuine 3-D innovations fall inside this squared Mahalanobis distance
+NOISE_POWERS = np.array([4, 3, 2])
+NOISE_FACTORS = np.array([0.25, 0.5, 1.0])
+
+
 class KalmanFilter:
     def __init__(self, process_variance, estimated_measurement_variance):
         self.process_variance = process_variance
@@ -15,3 +24,276 @@ class KalmanFilter:
 
     def get_latest_estimated_measurement(self):
         return self.posteri_estimate
+
+
+class FilterBank(abc.ABC):
+    # Tag to row bookkeeping shared by the array backed filters, each tag owns one row of every state array.
+    def __init__(self, capacity=8, stale_timeout=2.0):
+        self.stale_timeout = stale_timeout
+        self.last_seen = np.zeros(capacity)
+        self.active = np.zeros(capacity, dtype=bool)
+
+        self.slots = {}
+        self.tag_ids = [None] * capacity
+        self.generation = 0  # bumped whenever a tag gets or loses a row
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, tag_id):
+        return tag_id in self.slots
+
+    @property
+    def capacity(self):
+        return len(self.tag_ids)
+
+    @property
+    @abc.abstractmethod
+    def positions(self):
+        pass
+
+    def slot(self, tag_id):
+        row = self.slots.get(tag_id)
+        if row is None:
+            row = self._allocate(tag_id)
+        return row
+
+    def get_latest_estimated_measurement(self, tag_id):
+        return self.positions[self.slots[tag_id]]
+
+    def input_measurements(self, tag_ids, measurements, timestamps):
+        # Banks without a batch update take the samples one by one. Returns the mask of accepted samples.
+        measurements = np.asarray(measurements, dtype=float).reshape(-1, 3)
+        timestamps = np.broadcast_to(np.asarray(timestamps, dtype=float), (len(measurements),))
+        return np.array([bool(self.input_latest_noisy_measurement(tag_id, measurement, timestamp))
+                         for tag_id, measurement, timestamp in zip(tag_ids, measurements, timestamps)], dtype=bool)
+
+    def evict_stale(self, now):
+        stale = np.flatnonzero(self.active & (now - self.last_seen > self.stale_timeout))
+        evicted = []
+        for row in stale:
+            tag_id = self.tag_ids[row]
+            del self.slots[tag_id]
+            self.tag_ids[row] = None
+            self.active[row] = False
+            evicted.append(tag_id)
+        if evicted:
+            self.generation += 1
+        return evicted
+
+    def stats(self):
+        # Counters of the bank, none unless it gates its measurements.
+        return {}
+
+    def _allocate(self, tag_id):
+        free = np.flatnonzero(~self.active)
+        if len(free) == 0:
+            self._grow()
+            free = np.flatnonzero(~self.active)
+
+        row = int(free[0])
+        self._reset_row(row)
+        self.active[row] = True
+        self.tag_ids[row] = tag_id
+        self.slots[tag_id] = row
+        self.generation += 1
+        return row
+
+    def _grow(self):
+        capacity = self.capacity
+        self._grow_state(capacity)
+        self.last_seen = np.concatenate([self.last_seen, np.zeros(capacity)])
+        self.active = np.concatenate([self.active, np.zeros(capacity, dtype=bool)])
+        self.tag_ids.extend([None] * capacity)
+
+    @abc.abstractmethod
+    def _reset_row(self, row):
+        pass
+
+    @abc.abstractmethod
+    def _grow_state(self, extra):
+        pass
+
+
+class KalmanFilterBank(FilterBank):
+    # Same per-axis filter as KalmanFilter, one row per tag so all tags live in a few contiguous arrays.
+    def __init__(self, process_variance, estimated_measurement_variance, capacity=8, stale_timeout=2.0):
+        super().__init__(capacity, stale_timeout)
+        self.process_variance = process_variance
+        self.estimated_measurement_variance = estimated_measurement_variance
+
+        self.posteri_estimates = np.zeros((capacity, 3))
+        self.posteri_error_estimates = np.ones((capacity, 3))
+
+    @property
+    def positions(self):
+        return self.posteri_estimates
+
+    def input_latest_noisy_measurement(self, tag_id, measurement, timestamp):
+        row = self.slot(tag_id)
+
+        priori_estimate = self.posteri_estimates[row]
+        priori_error_estimate = self.posteri_error_estimates[row] + self.process_variance
+
+        blending_factor = priori_error_estimate / (priori_error_estimate + self.estimated_measurement_variance)
+        self.posteri_estimates[row] = priori_estimate + blending_factor * (np.asarray(measurement) - priori_estimate)
+        self.posteri_error_estimates[row] = (1 - blending_factor) * priori_error_estimate
+        self.last_seen[row] = timestamp
+        return True
+
+    def _reset_row(self, row):
+        self.posteri_estimates[row] = 0.0
+        self.posteri_error_estimates[row] = 1.0
+
+    def _grow_state(self, extra):
+        self.posteri_estimates = np.concatenate([self.posteri_estimates, np.zeros((extra, 3))])
+        self.posteri_error_estimates = np.concatenate([self.posteri_error_estimates, np.ones((extra, 3))])
+
+
+class ConstantVelocityKalmanFilterBank(FilterBank):
+    # 3-D constant velocity model per tag, state is (x, y, z, vx, vy, vz) with a full 6x6 covariance.
+    # process_noise is the variance of the acceleration (m^2/s^4), held constant over each step between two
+    # measurements, measurement_noise the UWB position variance (m^2) and initial_velocity_variance how unsure a new
+    # track is about its speed.
+    # Measurements further than gate_threshold (squared Mahalanobis distance, None disables gating) from the
+    # prediction are rejected, after max_rejections in a row the track restarts at the latest measurement.
+    def __init__(self, process_noise=2.0, measurement_noise=0.01, initial_velocity_variance=1.0, capacity=8,
+                 stale_timeout=2.0, max_dt=0.5, gate_threshold=GATE_CHI2_3DOF_999, max_rejections=5):
+        super().__init__(capacity, stale_timeout)
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.initial_velocity_variance = initial_velocity_variance
+        self.max_dt = max_dt
+        self.gate_threshold = gate_threshold
+        self.max_rejections = max_rejections
+
+        self.accepted = 0
+        self.rejected = 0
+        self.track_resets = 0
+        self.consecutive_rejections = np.zeros(capacity, dtype=np.int32)
+
+        self.states = np.zeros((capacity, 6))
+        self.covariances = np.zeros((capacity, 6, 6))
+        self.initialized = np.zeros(capacity, dtype=bool)
+        self._measurement_covariance = np.eye(3) * measurement_noise
+        # Piecewise constant acceleration noise per axis is q * [[dt^4 / 4, dt^3 / 2], [dt^3 / 2, dt^2]], one
+        # flattened 6x6 template per power of dt.
+        self._noise_templates = process_noise * np.stack(
+            [np.kron(block, np.eye(3)).ravel() for block in (np.array([[1.0, 0.0], [0.0, 0.0]]),
+                                                             np.array([[0.0, 1.0], [1.0, 0.0]]),
+                                                             np.array([[0.0, 0.0], [0.0, 1.0]]))])
+
+    @property
+    def positions(self):
+        return self.states[:, :3]
+
+    @property
+    def velocities(self):
+        return self.states[:, 3:]
+
+    def process_covariance(self, dt):
+        # Q for each dt, the templates scaled by dt^4 / 4, dt^3 / 2 and dt^2.
+        return (np.power(dt[:, None], NOISE_POWERS) * NOISE_FACTORS @ self._noise_templates).reshape(-1, 6, 6)
+
+    def predict_rows(self, rows, timestamps):
+        # Prior state and covariance of rows at timestamps, nothing is stored. The transition [[I, dt I], [0, I]]
+        # is applied by adding dt times the velocity rows (and columns) to the position ones instead of two 6x6
+        # matmuls.
+        dt = np.minimum(np.maximum(timestamps - self.last_seen[rows], 0.0), self.max_dt)
+        states = self.states[rows]
+        states[:, :3] += dt[:, None] * states[:, 3:]
+        covariances = self.covariances[rows]
+        steps = dt[:, None, None]
+        covariances[:, :3, :] += steps * covariances[:, 3:, :]
+        covariances[:, :, :3] += steps * covariances[:, :, 3:]
+        covariances += self.process_covariance(dt)
+        return states, covariances
+
+    def input_measurements(self, tag_ids, measurements, timestamps):
+        rows = np.fromiter((self.slot(tag_id) for tag_id in tag_ids), dtype=np.intp, count=len(tag_ids))
+        measurements = np.asarray(measurements, dtype=float).reshape(-1, 3)
+        timestamps = np.asarray(timestamps, dtype=float)
+        if timestamps.ndim == 0:
+            timestamps = np.full(len(rows), timestamps)
+
+        new = ~self.initialized[rows]
+        if not new.any():
+            # Every tag already tracked, the usual case, skips the masking.
+            accepted = self._update(rows, measurements, timestamps)
+        else:
+            accepted = np.ones(len(rows), dtype=bool)
+            self._start_tracks(rows[new], measurements[new], timestamps[new])
+            known = ~new
+            if known.any():
+                accepted[known] = self._update(rows[known], measurements[known], timestamps[known])
+
+        count = int(np.count_nonzero(accepted))
+        self.accepted += count
+        self.rejected += len(rows) - count
+        return accepted
+
+    def input_latest_noisy_measurement(self, tag_id, measurement, timestamp):
+        return bool(self.input_measurements((tag_id,), measurement, timestamp)[0])
+
+    def stats(self):
+        return {"accepted": self.accepted, "rejected": self.rejected, "track_resets": self.track_resets}
+
+    def _update(self, rows, measurements, timestamps):
+        states, covariances = self.predict_rows(rows, timestamps)
+
+        # One solve against the innovation covariance S gives S^-1 P[:3] for the gain and S^-1 innovation for the
+        # gate, no inverse is formed.
+        innovation = measurements - states[:, :3]
+        right = np.empty((len(rows), 3, 7))
+        right[:, :, :6] = covariances[:, :3, :]
+        right[:, :, 6] = innovation
+        solved = np.linalg.solve(covariances[:, :3, :3] + self._measurement_covariance, right)
+
+        accepted = np.ones(len(rows), dtype=bool)
+        if self.gate_threshold is not None:
+            distance = np.einsum("ni,ni->n", innovation, solved[:, :, 6])
+            accepted = distance <= self.gate_threshold
+            if accepted.all():
+                self.consecutive_rejections[rows] = 0
+            else:
+                self.consecutive_rejections[rows[~accepted]] += 1
+                self.consecutive_rejections[rows[accepted]] = 0
+
+                # A long run of rejections means the tag really moved (or the filter diverged), start over there.
+                reset = ~accepted & (self.consecutive_rejections[rows] >= self.max_rejections)
+                if reset.any():
+                    self._start_tracks(rows[reset], measurements[reset], timestamps[reset])
+                    self.track_resets += int(reset.sum())
+
+                rows, states, covariances = rows[accepted], states[accepted], covariances[accepted]
+                solved, timestamps = solved[accepted], timestamps[accepted]
+
+        # With S symmetric the gain P[:, :3] S^-1 applied to anything is P[:, :3] times the solved columns.
+        cross = covariances[:, :, :3]
+        states += (cross @ solved[:, :, 6:])[:, :, 0]
+        covariances -= cross @ solved[:, :, :6]
+
+        self.states[rows] = states
+        self.covariances[rows] = (covariances + covariances.transpose(0, 2, 1)) / 2
+        self.last_seen[rows] = timestamps
+        return accepted
+
+    def _start_tracks(self, rows, measurements, timestamps):
+        self.states[rows, :3] = measurements
+        self.states[rows, 3:] = 0.0
+        self.covariances[rows] = np.diag([self.measurement_noise] * 3 + [self.initial_velocity_variance] * 3)
+        self.initialized[rows] = True
+        self.consecutive_rejections[rows] = 0
+        self.last_seen[rows] = timestamps
+
+    def _reset_row(self, row):
+        self.states[row] = 0.0
+        self.covariances[row] = 0.0
+        self.initialized[row] = False
+        self.consecutive_rejections[row] = 0
+
+    def _grow_state(self, extra):
+        self.consecutive_rejections = np.concatenate([self.consecutive_rejections, np.zeros(extra, dtype=np.int32)])
+        self.states = np.concatenate([self.states, np.zeros((extra, 6))])
+        self.covariances = np.concatenate([self.covariances, np.zeros((extra, 6, 6))])
+        self.initialized = np.concatenate([self.initialized, np.zeros(extra, dtype=bool)])
@@ -0,0 +1,124 @@
+import math
+
+POS = b"POS"
+DIST = b"DIST"
+ANCHOR_FIELDS = 6  # AN<i>,<id>,x,y,z,distance
+
+NO_ANCHORS = ()
+
+
+class TagSample:
+    __slots__ = ("tag_id", "x", "y", "z", "quality", "anchor_ids", "anchor_positions", "distances")
+
+    def __init__(self, tag_id, x, y, z, quality=None, anchor_ids=NO_ANCHORS, anchor_positions=NO_ANCHORS,
+                 distances=NO_ANCHORS):
+        self.tag_id = tag_id
+        self.x = x
+        self.y = y
+        self.z = z
+        self.quality = quality
+        self.anchor_ids = anchor_ids
+        self.anchor_positions = anchor_positions
+        self.distances = distances
+
+    def __repr__(self):
+        return f"TagSample({self.tag_id!r}, {self.x}, {self.y}, {self.z}, quality={self.quality}, " \
+               f"distances={len(self.distances)})"
+
+    def __eq__(self, other):
+        return isinstance(other, TagSample) and all(getattr(self, name) == getattr(other, name)
+                                                    for name in self.__slots__)
+
+    @property
+    def position(self):
+        return self.x, self.y, self.z
+
+    @property
+    def has_position(self):
+        # nan compares unequal to itself
+        return self.x == self.x and self.y == self.y and self.z == self.z
+
+
+MAX_TAG_IDS = 1024  # raw ids decoded once and kept, past this a corrupt stream's junk ids are decoded every time
+
+_tag_ids = {}
+
+
+def _tag_id(field):
+    # Tags repeat on every line, decode each raw id once.
+    tag_id = _tag_ids.get(field)
+    if tag_id is None:
+        tag_id = field.decode("ascii", "replace").upper()
+        if len(_tag_ids) < MAX_TAG_IDS:
+            _tag_ids[field] = tag_id
+    return tag_id
+
+
+def _quality(field):
+    # The last field still has the line ending, which int() skips.
+    try:
+        return int(field)
+    except ValueError:
+        return None
+
+
+def parse_line(line):
+    # A raw bytes/bytearray/memoryview line from the DWM1001 shell to a TagSample with the numbers converted, or None.
+    #   listener:  POS,<index>,<tag id>,x,y,z,qf[,...]
+    #   lep:       POS,x,y,z,qf
+    #   lec:       DIST,<n>,AN0,<id>,x,y,z,d,...,AN<n-1>,<id>,x,y,z,d[,POS,x,y,z,qf]
+    # This is not allocation free: anything but bytes is copied and the split makes a bytes object per field, as
+    # float() needs. With logging off it costs about what parse_tag_position did (bench_lec_parser), what it saves is
+    # the per line logging and decoding. find() per field and a compiled pattern both measure slower than the split.
+    # The line is not stripped first, float() and int() skip the "\r\n" left on the last field.
+    if not isinstance(line, bytes):
+        line = bytes(line)
+    fields = line.split(b",")
+    count = len(fields)
+    kind = fields[0]
+
+    try:
+        if kind == POS:
+            if count >= 7:
+                x, y, z = float(fields[3]), float(fields[4]), float(fields[5])
+                if x != x or y != y or z != z:
+                    return None
+                return TagSample(_tag_id(fields[2]), x, y, z, _quality(fields[6]))
+            if count >= 4:
+                x, y, z = float(fields[1]), float(fields[2]), float(fields[3])
+                if x != x or y != y or z != z:
+                    return None
+                return TagSample(None, x, y, z, _quality(fields[4]) if count > 4 else None)
+            return None
+
+        if kind == DIST and count >= 2:
+            anchors = int(fields[1])
+            end = 2 + anchors * ANCHOR_FIELDS
+            if anchors < 0 or count < end:
+                return None
+
+            anchor_ids = []
+            anchor_positions = []
+            distances = []
+            for i in range(2, end, ANCHOR_FIELDS):
+                distance = float(fields[i + 5])
+                if distance != distance:
+                    continue
+                anchor_ids.append(_tag_id(fields[i + 1]))
+                anchor_positions.append((float(fields[i + 2]), float(fields[i + 3]), float(fields[i + 4])))
+                distances.append(distance)
+
+            if count >= end + 4 and fields[end] == POS:
+                x, y, z = float(fields[end + 1]), float(fields[end + 2]), float(fields[end + 3])
+                quality = _quality(fields[end + 4]) if count > end + 4 else None
+            else:
+                x = y = z = math.nan
+                quality = None
+            if not distances and x != x:
+                return None
+            return TagSample(None, x, y, z, quality, tuple(anchor_ids), tuple(anchor_positions), tuple(distances))
+    except ValueError:
+        # Corrupt or truncated number, the line is dropped.
+        return None
+
+    return None
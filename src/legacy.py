@@ -0,0 +1,88 @@
+# The per line path main.py had before the tracker, parser and fixture modules replaced it, copied unchanged from
+# the original main.py. Nothing live uses it any more, the benchmarks keep it as the baseline they compare against,
+# including its quirks: parse_tag_position logs every line at INFO and get_pan_and_tilt puts the whole 16 bit value
+# in the coarse channel, which the DMX buffer then clamps to 255.
+import datetime
+import logging
+import math
+
+TERMINAL_LOGGING = False
+
+
+def parse_tag_position(line):
+    if line:
+        decoded_line = line.decode().strip('\r\n')
+        log(decoded_line)
+        if len(line) >= 20:
+            parse = decoded_line.split(",")
+            if parse[0] != "POS" or parse[3] == "nan" or parse[4] == "nan" or parse[5] == "nan":
+                return
+
+            return parse[3], parse[4], parse[5]
+        else:
+            log(f"could not parse {line.decode()}")
+    return
+
+
+def filter_position(kfx, kfy, kfz, tag_pos):
+    kfx.input_latest_noisy_measurement(float(tag_pos[0]))
+    kfy.input_latest_noisy_measurement(float(tag_pos[1]))
+    kfz.input_latest_noisy_measurement(float(tag_pos[2]))
+    return kfx.get_latest_estimated_measurement(), kfy.get_latest_estimated_measurement(), kfz.get_latest_estimated_measurement()
+
+
+def log(line):
+    if TERMINAL_LOGGING:
+        print(datetime.datetime.now().strftime("%H:%M:%S"), line)
+    logging.info(line)
+
+
+def calculate_distance(x, y, z):
+    return math.sqrt(x ** 2 + y ** 2 + z ** 2)
+
+
+def calculate_pan(x, y, pan_scale, pan_offset):
+    return math.degrees(math.atan2(y, x)) * pan_scale + pan_offset
+
+
+def calculate_tilt(z, distance, tilt_scale, tilt_offset):
+    return math.degrees(math.atan2(z, distance)) * tilt_scale + tilt_offset
+
+
+def calculate_dmx_value(angle, max_angle, dmx_range):
+    return int(angle * dmx_range / max_angle)
+
+
+def calculate_fine_dmx_value(angle, max_angle, coarse_value, dmx_range):
+    return int((angle * dmx_range / max_angle - coarse_value) * 256)
+
+
+def uwb_position_to_pan_tilt(filter_pos, pan_scale, pan_offset, tilt_scale, tilt_offset, sel_light_system):
+    x, y, z = filter_pos
+    distance = calculate_distance(x, y, z)
+
+    pan = calculate_pan(x, y, pan_scale, pan_offset)
+    tilt = calculate_tilt(z, distance, tilt_scale, tilt_offset)
+
+    pan_range = sel_light_system["pan_range"]
+    tilt_range = sel_light_system["tilt_range"]
+    pan_dmx_range = sel_light_system["pan_dmx_range"]
+    tilt_dmx_range = sel_light_system["tilt_dmx_range"]
+
+    pan = max(min(pan, pan_range[1]), pan_range[0])
+    tilt = max(min(tilt, tilt_range[1]), tilt_range[0])
+
+    log(f"pan: {pan}, tilt: {tilt}")
+
+    pan_coarse, pan_fine, tilt_coarse, tilt_fine = get_pan_and_tilt(pan, pan_dmx_range, pan_range, tilt, tilt_dmx_range,
+                                                                    tilt_range)
+
+    return pan_coarse, pan_fine, tilt_coarse, tilt_fine
+
+
+def get_pan_and_tilt(pan, pan_dmx_range, pan_range, tilt, tilt_dmx_range, tilt_range):
+    pan_coarse = calculate_dmx_value(pan, pan_range[1], pan_dmx_range[1])
+    pan_fine = calculate_fine_dmx_value(pan, pan_range[1], pan_coarse, pan_dmx_range[1])
+    tilt_coarse = calculate_dmx_value(tilt, tilt_range[1], tilt_dmx_range[1])
+    tilt_fine = calculate_fine_dmx_value(tilt, tilt_range[1], tilt_coarse, tilt_dmx_range[1])
+    return pan_coarse, pan_fine, tilt_coarse, tilt_fine
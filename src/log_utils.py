@@ -0,0 +1,247 @@
+import atexit
+import logging
+import logging.handlers
+import marshal
+import queue
+import struct
+import time
+
+FILE_FORMAT = "%(asctime)s - %(message)s"
+FILE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+TERMINAL_FORMAT = "%(asctime)s %(message)s"
+TERMINAL_DATE_FORMAT = "%H:%M:%S"
+
+QUEUE_SIZE = 10000
+DEFAULT_RATE = 20.0  # records per second per message template
+DEFAULT_BURST = 50
+
+STRUCTURED_MAGIC = b"SEGLOG\x01\x00"
+TEMPLATE = struct.Struct("<BHH")  # kind, template id, length of "logger\0template"
+RECORD = struct.Struct("<BHdBI")  # kind, template id, created, level, length of the marshalled args
+KIND_TEMPLATE = 0
+KIND_RECORD = 1
+IMMUTABLE_ARGS = (int, float, complex, str, bytes, type(None))
+
+
+class RateLimitFilter(logging.Filter):
+    # Token bucket per message template (record.msg, the format string before % args), so one chatty call site
+    # cannot flood the log or crowd out the others. limits overrides the rate of single templates, None lets every
+    # record through and 0 drops them all. Warnings and errors are never limited. When the filter is attached to
+    # the queue handler it runs on every logging thread, the buckets are then approximate, never wrong by much.
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, limits=None, clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.limits = limits or {}
+        self.clock = clock
+        self.buckets = {}
+        self.suppressed = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = getattr(record, "template", record.msg)
+        rate = self.limits.get(key, self.rate)
+        if rate is None:
+            return True
+        if not rate:
+            self.dropped += 1
+            return False
+
+        now = self.clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(self.burst), now]
+        tokens = min(float(self.burst), bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            self.dropped += 1
+            return False
+
+        bucket[0] = tokens - 1.0
+        suppressed = self.suppressed.pop(key, 0)
+        if suppressed and isinstance(record.args, tuple):
+            record.msg = f"{record.msg} (%d similar suppressed)"
+            record.args = record.args + (suppressed,)
+        return True
+
+
+def immutable(arg):
+    if isinstance(arg, tuple):
+        return all(immutable(item) for item in arg)
+    return isinstance(arg, IMMUTABLE_ARGS)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    # Hands records to the listener thread, formatting happens there. Only args that cannot change in the meantime
+    # are left for later, a record with a list, dict, array or other mutable arg is formatted here and travels as
+    # "%s" of the text, its template kept in record.template for the rate limit. A full queue drops the record
+    # instead of blocking the tracking loop.
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        args = record.args
+        if args and not immutable(args):
+            record.template = record.msg
+            record.msg, record.args = "%s", (record.getMessage(),)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class FanOutHandler(logging.Handler):
+    # Hands each record to all of handlers after running its own filters once, so a filter that counts records, like
+    # RateLimitFilter, counts each one once however many outputs it goes to.
+    def __init__(self, handlers):
+        super().__init__()
+        self.handlers = handlers
+
+    def emit(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self):
+        for handler in self.handlers:
+            handler.close()
+        super().close()
+
+
+def marshal_args(args):
+    try:
+        return marshal.dumps(args)
+    except ValueError:
+        return marshal.dumps(tuple(arg if isinstance(arg, (int, float, str, bytes, type(None))) else repr(arg)
+                                   for arg in (args if isinstance(args, tuple) else (args,))))
+
+
+class StructuredLogHandler(logging.Handler):
+    # Full rate binary trace: each template is written once, after that a record is its template id, timestamp,
+    # level and the marshalled % args. read_structured_log() turns it back into text.
+    def __init__(self, path):
+        super().__init__(logging.DEBUG)
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(STRUCTURED_MAGIC)
+        self.templates = {}
+
+    def emit(self, record):
+        try:
+            key = (record.name, str(record.msg))
+            template_id = self.templates.get(key)
+            if template_id is None:
+                template_id = self.templates[key] = len(self.templates)
+                text = "\0".join(key).encode()
+                self.file.write(TEMPLATE.pack(KIND_TEMPLATE, template_id, len(text)) + text)
+            args = marshal_args(record.args if record.args is not None else ())
+            self.file.write(RECORD.pack(KIND_RECORD, template_id, record.created, record.levelno, len(args)) + args)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if not self.file.closed:
+            self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        super().close()
+
+
+def read_structured_log(path):
+    # Yields (created, level, logger name, message) for every record of a structured log.
+    with open(path, "rb") as infile:
+        data = infile.read()
+    if not data.startswith(STRUCTURED_MAGIC):
+        raise ValueError(f"{path} is not a structured log")
+
+    templates = {}
+    offset = len(STRUCTURED_MAGIC)
+    while offset < len(data):
+        if data[offset] == KIND_TEMPLATE:
+            _, template_id, length = TEMPLATE.unpack_from(data, offset)
+            offset += TEMPLATE.size
+            templates[template_id] = data[offset:offset + length].decode().split("\0", 1)
+        else:
+            _, template_id, created, level, length = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            args = marshal.loads(data[offset:offset + length])
+            name, template = templates[template_id]
+            try:
+                message = template % args if args else template
+            except (TypeError, ValueError):
+                message = f"{template} {args!r}"
+            yield created, level, name, message
+        offset += length
+
+
+class LogPipeline:
+    def __init__(self, listener, queue_handler, rate_filter):
+        self.listener = listener
+        self.queue_handler = queue_handler
+        self.rate_filter = rate_filter
+        self._stopped = False
+
+    def stats(self):
+        return {"queue_dropped": self.queue_handler.dropped, "rate_limited": self.rate_filter.dropped}
+
+    def stop(self):
+        # Drains whatever is still queued.
+        if self._stopped:
+            return
+        self._stopped = True
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+def setup(filename=None, level=logging.INFO, terminal=False, structured_path=None, rate=DEFAULT_RATE,
+          burst=DEFAULT_BURST, limits=None, queue_size=QUEUE_SIZE):
+    # Routes the root logger through a bounded queue to a listener thread that does all formatting and I/O.
+    # Text output is rate limited per template. Without a structured log the limit is applied before the record
+    # is queued. With one, every record is queued so the binary trace stays complete and only the text is limited.
+    rate_filter = RateLimitFilter(rate, burst, limits)
+
+    text_handlers = []
+    if filename:
+        file_handler = logging.FileHandler(filename)
+        file_handler.setFormatter(logging.Formatter(FILE_FORMAT, FILE_DATE_FORMAT))
+        text_handlers.append(file_handler)
+    if terminal:
+        terminal_handler = logging.StreamHandler()
+        terminal_handler.setFormatter(logging.Formatter(TERMINAL_FORMAT, TERMINAL_DATE_FORMAT))
+        text_handlers.append(terminal_handler)
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    handlers = list(text_handlers)
+    if structured_path:
+        # The text outputs share one rate limit, applied once per record. The structured log comes first, so it
+        # sees records before the rate limit appends its suppressed counts.
+        text_output = FanOutHandler(text_handlers)
+        text_output.addFilter(rate_filter)
+        handlers = [StructuredLogHandler(structured_path), text_output]
+    else:
+        queue_handler.addFilter(rate_filter)
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    pipeline = LogPipeline(listener, queue_handler, rate_filter)
+    atexit.register(pipeline.stop)
+    return pipeline
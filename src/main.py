@@ -1,18 +1,39 @@
-import argparse
+import time
 
+PROCESS_STARTED = time.perf_counter()  # before the heavier imports below, so --headless startup reports include them
+
+import argparse
 import serial
-import time
 import datetime
 import logging
 import threading
-import re
+from operator import attrgetter
 import dmx
 import dmx_mock
+import dmx_network
+import dmx_scheduler
+import serial_reader
+import lec_parser
+import dwm_shell
+import dwm_tlv
+import dwm_mock
+import calibration
+import capture
+import metrics as stage_metrics
+import multilateration
+import log_utils
+import fixtures
+import motion
+import tracker
 import kalman_filter as kf
-import uwb_visualizer as uwb_v
-import math
+import state_server
+import numpy as np
 
 TERMINAL_LOGGING = False
+RAW_LOGGING = False
+RAW_LOG_FORMAT = "raw %r"  # --log-raw asks for every line, so this one is never rate limited
+
+logger = logging.getLogger(__name__)
 
 CAM_X, CAM_Y, CAM_Z = 1, 1, 1
 
@@ -22,8 +43,18 @@ PAN_OFFSET = 0
 TILT_SCALE = 1
 TILT_OFFSET = 0
 
+PROCESS_NOISE = 2.0  # variance of the performer's acceleration over a step, m^2/s^4
+MEASUREMENT_NOISE = 0.01  # UWB position variance, m^2
+
+FIXTURE_LATENCY = 0.1  # UWB measurement plus moving head motor response, seconds
+
+MIN_QUALITY = 0  # lowest DWM1001 position quality factor (0-100) fed to the filter
+STATS_INTERVAL = 5.0
+
 LIGHT_SYSTEMS = {
     "BadBoy": {
+        "position": (CAM_X, CAM_Y, CAM_Z),
+        "orientation": 0,
         "pan_range": (0, 615),
         "tilt_range": (0, 260),
         "pan_dmx_range": (0, 65535),
@@ -34,6 +65,8 @@ LIGHT_SYSTEMS = {
         "tilt_fine_channel": 5
     },
     "Sparky": {
+        "position": (CAM_X, CAM_Y, CAM_Z),
+        "orientation": 0,
         "pan_range": (0, 540),
         "tilt_range": (0, 250),
         "pan_dmx_range": (0, 65535),
@@ -46,243 +79,424 @@ LIGHT_SYSTEMS = {
 }
 
 
-class DWM1001:
-    def __init__(self, port="/dev/ttyACM0", baudrate=115200):
-        self.ser = serial.Serial(port=port, baudrate=baudrate)
-        print(datetime.datetime.now().strftime("%H:%M:%S"), "Connected to " + self.ser.name)
-
-    def send_command(self, command):
-        self.ser.write(command.encode())
-
-    def readline(self):
-        return self.ser.readline()
+def parse_uwb_line(line):
+    if RAW_LOGGING:
+        logger.info(RAW_LOG_FORMAT, line)
+    return lec_parser.parse_line(line)
 
-    def close(self):
-        self.ser.close()
 
-    def read_dwm_messages(self):
-        response_lines = []
+def parse_light_systems(light_system):
+    if light_system == "all":
+        return list(LIGHT_SYSTEMS.keys())
+    return [name.strip() for name in light_system.split(",") if name.strip()]
 
-        while True:
-            line = self.readline()
-            if not line.decode().endswith("INF] \r\n"):
-                decoded_line = line.decode().strip('\r\n')
-                log(f"raw la ({decoded_line})")
-                response_lines.append(decoded_line)
-            else:
-                break
 
-        return response_lines
+def fixture_defaults():
+    # Compile options for light systems that leave these keys out.
+    return {"position": (CAM_X, CAM_Y, CAM_Z), "pan_scale": PAN_SCALE, "pan_offset": PAN_OFFSET,
+            "tilt_scale": TILT_SCALE, "tilt_offset": TILT_OFFSET}
 
 
-def parse_anchor_positions(response_lines):
-    anchor_positions = []
+def build_fixtures(light_systems):
+    return fixtures.FixtureArray.from_light_systems(LIGHT_SYSTEMS, light_systems, **fixture_defaults())
 
-    for line in response_lines:
-        match = re.search(r'pos=([\d.-]+):([\d.-]+):([\d.-]+)', line)
-        if match:
-            x = float(match.group(1))
-            y = float(match.group(2))
-            z = float(match.group(3))
-            anchor_positions.append((x, y, z))
 
-    return anchor_positions
+def parse_latency(latency):
+    if latency == "auto":
+        return None
+    latency = float(latency)
+    if latency < 0:
+        raise ValueError(f"Invalid latency {latency}, it must be 'auto' or a number of seconds >= 0")
+    return latency
 
 
-def parse_tag_position(line):
-    if line:
-        decoded_line = line.decode().strip('\r\n')
-        log(decoded_line)
-        if len(line) >= 20:
-            parse = decoded_line.split(",")
-            if parse[0] != "POS" or parse[3] == "nan" or parse[4] == "nan" or parse[5] == "nan":
-                return
+def open_uwb_source(uwb_port, uwb_mode="shell", poll_rate=dwm_tlv.DEFAULT_POLL_RATE_HZ, use_uwb_mock=False,
+                    replay=None, replay_speed=1.0, metrics=None, anchor_cache=dwm_shell.DEFAULT_CACHE_PATH,
+                    refresh_anchors=False, capture_writer=None):
+    # Returns a not yet started sample source with start/stop/take/stats/clock, plus the anchor positions. The live
+    # sources write every sample to capture_writer before coalescing, a replay is not captured again.
+    if replay:
+        uwb_source = capture.ReplaySource(replay, speed=replay_speed)
+        return uwb_source, uwb_source.anchor_positions()
 
-            return parse[3], parse[4], parse[5]
+    if uwb_mode == "tlv" or use_uwb_mock:
+        if use_uwb_mock:
+            ser = dwm_mock.MockDWM1001Serial()
         else:
-            log(f"could not parse {line.decode()}")
-    return
-
-
-def init(uwb_port, light_port, light_system, use_dmx_mock=False):
-    if light_system not in LIGHT_SYSTEMS:
-        raise ValueError(f"Unknown light system '{light_system}'. Please select from {list(LIGHT_SYSTEMS.keys())}")
-
-    SELECTED_SYSTEM = light_system
+            ser = serial.Serial(port=uwb_port, baudrate=115200, timeout=0.1)
+            print(datetime.datetime.now().strftime("%H:%M:%S"), "Connected to " + ser.name)
+        uwb_source = dwm_tlv.DWM1001TlvTransport(ser, rate_hz=poll_rate, metrics=metrics, capture=capture_writer)
+        return uwb_source, list(uwb_source.loc_get().anchor_positions)
 
-    kfx = kf.KalmanFilter(process_variance=1e-4, estimated_measurement_variance=0.1 ** 4)
-    kfy = kf.KalmanFilter(process_variance=1e-4, estimated_measurement_variance=0.1 ** 4)
-    kfz = kf.KalmanFilter(process_variance=1e-4, estimated_measurement_variance=0.1 ** 4)
+    if uwb_mode != "shell":
+        raise ValueError(f"Unknown UWB mode '{uwb_mode}'. Please select from ['shell', 'tlv']")
 
-    visualizer = uwb_v.UWBVisualizer()
+    ser = serial.Serial(port=uwb_port, baudrate=115200, timeout=0.01)
+    print(datetime.datetime.now().strftime("%H:%M:%S"), "Connected to " + ser.name)
+    shell = dwm_shell.DWM1001Shell(ser, cache=dwm_shell.AnchorCache(anchor_cache) if anchor_cache else None)
+    anchor_positions = shell.initialize(refresh_anchors)
+    logger.info("DWM1001 %s streaming, %d anchors%s", shell.device_key, len(anchor_positions),
+                " (cached)" if shell.anchors_cached else "")
 
-    DWM = DWM1001(port=uwb_port)
+    uwb_source = serial_reader.SerialReader(ser, parse_uwb_line, key=attrgetter("tag_id"), metrics=metrics,
+                                            capture=capture_writer)
+    uwb_source.feed(shell.pending, time.monotonic())
+    return uwb_source, anchor_positions
 
-    time.sleep(1)
-    DWM.send_command("la\r\r")
 
-    time.sleep(1)
-    DWM.send_command("\r\r")
-
-    response_lines = DWM.read_dwm_messages()
-    anchor_positions = parse_anchor_positions(response_lines)
-
-    time.sleep(1)
-    DWM.send_command("lec\r")
-
-    visualizer.update_anchor_positions(anchor_positions)
-    visualizer.load_anchor_colors()
-
-    gui_thread = threading.Thread(target=visualizer.init_visualizer, daemon=True)
-    gui_thread.start()
+def open_dmx_interface(output_type, light_port, use_dmx_mock=False, host=None, universe=None):
+    # universe None is the backend's first universe, 0 for Art-Net and 1 for sACN.
     if use_dmx_mock:
-        dmx_interface = dmx_mock.MockDMXInterface()
-    else:
-        dmx_interface = dmx.DmxPy(light_port)
+        return dmx_mock.MockDMXInterface()
+    if output_type == "artnet":
+        return dmx_network.ArtNetInterface(host, universes=(0 if universe is None else universe,))
+    if output_type == "sacn":
+        return dmx_network.SacnInterface(host, universes=(1 if universe is None else universe,))
+    return dmx.DmxPy(light_port)
+
+
+def init(uwb_port, light_port, light_systems, use_dmx_mock=False, dmx_rate=dmx_scheduler.DEFAULT_RATE_HZ,
+         tag_assignments=None, tag_timeout=2.0, latency=None, fixture_latency=FIXTURE_LATENCY, interpolate=False,
+         min_quality=MIN_QUALITY, gate_threshold=kf.GATE_CHI2_3DOF_999, uwb_mode="shell",
+         poll_rate=dwm_tlv.DEFAULT_POLL_RATE_HZ, use_uwb_mock=False, capture_path=None, replay=None,
+         replay_speed=1.0, metrics_port=None, headless=False, state_port=None, startup=None,
+         anchor_cache=dwm_shell.DEFAULT_CACHE_PATH, refresh_anchors=False, multilaterate=False,
+         poses_path=calibration.DEFAULT_POSES_PATH, dmx_output_type="serial", dmx_host=None, dmx_universe=None,
+         max_speed=None, max_acceleration=None):
+    # metrics_port None leaves the per-stage instrumentation off, otherwise it is served there and shown in the GUI.
+    # headless never imports the visualizer (and so tkinter), state_port serves the tracker state to remote viewers.
+    # max_speed and max_acceleration (degrees per second) or the same light system keys turn on the motion limiter.
+    startup = startup or stage_metrics.StartupTimer()
+    metrics = stage_metrics.Metrics() if metrics_port is not None else stage_metrics.DISABLED
+    timed = metrics.enabled
+
+    if poses_path:
+        calibrated = calibration.load_poses(LIGHT_SYSTEMS, poses_path)
+        if calibrated:
+            logger.info("calibrated poses of %s loaded from %s", calibrated, poses_path)
+    fixture_array = build_fixtures(light_systems)
+
+    filter_bank = kf.ConstantVelocityKalmanFilterBank(process_noise=PROCESS_NOISE, measurement_noise=MEASUREMENT_NOISE,
+                                                      stale_timeout=tag_timeout, gate_threshold=gate_threshold)
+    # latency None means auto: the fixture latency plus the measured delay until a frame leaves the DMX thread.
+    tag_tracker = tracker.TagTracker(fixture_array, filter_bank, tag_assignments,
+                                     latency=fixture_latency if latency is None else latency,
+                                     min_quality=min_quality)
+    motion_limiter = None
+    if max_speed is not None or max_acceleration is not None or motion.configured(LIGHT_SYSTEMS, light_systems):
+        motion_limiter = motion.MotionLimiter.from_light_systems(fixture_array, LIGHT_SYSTEMS, max_speed,
+                                                                 max_acceleration)
+
+    startup.mark("tracker")
+
+    capture_writer = capture.CaptureWriter(capture_path) if capture_path else None
+    uwb_source, anchor_positions = open_uwb_source(uwb_port, uwb_mode, poll_rate, use_uwb_mock, replay, replay_speed,
+                                                   metrics, anchor_cache, refresh_anchors, capture_writer)
+    # Host side positions from the anchor ranges, in place of the module's own where the fit is good.
+    multilaterator = multilateration.Multilaterator(anchor_positions) if multilaterate else None
+    startup.mark("uwb")
+
+    # Whoever wants tracker snapshots, each publish() is a reference swap.
+    snapshot_consumers = []
+    if not headless:
+        import uwb_visualizer as uwb_v
+
+        visualizer = uwb_v.UWBVisualizer()
+        visualizer.update_anchor_positions(anchor_positions)
+        visualizer.load_anchor_colors()
+        if timed:
+            visualizer.metrics = metrics
+        visualizer.calibration = calibration.CalibrationSession(tag_tracker, LIGHT_SYSTEMS, fixture_defaults(),
+                                                                poses_path)
+
+        gui_thread = threading.Thread(target=visualizer.init_visualizer, daemon=True)
+        gui_thread.start()
+        snapshot_consumers.append(visualizer)
+        startup.mark("gui")
+
+    state_output = None
+    if state_port is not None:
+        state_output = state_server.StateServer(port=state_port)
+        state_output.start()
+        snapshot_consumers.append(state_output)
+
+    dmx_interface = open_dmx_interface(dmx_output_type, light_port, use_dmx_mock, dmx_host, dmx_universe)
+
+    dmx_output = dmx_scheduler.DmxRefreshScheduler(dmx_interface, rate_hz=dmx_rate, metrics=metrics,
+                                                   clock=uwb_source.clock)
+    universe = np.frombuffer(dmx_output.back_buffer, dtype=np.uint8)
+
+    if motion_limiter is not None:
+        # The DMX thread steps the fixtures towards their latest targets at every frame, aiming there too when
+        # interpolating. Only the first frame after new targets carries their timestamp for the output delay.
+        def render_frame(now):
+            started = time.perf_counter()
+            if interpolate:
+                values, mask = tag_tracker.dmx_targets(now=now)
+                if values is not None:
+                    motion_limiter.set_targets(values, mask, now)
+            if motion_limiter.write_dmx(universe, now) is not None:
+                dmx_output.publish(motion_limiter.fresh_timestamp)
+            metrics.observe("motion", time.perf_counter() - started)
+
+        dmx_output.frame_callback = render_frame
+    elif interpolate:
+        # The DMX thread aims the fixtures from the filter state at every frame, the loop below only filters.
+        def render_frame(now):
+            started = time.perf_counter()
+            if tag_tracker.write_dmx(universe, now=now) is not None:
+                dmx_output.publish(now)
+            metrics.observe("aim", time.perf_counter() - started)
+
+        dmx_output.frame_callback = render_frame
+    dmx_output.start()
+
+    metrics_server = None
+    if timed:
+        metrics.add_collector("tracker", tag_tracker.stats)
+        metrics.add_collector("uwb", uwb_source.stats)
+        if multilaterator is not None:
+            metrics.add_collector("multilateration", multilaterator.stats)
+        metrics.add_collector("dmx", dmx_output.stats)
+        metrics.add_collector("startup", startup.stats)
+        metrics_server = stage_metrics.MetricsServer(metrics, port=metrics_port)
+        metrics_server.start()
+    startup.mark("dmx")
+    tracking = False
+    next_stats = time.monotonic() + STATS_INTERVAL
+
+    uwb_source.start()
+
+    replay_finished = getattr(uwb_source, "finished", None)
+    stats = None
 
     while True:
-        try:
-            line = DWM.readline()
-            tag_pos = parse_tag_position(line)
-            if tag_pos is None:
-                continue
-            filter_pos = filter_position(kfx, kfy, kfz, tag_pos)
-            visualizer.update_position(filter_pos)
-            relative_pos = (filter_pos[0] - CAM_X, filter_pos[1] - CAM_Y, filter_pos[2] - CAM_Z)
-
-            pan_coarse, pan_fine, tilt_coarse, tilt_fine = uwb_position_to_pan_tilt(relative_pos, PAN_SCALE, PAN_OFFSET,
-                                                                                    TILT_SCALE, TILT_OFFSET,
-                                                                                    LIGHT_SYSTEMS[SELECTED_SYSTEM])
-
-            dmx_interface.set_channel(LIGHT_SYSTEMS[SELECTED_SYSTEM]["pan_channel"], pan_coarse)
-            dmx_interface.set_channel(LIGHT_SYSTEMS[SELECTED_SYSTEM]["pan_fine_channel"], pan_fine)
-            dmx_interface.set_channel(LIGHT_SYSTEMS[SELECTED_SYSTEM]["tilt_channel"], tilt_coarse)
-            dmx_interface.set_channel(LIGHT_SYSTEMS[SELECTED_SYSTEM]["tilt_fine_channel"], tilt_fine)
-
-        except Exception as ex:
-            log(f"exception {ex}")
+        samples = uwb_source.take(timeout=STATS_INTERVAL)
+        now = uwb_source.clock()
+        if not samples and replay_finished is not None and replay_finished.is_set():
+            break
+        if now >= next_stats:
+            stats = {"tracker": tag_tracker.stats(), "uwb": uwb_source.stats(), "dmx": dmx_output.stats()}
+            logger.info("tracker %s, uwb %s", stats["tracker"], stats["uwb"])
+            next_stats = now + STATS_INTERVAL
+
+        located = {}
+        if multilaterator is not None and samples:
+            try:
+                started = time.perf_counter()
+                located = multilaterator.locate(samples)
+                metrics.observe("multilateration", time.perf_counter() - started)
+            except Exception as ex:
+                logger.warning("multilateration exception %s", ex)
+
+        tag_ids, positions, timestamps, qualities = [], [], [], []
+        for key, (timestamp, sample) in samples.items():
+            try:
+                sample = located.get(key, sample)
+                if not sample.has_position:
+                    continue
+                if timed:
+                    # Serial read to pick up: time spent in the reader thread and waiting for this loop.
+                    metrics.observe("uwb_queue", now - timestamp)
+                tag_ids.append(sample.tag_id)
+                positions.append(sample.position)
+                timestamps.append(timestamp)
+                qualities.append(sample.quality)
+            except Exception as ex:
+                logger.warning("exception %s", ex)
+
+        newest = None
+        if tag_ids:
+            try:
+                # Sources coalesce per tag, so the whole batch goes through the filter bank in one call.
+                started = time.perf_counter()
+                accepted, evicted = tag_tracker.update_batch(tag_ids, positions, timestamps, qualities)
+                metrics.observe("filter", time.perf_counter() - started)
+                if evicted:
+                    logger.info("evicted stale tags %s", evicted)
+                if accepted.any():
+                    newest = max(timestamp for timestamp, ok in zip(timestamps, accepted) if ok)
+            except Exception as ex:
+                logger.warning("exception %s", ex)
+
+        if newest is None:
             continue
-
-    DWM.send_command("\r")
-    DWM.close()
-
-
-def filter_position(kfx, kfy, kfz, tag_pos):
-    kfx.input_latest_noisy_measurement(float(tag_pos[0]))
-    kfy.input_latest_noisy_measurement(float(tag_pos[1]))
-    kfz.input_latest_noisy_measurement(float(tag_pos[2]))
-    return kfx.get_latest_estimated_measurement(), kfy.get_latest_estimated_measurement(), kfz.get_latest_estimated_measurement()
-
-
-def log(line):
-    if TERMINAL_LOGGING:
-        print(datetime.datetime.now().strftime("%H:%M:%S"), line)
-    logging.info(line)
-
-
-def calculate_distance(x, y, z):
-    return math.sqrt(x ** 2 + y ** 2 + z ** 2)
-
-
-def calculate_pan(x, y, pan_scale, pan_offset):
-    return math.degrees(math.atan2(y, x)) * pan_scale + pan_offset
-
-
-def calculate_tilt(z, distance, tilt_scale, tilt_offset):
-    return math.degrees(math.atan2(z, distance)) * tilt_scale + tilt_offset
-
-
-def calculate_dmx_value(angle, max_angle, dmx_range):
-    return int(angle * dmx_range / max_angle)
-
-
-def calculate_fine_dmx_value(angle, max_angle, coarse_value, dmx_range):
-    return int((angle * dmx_range / max_angle - coarse_value) * 256)
-
-
-def uwb_position_to_pan_tilt(filter_pos, pan_scale, pan_offset, tilt_scale, tilt_offset, sel_light_system):
-    x, y, z = filter_pos
-    distance = calculate_distance(x, y, z)
-
-    pan = calculate_pan(x, y, pan_scale, pan_offset)
-    tilt = calculate_tilt(z, distance, tilt_scale, tilt_offset)
-
-    pan_range = sel_light_system["pan_range"]
-    tilt_range = sel_light_system["tilt_range"]
-    pan_dmx_range = sel_light_system["pan_dmx_range"]
-    tilt_dmx_range = sel_light_system["tilt_dmx_range"]
-
-    pan = max(min(pan, pan_range[1]), pan_range[0])
-    tilt = max(min(tilt, tilt_range[1]), tilt_range[0])
-
-    log(f"pan: {pan}, tilt: {tilt}")
-
-    pan_coarse, pan_fine, tilt_coarse, tilt_fine = get_pan_and_tilt(pan, pan_dmx_range, pan_range, tilt, tilt_dmx_range,
-                                                                    tilt_range)
-
-    return pan_coarse, pan_fine, tilt_coarse, tilt_fine
-
-
-def send_dmx(light_system, dmx_port):
-    if light_system not in LIGHT_SYSTEMS:
-        raise ValueError(f"Unknown light system '{light_system}'. Please select from {list(LIGHT_SYSTEMS.keys())}")
-    sel_light_system = LIGHT_SYSTEMS[light_system]
-
-    dmx_i = dmx.DmxPy(dmx_port)
-
-    pan_range = sel_light_system["pan_range"]
-    tilt_range = sel_light_system["tilt_range"]
-    pan_dmx_range = sel_light_system["pan_dmx_range"]
-    tilt_dmx_range = sel_light_system["tilt_dmx_range"]
-
-    pan = max(min(0, pan_range[1]), pan_range[0])
-    tilt = max(min(0, tilt_range[1]), tilt_range[0])
-
-    pan_coarse, pan_fine, tilt_coarse, tilt_fine = get_pan_and_tilt(pan, pan_dmx_range, pan_range, tilt, tilt_dmx_range,
-                                                                    tilt_range)
-
-    log(f"sending test dmx values over channels: c: {LIGHT_SYSTEMS[light_system]['pan_channel']}: pan coarse: {pan_coarse}, "
-        f" {LIGHT_SYSTEMS[light_system]['pan_fine_channel']}: pan fine: {pan_fine}, "
-        f" {LIGHT_SYSTEMS[light_system]['tilt_channel']}: tilt coarse: {tilt_coarse}, "
-        f" {LIGHT_SYSTEMS[light_system]['tilt_fine_channel']}: tilt fine: {tilt_fine}")
-
-    dmx_i.set_channel(LIGHT_SYSTEMS[light_system]["pan_channel"], pan_coarse)
-    dmx_i.set_channel(LIGHT_SYSTEMS[light_system]["pan_fine_channel"], pan_fine)
-    dmx_i.set_channel(LIGHT_SYSTEMS[light_system]["tilt_channel"], tilt_coarse)
-    dmx_i.set_channel(LIGHT_SYSTEMS[light_system]["tilt_fine_channel"], tilt_fine)
-    dmx_i.update_lighting()
-
-
-def get_pan_and_tilt(pan, pan_dmx_range, pan_range, tilt, tilt_dmx_range, tilt_range):
-    pan_coarse = calculate_dmx_value(pan, pan_range[1], pan_dmx_range[1])
-    pan_fine = calculate_fine_dmx_value(pan, pan_range[1], pan_coarse, pan_dmx_range[1])
-    tilt_coarse = calculate_dmx_value(tilt, tilt_range[1], tilt_dmx_range[1])
-    tilt_fine = calculate_fine_dmx_value(tilt, tilt_range[1], tilt_coarse, tilt_dmx_range[1])
-    return pan_coarse, pan_fine, tilt_coarse, tilt_fine
+        if not tracking:
+            startup.mark("first_position")
+            logger.info("%s", startup.report())
+            print(datetime.datetime.now().strftime("%H:%M:%S"), startup.report())
+            tracking = True
+        if snapshot_consumers:
+            # One snapshot per batch, the GUI picks up whichever is current when it redraws.
+            snapshot = tag_tracker.snapshot(newest, stats)
+            for consumer in snapshot_consumers:
+                consumer.publish(snapshot)
+        if latency is None:
+            tag_tracker.latency = fixture_latency + dmx_output.output_delay
+        if motion_limiter is not None and not interpolate:
+            try:
+                started = time.perf_counter()
+                values, mask = tag_tracker.dmx_targets(now=now)
+                if values is not None:
+                    motion_limiter.set_targets(values, mask, newest)
+                metrics.observe("aim", time.perf_counter() - started)
+            except Exception as ex:
+                logger.warning("exception %s", ex)
+        elif not interpolate:
+            try:
+                if timed:
+                    started = time.perf_counter()
+                    tag_tracker.write_dmx(universe, now=now)
+                    metrics.observe("aim", time.perf_counter() - started)
+                else:
+                    tag_tracker.write_dmx(universe, now=now)
+                dmx_output.publish(newest)
+                if timed:
+                    metrics.observe("pipeline", uwb_source.clock() - newest)
+            except Exception as ex:
+                logger.warning("exception %s", ex)
+
+    logger.info("tracker %s, uwb %s, dmx %s", tag_tracker.stats(), uwb_source.stats(), dmx_output.stats())
+    uwb_source.stop()
+    dmx_output.stop()
+    dmx_interface.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if state_output is not None:
+        state_output.stop()
+    if capture_writer is not None:
+        capture_writer.close()
+
+
+def send_dmx(light_systems, dmx_port):
+    unknown = [light_system for light_system in light_systems if light_system not in LIGHT_SYSTEMS]
+    if unknown:
+        raise ValueError(f"Unknown light system(s) {unknown}. Please select from {list(LIGHT_SYSTEMS.keys())}")
+
+    with dmx.DmxPy(dmx_port) as dmx_i:
+        for light_system in light_systems:
+            fixture = fixtures.Fixture.compile(light_system, LIGHT_SYSTEMS[light_system])
+            pan_channel, pan_fine_channel, tilt_channel, tilt_fine_channel = fixture.channels
+            pan_coarse, pan_fine, tilt_coarse, tilt_fine = fixture.dmx_values(0, 0)
+
+            logger.info("sending test dmx values over channels: c: %s: pan coarse: %s,  %s: pan fine: %s,  "
+                        "%s: tilt coarse: %s,  %s: tilt fine: %s", pan_channel, pan_coarse, pan_fine_channel,
+                        pan_fine, tilt_channel, tilt_coarse, tilt_fine_channel, tilt_fine)
+
+            dmx_i.set_channel(pan_channel, pan_coarse)
+            dmx_i.set_channel(pan_fine_channel, pan_fine)
+            dmx_i.set_channel(tilt_channel, tilt_coarse)
+            dmx_i.set_channel(tilt_fine_channel, tilt_fine)
+        dmx_i.update_lighting()
 
 
 def main():
-
-    logging.basicConfig(filename='../uwb_data.log', level=logging.INFO, format='%(asctime)s - %(message)s',
-                        datefmt='%Y-%m-%d %H:%M:%S')
-    logging.info("Starting logging...")
+    startup = stage_metrics.StartupTimer(PROCESS_STARTED)
+    startup.mark("imports")
 
     parser = argparse.ArgumentParser(description="Track positions of a UWB tag and send pan&tilt through a dmx interface")
     parser.add_argument("-s", "--send_dmx", action="store_true", help="Exec dmx send script")
     parser.add_argument("-dm", "--use-dmx-mock", action="store_true", help="Use DMX mock interface")
     parser.add_argument("-dp", "--dmx-port", default="/dev/ttyUSB0", help="Serial port for light interface (DMX)")
+    parser.add_argument("-do", "--dmx-output", choices=["serial", "artnet", "sacn"], default="serial",
+                        help="Send DMX through the USB serial widget on --dmx-port or over the network")
+    parser.add_argument("-dh", "--dmx-host",
+                        help="Art-Net node or sACN receiver address, default broadcast (Art-Net) or multicast (sACN)")
+    parser.add_argument("-du", "--dmx-universe", type=int,
+                        help="Network universe the fixtures are patched on, default 0 for Art-Net and 1 for sACN")
     parser.add_argument("-up", "--uwb-port", default="/dev/ttyACM0", help="Serial port for UWB Positioning (DWM1000)")
-    parser.add_argument("-l", "--light_system", default="BadBoy", help="Light system")
+    parser.add_argument("-um", "--use-uwb-mock", action="store_true",
+                        help="Use a simulated DWM1001 walking in circles (implies --uwb-mode tlv)")
+    parser.add_argument("-m", "--uwb-mode", choices=["shell", "tlv"], default="shell",
+                        help="Read positions from the shell lec stream or poll the binary UART API")
+    parser.add_argument("-pr", "--poll-rate", type=float, default=dwm_tlv.DEFAULT_POLL_RATE_HZ,
+                        help="dwm_loc_get polls per second in tlv mode")
+    parser.add_argument("-ac", "--anchor-cache", default=dwm_shell.DEFAULT_CACHE_PATH,
+                        help="Anchor positions per DWM1001 network, read at startup instead of asking the tag "
+                             "(shell mode). Empty to always ask")
+    parser.add_argument("-ra", "--refresh-anchors", action="store_true",
+                        help="Ask the tag for the anchor list and update the cache, after moving anchors")
+    parser.add_argument("-ml", "--multilaterate", action="store_true",
+                        help="Solve tag positions from the anchor ranges on the host instead of using the module's")
+    parser.add_argument("-fp", "--fixture-poses", default=calibration.DEFAULT_POSES_PATH,
+                        help="Fixture poses saved by the calibration tab, loaded over LIGHT_SYSTEMS at startup. "
+                             "Empty to ignore")
+    parser.add_argument("-c", "--capture", help="Append every parsed UWB sample to this binary capture file")
+    parser.add_argument("-rp", "--replay", help="Replay a capture file instead of reading the UWB port")
+    parser.add_argument("-rs", "--replay-speed", type=float, default=1.0,
+                        help="Replay speed, 1 is real time, 0 as fast as the tracker keeps up")
+    parser.add_argument("-mp", "--metrics-port", type=int, nargs="?", const=stage_metrics.DEFAULT_PORT,
+                        help=f"Time every pipeline stage and serve Prometheus metrics on localhost, "
+                             f"port {stage_metrics.DEFAULT_PORT} unless given")
+    parser.add_argument("-hl", "--headless", action="store_true",
+                        help="Run without the visualizer, tkinter is never imported")
+    parser.add_argument("-sp", "--state-port", type=int, nargs="?", const=state_server.DEFAULT_PORT,
+                        help=f"Stream tracker state as JSON lines on localhost, port {state_server.DEFAULT_PORT} "
+                             f"unless given")
+    parser.add_argument("-r", "--log-raw", action="store_true", help="Log every raw line read from the UWB port")
+    parser.add_argument("-lf", "--log-file", default="../uwb_data.log", help="Text log file")
+    parser.add_argument("-ll", "--log-level", choices=["debug", "info", "warning"], default="info",
+                        help="debug also logs every pan/tilt pair and DMX channel write")
+    parser.add_argument("-lr", "--log-rate", type=float, default=log_utils.DEFAULT_RATE,
+                        help="Text log records per second allowed per message, the rest are counted and dropped")
+    parser.add_argument("-sl", "--structured-log",
+                        help="Also write every record, unlimited, to this binary log (see log_utils.read_structured_log)")
+    parser.add_argument("-l", "--light_system", default="BadBoy",
+                        help="Light system, a comma separated list of light systems or 'all'")
+    parser.add_argument("-dr", "--dmx-rate", type=float, default=dmx_scheduler.DEFAULT_RATE_HZ,
+                        help="DMX frames per second sent to the light interface")
+    parser.add_argument("-a", "--assign", default="",
+                        help="Tag per light system, e.g. BadBoy=14A2,Sparky=0C31. Unassigned lights follow the "
+                             "latest tag")
+    parser.add_argument("-tt", "--tag-timeout", type=float, default=2.0,
+                        help="Seconds without updates before a tag stops being tracked")
+    parser.add_argument("-lt", "--latency", default="auto",
+                        help="Seconds to aim ahead of the performer, or 'auto' to use the fixture latency plus the "
+                             "measured DMX output delay")
+    parser.add_argument("-fl", "--fixture-latency", type=float, default=FIXTURE_LATENCY,
+                        help="UWB plus moving head response time in seconds, used by --latency auto")
+    parser.add_argument("-i", "--interpolate", action="store_true",
+                        help="Aim the fixtures from the DMX thread at every frame instead of once per UWB sample")
+    parser.add_argument("-ms", "--max-speed", type=float,
+                        help="Limit pan and tilt to this many degrees per second, stepped at the DMX rate. Light "
+                             "system max_speed keys override it")
+    parser.add_argument("-ma", "--max-acceleration", type=float,
+                        help="Limit pan and tilt acceleration to this many degrees per second squared, light system "
+                             "max_acceleration keys override it")
+    parser.add_argument("-mq", "--min-quality", type=int, default=MIN_QUALITY,
+                        help="Drop positions whose DWM1001 quality factor is below this value")
+    parser.add_argument("-g", "--gate", type=float, default=kf.GATE_CHI2_3DOF_999,
+                        help="Reject positions further than this squared Mahalanobis distance from the prediction, "
+                             "0 disables gating")
 
     args = parser.parse_args()
 
-    log(f"Starting UWB Positioning and DMX interface with args: {args}")
+    log_utils.setup(filename=args.log_file, level=getattr(logging, args.log_level.upper()),
+                    terminal=TERMINAL_LOGGING, structured_path=args.structured_log, rate=args.log_rate,
+                    limits={RAW_LOG_FORMAT: None})
+    logger.info("Starting logging...")
+    logger.info("Starting UWB Positioning and DMX interface with args: %s", args)
+
+    global RAW_LOGGING
+    RAW_LOGGING = args.log_raw
+
+    light_systems = parse_light_systems(args.light_system)
 
     if args.send_dmx:
-        send_dmx(light_system=args.light_system, dmx_port=args.dmx_port)
+        send_dmx(light_systems=light_systems, dmx_port=args.dmx_port)
     else:
-        init(uwb_port=args.uwb_port, light_port=args.dmx_port, light_system=args.light_system,
-             use_dmx_mock=args.use_dmx_mock)
+        init(uwb_port=args.uwb_port, light_port=args.dmx_port, light_systems=light_systems,
+             use_dmx_mock=args.use_dmx_mock, dmx_rate=args.dmx_rate,
+             tag_assignments=tracker.parse_assignments(args.assign), tag_timeout=args.tag_timeout,
+             latency=parse_latency(args.latency), fixture_latency=args.fixture_latency,
+             interpolate=args.interpolate, min_quality=args.min_quality, gate_threshold=args.gate or None,
+             uwb_mode=args.uwb_mode, poll_rate=args.poll_rate, use_uwb_mock=args.use_uwb_mock,
+             capture_path=args.capture, replay=args.replay, replay_speed=args.replay_speed,
+             metrics_port=args.metrics_port, headless=args.headless, state_port=args.state_port,
+             startup=startup, anchor_cache=args.anchor_cache, refresh_anchors=args.refresh_anchors,
+             multilaterate=args.multilaterate, poses_path=args.fixture_poses, dmx_output_type=args.dmx_output,
+             dmx_host=args.dmx_host, dmx_universe=args.dmx_universe, max_speed=args.max_speed,
+             max_acceleration=args.max_acceleration)
 
 
 if __name__ == "__main__":
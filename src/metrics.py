@@ -0,0 +1,174 @@
+import threading
+import time
+import logging
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds in seconds, doubling from 10 us to about 10 s. Memory per stage is fixed no matter how long we run.
+LATENCY_BUCKETS = tuple(1e-5 * 2 ** i for i in range(21))
+DEFAULT_PORT = 9108
+NAMESPACE = "seguidor"
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation, the same estimate Prometheus'
+        # histogram_quantile makes.
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[index - 1] if index else 0.0
+                return lower + (self.bounds[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class Metrics:
+    # Stage latencies are observed from several threads, each stage from only one of them. Scrapes read the
+    # counts without a lock, at worst a scrape sees an observation in count but not yet in sum.
+    def __init__(self, enabled=True, bounds=LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.bounds = bounds
+        self.stages = {}
+        self.collectors = []
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram(self.bounds)
+        histogram.observe(seconds)
+
+    def add_collector(self, name, collect):
+        # collect() returns a stats dict, its numeric values are exported as gauges at scrape time only.
+        self.collectors.append((name, collect))
+
+    def render(self):
+        lines = [f"# HELP {NAMESPACE}_stage_seconds Latency of each tracking pipeline stage.",
+                 f"# TYPE {NAMESPACE}_stage_seconds histogram"]
+        for stage, histogram in sorted(list(self.stages.items())):
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{NAMESPACE}_stage_seconds_bucket{{stage="{stage}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{NAMESPACE}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{NAMESPACE}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.9g}')
+            lines.append(f'{NAMESPACE}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        for name, collect in self.collectors:
+            try:
+                stats = collect()
+            except Exception as ex:
+                logger.warning("metrics collector %s exception %s", name, ex)
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)):
+                    metric = f"{NAMESPACE}_{name}_{key}"
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {float(value):.9g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        # One line for the visualizer status bar, p50/p99 per stage in milliseconds.
+        parts = []
+        for stage, histogram in sorted(list(self.stages.items())):
+            if histogram.count:
+                parts.append(f"{stage} {histogram.quantile(0.5) * 1000:.2f}/{histogram.quantile(0.99) * 1000:.2f}")
+        return "p50/p99 ms  " + "  ".join(parts) if parts else "no samples yet"
+
+
+DISABLED = Metrics(enabled=False)
+
+
+class StartupTimer:
+    # Wall time per startup phase, each mark() closes the phase that started at the previous one.
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.last = self.started
+        self.phases = {}
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    @property
+    def total(self):
+        return self.last - self.started
+
+    def stats(self):
+        return {f"{phase}_seconds": seconds for phase, seconds in self.phases.items()} | \
+            {"total_seconds": self.total}
+
+    def report(self):
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases.items())
+        return f"startup {self.total * 1000:.0f} ms: {phases}"
+
+
+class MetricsServer:
+    # Serves Metrics.render() as Prometheus text on http://host:port/metrics from a daemon thread.
+    def __init__(self, metrics, host="127.0.0.1", port=DEFAULT_PORT):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.metrics = metrics
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        logger.info("serving metrics on http://%s:%d/metrics", self.server.server_address[0], self.port)
+
+    def stop(self):
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
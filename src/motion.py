@@ -0,0 +1,124 @@
+import logging
+
+import numpy as np
+
+import fixtures
+
+logger = logging.getLogger(__name__)
+
+
+MAX_STEP = 0.1  # s, a stalled DMX thread resumes from here instead of jumping by the whole gap
+SETTLED = 0.5  # 16 bit DMX steps, closer than this to the target with no speed left is at rest
+LIMIT_KEYS = ("max_speed", "max_acceleration")
+
+
+def configured(light_systems, names):
+    return any(key in light_systems[name] for name in names for key in LIMIT_KEYS)
+
+
+def per_fixture(limits, count):
+    # One limit per fixture, each a number for both axes or a (pan, tilt) pair, as (2, count) pan and tilt rows.
+    # None and 0 are no limit.
+    limits = [None] * count if limits is None else list(limits)
+    if len(limits) != count:
+        raise ValueError(f"Invalid motion limits {limits}, expected one per fixture ({count})")
+    rows = np.empty((2, count))
+    for column, limit in enumerate(limits):
+        if limit is None or np.ndim(limit) == 0:
+            limit = (limit, limit)
+        for row, value in enumerate(limit):
+            rows[row, column] = np.inf if not value else float(value)
+    if (rows <= 0).any():
+        raise ValueError(f"Invalid motion limits {limits}, they must be greater than 0")
+    return rows
+
+
+class MotionLimiter:
+    # Motion profile of every fixture in the 16 bit DMX domain, between the aimed pan/tilt values and the universe.
+    # Each DMX frame moves the commanded values towards the latest targets with at most max_speed and changes speed
+    # by at most max_acceleration, braking in time to stop on the target instead of overshooting it. Limits are given
+    # in degrees per second (squared) and converted with each fixture's DMX scale, so they read like the moving
+    # head's data sheet.
+    #
+    # set_targets() swaps a single reference and may be called from another thread than step()/write_dmx(), which
+    # run on the DMX thread. Channels and scales are taken once, a recalibrated fixture only changes its pose.
+    def __init__(self, fixture_array, max_speeds=None, max_accelerations=None):
+        count = len(fixture_array)
+        scales = np.abs(np.stack((fixture_array.pan_dmx_scales, fixture_array.tilt_dmx_scales)))
+        self.max_speed = per_fixture(max_speeds, count) * scales
+        self.max_acceleration = per_fixture(max_accelerations, count) * scales
+        self.channels = fixture_array.channels
+
+        # The universe starts at zero and the heads go there, which is also where an unaimed fixture is assumed.
+        self.positions = fixture_array.dmx_positions(fixture_array.pan, fixture_array.tilt)
+        self.velocities = np.zeros((2, count))
+        self.targets = (self.positions.copy(), np.zeros(count, dtype=bool), None)
+        self.fresh_timestamp = None
+        self.last_step = None
+        self._seen_targets = None
+
+    @classmethod
+    def from_light_systems(cls, fixture_array, light_systems, max_speed=None, max_acceleration=None):
+        # Light system "max_speed" and "max_acceleration" keys override the given defaults per fixture.
+        systems = [light_systems[name] for name in fixture_array.names]
+        return cls(fixture_array, [system.get("max_speed", max_speed) for system in systems],
+                   [system.get("max_acceleration", max_acceleration) for system in systems])
+
+    def set_targets(self, values, mask=None, timestamp=None):
+        # values (2, N) as from TagTracker.dmx_targets, fixtures outside mask keep heading for their last target.
+        targets, active, _ = self.targets
+        targets = targets.copy()
+        active = active.copy()
+        if mask is None:
+            targets[:] = values
+            active[:] = True
+        else:
+            targets[:, mask] = values[:, mask]
+            active |= mask
+        self.targets = (targets, active, timestamp)
+
+    def step(self, dt):
+        # Advances every fixture by dt seconds and returns the new positions (2, N).
+        published = self.targets
+        self.fresh_timestamp = published[2] if published is not self._seen_targets else None
+        self._seen_targets = published
+        if dt <= 0:
+            return self.positions
+        dt = min(dt, MAX_STEP)
+        targets = published[0]
+
+        error = targets - self.positions
+        distance = np.abs(error)
+        limit = self.max_acceleration * dt
+        # Fastest speed that still stops on the target when every later frame slows down by limit. Stopping from
+        # speed v takes frames = ceil(v / limit) and covers frames * v - frames * (frames - 1) / 2 * limit in steps of
+        # dt, solved here for v given the distance.
+        units = distance / (limit * dt)
+        frames = np.maximum(np.ceil((np.sqrt(1.0 + 8.0 * units) - 1.0) / 2.0), 1.0)
+        braking = distance / (frames * dt)
+        braking += np.multiply(frames - 1.0, limit / 2.0, out=np.zeros_like(braking), where=frames > 1.0)
+
+        change = np.copysign(np.minimum(braking, self.max_speed), error) - self.velocities
+        self.velocities += np.minimum(np.maximum(change, -limit), limit)
+        self.positions += self.velocities * dt
+
+        settled = (distance <= SETTLED) & (np.abs(self.velocities) * dt <= SETTLED)
+        self.positions[settled] = targets[settled]
+        self.velocities[settled] = 0.0
+        np.minimum(np.maximum(self.positions, 0.0, out=self.positions), fixtures.DMX_16BIT_MAX, out=self.positions)
+        return self.positions
+
+    def moving(self):
+        return bool((self.velocities != 0.0).any() or (self.positions != self.targets[0]).any())
+
+    def write_dmx(self, universe, now):
+        # Steps to now and writes the fixtures that have had a target into universe, returns None while none has.
+        dt = 0.0 if self.last_step is None else now - self.last_step
+        self.last_step = now
+        positions = self.step(dt)
+        active = self._seen_targets[1]
+        if not active.any():
+            return None
+        values = fixtures.split_dmx(positions.T.astype(np.int32))
+        universe[self.channels[active]] = values[active]
+        return values
@@ -0,0 +1,141 @@
+import logging
+
+import numpy as np
+
+import lec_parser
+
+logger = logging.getLogger(__name__)
+
+
+ITERATIONS = 8
+TOLERANCE = 1e-4  # m, iterations stop once every step is smaller
+DAMPING = 1e-6  # keeps the normal equations solvable when all anchors hang at the same height
+MIN_ANCHORS = 3
+MAX_RESIDUAL = 0.3  # m rms, worse solutions are dropped and the module's own position is used instead
+INITIAL_HEIGHT = 1.2  # m, a tag without a previous solution is first looked for at chest height below the anchors
+
+
+def gauss_newton(anchors, distances, initial, mask=None, iterations=ITERATIONS, tolerance=TOLERANCE,
+                 damping=DAMPING):
+    # Range only least squares for a batch of tags at once: anchors (B, K, 3), distances (B, K), initial (B, 3) and
+    # mask (B, K) marking the usable ranges when tags have different anchor counts. Anchors in one plane leave a
+    # mirror solution on the other side of it, the initial position picks the side.
+    # Returns the positions (B, 3) and rms range residuals (B,) in metres.
+    anchors = np.asarray(anchors, dtype=float)
+    distances = np.asarray(distances, dtype=float)
+    weights = np.ones(distances.shape) if mask is None else np.asarray(mask, dtype=float)
+    distances = np.where(weights > 0, distances, 0.0)
+    position = np.array(initial, dtype=float).reshape(-1, 3)
+    regularization = np.eye(3) * damping
+
+    for _ in range(iterations):
+        offsets = position[:, None, :] - anchors
+        ranges = np.maximum(np.sqrt(np.einsum("bki,bki->bk", offsets, offsets)), 1e-9)
+        jacobian = offsets / ranges[:, :, None]
+        weighted = (jacobian * weights[:, :, None]).transpose(0, 2, 1)
+        normal = np.matmul(weighted, jacobian) + regularization
+        gradient = np.matmul(weighted, (ranges - distances)[:, :, None])
+        step = np.linalg.solve(normal, gradient)[:, :, 0]
+        position -= step
+        if np.abs(step).max() < tolerance:
+            break
+
+    offsets = position[:, None, :] - anchors
+    residuals = (np.sqrt(np.einsum("bki,bki->bk", offsets, offsets)) - distances) * weights
+    counts = np.maximum(weights.sum(axis=1), 1.0)
+    return position, np.sqrt(np.einsum("bk,bk->b", residuals, residuals) / counts)
+
+
+class Multilaterator:
+    # Solves tag positions on the host from the anchor ranges of lec lines or TLV samples. Anchor positions are
+    # learned by id from every sample that carries them, so ranges that arrive without positions still count and
+    # there is no limit on the number of anchors. Each tag starts from its previous solution, a new tag from the
+    # module's own position or, without one, below the middle of anchor_positions.
+    def __init__(self, anchor_positions=None, known_anchors=None, min_anchors=MIN_ANCHORS, max_residual=MAX_RESIDUAL,
+                 initial_height=INITIAL_HEIGHT, iterations=ITERATIONS):
+        if min_anchors < 3:
+            raise ValueError(f"Invalid min_anchors {min_anchors}, at least 3 ranges are needed for a position")
+        self.anchors = dict(known_anchors or {})
+        self.min_anchors = min_anchors
+        self.max_residual = max_residual
+        self.iterations = iterations
+        self.estimates = {}
+        self.solved = 0
+        self.rejected = 0
+        self.skipped = 0
+
+        self.initial = np.array((0.0, 0.0, initial_height))
+        if anchor_positions:
+            center = np.mean(np.asarray(anchor_positions, dtype=float), axis=0)
+            self.initial[:2] = center[:2]
+
+    def stats(self):
+        return {"solved": self.solved, "rejected": self.rejected, "skipped": self.skipped,
+                "anchors": len(self.anchors)}
+
+    def ranges(self, sample):
+        # (anchor positions, distances) of every range whose anchor position is known.
+        positions, distances = [], []
+        for i, (anchor_id, distance) in enumerate(zip(sample.anchor_ids, sample.distances)):
+            if i < len(sample.anchor_positions):
+                position = self.anchors[anchor_id] = sample.anchor_positions[i]
+            else:
+                position = self.anchors.get(anchor_id)
+                if position is None:
+                    continue
+            positions.append(position)
+            distances.append(distance)
+        return positions, distances
+
+    def initial_position(self, sample):
+        estimate = self.estimates.get(sample.tag_id)
+        if estimate is not None:
+            return estimate
+        if sample.has_position:
+            return sample.position
+        return self.initial
+
+    def locate(self, samples):
+        # samples is {key: (timestamp, sample)} as taken from a source. Returns {key: sample} with a host solved
+        # position for every sample that had enough ranges and a good enough fit, all of them solved as one batch.
+        keys, problems = [], []
+        for key, (timestamp, sample) in samples.items():
+            if not sample.distances:
+                continue
+            positions, distances = self.ranges(sample)
+            if len(distances) < self.min_anchors:
+                self.skipped += 1
+                continue
+            keys.append(key)
+            problems.append((sample, positions, distances))
+        if not problems:
+            return {}
+
+        size = max(len(distances) for _, _, distances in problems)
+        anchors = np.zeros((len(problems), size, 3))
+        distances = np.zeros((len(problems), size))
+        mask = np.zeros((len(problems), size))
+        initial = np.empty((len(problems), 3))
+        for row, (sample, sample_positions, sample_distances) in enumerate(problems):
+            count = len(sample_distances)
+            anchors[row, :count] = sample_positions
+            distances[row, :count] = sample_distances
+            mask[row, :count] = 1.0
+            initial[row] = self.initial_position(sample)
+
+        positions, residuals = gauss_newton(anchors, distances, initial, mask, self.iterations)
+
+        located = {}
+        for key, (sample, _, _), position, residual in zip(keys, problems, positions, residuals):
+            if not residual <= self.max_residual:
+                # Also drops the warm start, a bad fit is more likely to have converged to the mirror solution.
+                self.estimates.pop(sample.tag_id, None)
+                self.rejected += 1
+                logger.debug("tag %s range fit residual %.3f m rejected", sample.tag_id, residual)
+                continue
+            x, y, z = (float(axis) for axis in position)
+            self.estimates[sample.tag_id] = (x, y, z)
+            located[key] = lec_parser.TagSample(sample.tag_id, x, y, z, sample.quality, sample.anchor_ids,
+                                                sample.anchor_positions, sample.distances)
+            self.solved += 1
+        return located
@@ -0,0 +1,201 @@
+import threading
+import time
+import logging
+from operator import itemgetter
+
+from metrics import DISABLED
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CAPACITY = 4096
+
+
+class LineRingBuffer:
+    # Fixed size byte ring that frames \n terminated lines. When the reader outpaces the consumer the oldest bytes
+    # are overwritten and the line they belonged to is dropped instead of being handed out truncated.
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.buffer = bytearray(capacity)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.overflow_bytes = 0
+        self.dropped_lines = 0
+        self._resync = False
+
+    def __len__(self):
+        return self.size
+
+    def write(self, data):
+        n = len(data)
+        if n >= self.capacity:
+            self.overflow_bytes += self.size + n - self.capacity
+            data = data[n - self.capacity:]
+            n = self.capacity
+            self.start = 0
+            self.size = 0
+            self._resync = True
+        elif n > self.capacity - self.size:
+            drop = n - (self.capacity - self.size)
+            self.overflow_bytes += drop
+            self.start = (self.start + drop) % self.capacity
+            self.size -= drop
+            self._resync = True
+
+        end = (self.start + self.size) % self.capacity
+        first = min(n, self.capacity - end)
+        self.buffer[end:end + first] = data[:first]
+        if first < n:
+            self.buffer[:n - first] = data[first:]
+        self.size += n
+
+    def readline(self):
+        while True:
+            end = self.start + self.size
+            if end <= self.capacity:
+                newline = self.buffer.find(b"\n", self.start, end)
+            else:
+                newline = self.buffer.find(b"\n", self.start, self.capacity)
+                if newline < 0:
+                    newline = self.buffer.find(b"\n", 0, end - self.capacity)
+            if newline < 0:
+                return None
+
+            if newline >= self.start:
+                line = bytes(self.buffer[self.start:newline + 1])
+            else:
+                line = bytes(self.buffer[self.start:]) + bytes(self.buffer[:newline + 1])
+
+            consumed = len(line)
+            self.start = (self.start + consumed) % self.capacity
+            self.size -= consumed
+
+            if self._resync:
+                # Head of this line was overwritten.
+                self._resync = False
+                self.dropped_lines += 1
+                continue
+            return line
+
+
+class LatestSamples:
+    # Keeps only the newest sample per key between takes, older ones are counted as coalesced. Once closed a take()
+    # with nothing pending returns straight away instead of waiting out its timeout.
+    def __init__(self):
+        self._pending = {}
+        self._condition = threading.Condition()
+        self.received = 0
+        self.coalesced = 0
+        self.closed = False
+
+    def put(self, key, sample):
+        with self._condition:
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = sample
+            self.received += 1
+            self._condition.notify_all()
+
+    def take(self, timeout=None):
+        with self._condition:
+            if not self._pending and not self.closed:
+                self._condition.wait(timeout)
+            pending, self._pending = self._pending, {}
+            self._condition.notify_all()
+        return pending
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def wait_taken(self, timeout=None):
+        # Producer side back pressure, True once everything put so far has been taken.
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending, timeout)
+
+
+class SerialReader:
+    # Pulls raw bytes off the port on its own thread so the tracker never blocks on readline and never works
+    # through a backlog: parse turns a line into a record (or None) and key picks the tag it belongs to. capture, a
+    # capture.CaptureWriter, gets every record as it is parsed, before take() coalesces them.
+    def __init__(self, ser, parse, key=itemgetter(0), capacity=DEFAULT_CAPACITY, read_size=256, metrics=None,
+                 capture=None):
+        self.ser = ser
+        self.parse = parse
+        self.metrics = metrics or DISABLED
+        self.capture = capture
+        self.key = key
+        self.read_size = read_size
+        self.ring = LineRingBuffer(capacity)
+        self.samples = LatestSamples()
+        self.lines = 0
+        self.unparsed = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="uwb-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def clock(self):
+        return time.monotonic()
+
+    def take(self, timeout=None):
+        # {tag: (timestamp, record)} with the newest record of every tag seen since the previous take.
+        return self.samples.take(timeout)
+
+    def feed(self, data, timestamp):
+        self.ring.write(data)
+        timed = self.metrics.enabled
+        while True:
+            line = self.ring.readline()
+            if line is None:
+                return
+            self.lines += 1
+            if timed:
+                started = time.perf_counter()
+                record = self.parse(line)
+                self.metrics.observe("parse", time.perf_counter() - started)
+            else:
+                record = self.parse(line)
+            if record is None:
+                self.unparsed += 1
+                continue
+            if self.capture is not None:
+                self.capture.write(timestamp, record)
+            self.samples.put(self.key(record), (timestamp, record))
+
+    def stats(self):
+        return {"lines": self.lines,
+                "unparsed": self.unparsed,
+                "coalesced": self.samples.coalesced,
+                "dropped_lines": self.ring.dropped_lines,
+                "overflow_bytes": self.ring.overflow_bytes}
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                data = self.ser.read(max(1, min(self.ser.in_waiting, self.read_size)))
+            except Exception as ex:
+                logger.warning("uwb reader exception %s", ex)
+                self._stop_event.wait(0.1)
+                continue
+            if data:
+                self.feed(data, time.monotonic())
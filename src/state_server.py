@@ -0,0 +1,136 @@
+import argparse
+import json
+import logging
+import selectors
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 9109
+DEFAULT_RATE_HZ = 10
+
+
+def snapshot_to_dict(snapshot):
+    tags = {}
+    for index, tag_id in enumerate(snapshot.tag_ids):
+        tags[tag_id] = {"position": [round(float(axis), 4) for axis in snapshot.positions[index]],
+                        "velocity": [round(float(axis), 4) for axis in snapshot.velocities[index]],
+                        "last_seen": float(snapshot.last_seen[index])}
+    return {"timestamp": None if snapshot.timestamp is None else float(snapshot.timestamp),
+            "latest_tag": snapshot.latest_tag,
+            "tags": tags,
+            "stats": snapshot.stats}
+
+
+class StateServer:
+    # Streams the latest tracker snapshot as one JSON line per update to every client connected on host:port, at
+    # most rate_hz times per second. publish() only swaps a reference, encoding and sending happen on the server
+    # thread. Clients that cannot keep up are dropped instead of buffered for.
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, rate_hz=DEFAULT_RATE_HZ):
+        if rate_hz <= 0:
+            raise ValueError(f"Invalid state rate {rate_hz}, it must be greater than 0")
+        self.period = 1.0 / rate_hz
+        self.snapshot = None
+        self.clients = []
+        self.sent = 0
+        self.dropped_clients = 0
+
+        self.listener = socket.create_server((host, port))
+        self.listener.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.listener, selectors.EVENT_READ)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.listener.getsockname()[1]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def publish(self, snapshot):
+        self.snapshot = snapshot
+
+    def stats(self):
+        return {"clients": len(self.clients), "sent": self.sent, "dropped_clients": self.dropped_clients}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="state-server", daemon=True)
+        self._thread.start()
+        logger.info("serving tracker state on %s:%d", *self.listener.getsockname()[:2])
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        for client in self.clients:
+            client.close()
+        self.clients = []
+        self._selector.close()
+        self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, address = self.listener.accept()
+            except BlockingIOError:
+                return
+            client.setblocking(False)
+            self.clients.append(client)
+            logger.info("state client %s connected", address)
+
+    def _send(self, line):
+        for client in list(self.clients):
+            try:
+                if client.send(line) == len(line):
+                    continue
+                # Partial write, the client's buffer is full.
+            except (BlockingIOError, OSError):
+                pass
+            self.clients.remove(client)
+            self.dropped_clients += 1
+            client.close()
+
+    def _run(self):
+        sent_snapshot = None
+        while not self._stop_event.is_set():
+            if self._selector.select(self.period):
+                self._accept()
+            snapshot = self.snapshot
+            if snapshot is sent_snapshot or snapshot is None or not self.clients:
+                continue
+            line = (json.dumps(snapshot_to_dict(snapshot), default=str) + "\n").encode()
+            self._send(line)
+            sent_snapshot = snapshot
+            self.sent += 1
+            self._stop_event.wait(self.period)
+
+
+def iter_states(host="127.0.0.1", port=DEFAULT_PORT, timeout=None):
+    # Client side, yields the decoded states as the server sends them.
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        with connection.makefile("r") as lines:
+            for line in lines:
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    # Minimal terminal viewer: python state_server.py --port 9109
+    parser = argparse.ArgumentParser(description="Print the tracker state served by main.py --state-port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    for state in iter_states(args.host, args.port):
+        for tag_id, tag in state["tags"].items():
+            x, y, z = tag["position"]
+            print(f"{tag_id} ({x:.2f}, {y:.2f}, {z:.2f}){' *' if tag_id == state['latest_tag'] else ''}")
@@ -0,0 +1,118 @@
+import math
+
+import numpy as np
+import pytest
+
+import calibration
+from calibration import CalibrationSession, load_poses, rotation_matrices, solve_pose
+from fixtures import Fixture, FixtureArray, rotation_matrix
+from kalman_filter import KalmanFilterBank
+from tracker import TagTracker
+
+SYSTEM = {
+    "position": (4.0, -1.0, 3.0),
+    "orientation": 90,
+    "mounting": "hung",
+    "pan_range": (0, 540),
+    "tilt_range": (0, 270),
+    "pan_dmx_range": (0, 65535),
+    "tilt_dmx_range": (0, 65535),
+    "pan_channel": 1,
+    "pan_fine_channel": 2,
+    "tilt_channel": 3,
+    "tilt_fine_channel": 4
+}
+TRUE_POSE = {"position": (4.3, -0.8, 3.2), "orientation": 97.0, "pitch": 3.0, "roll": -2.0}
+TAG_POSITIONS = [(2.0, 1.0, 1.2), (6.0, 1.5, 1.0), (4.0, 4.0, 1.5), (1.0, 3.5, 0.8), (7.0, 4.0, 1.3),
+                 (3.0, 2.0, 0.2)]
+
+
+def dmx_points(system, tag_positions):
+    # The 16 bit values an operator would find by steering the beam onto each tag.
+    fixture = Fixture.compile("A", system)
+    points = []
+    for position in tag_positions:
+        pan_coarse, pan_fine, tilt_coarse, tilt_fine = fixture.dmx_values(*fixture.aim(position))
+        points.append((position, pan_coarse << 8 | pan_fine, tilt_coarse << 8 | tilt_fine))
+    return points
+
+
+def test_rotation_matrices_match_fixtures():
+    angles = np.array([[0.0, 0.0, 0.0], [97.0, 3.0, 178.0], [-45.0, 60.0, 10.0]])
+    batch = rotation_matrices(angles[:, 0], angles[:, 1], angles[:, 2])
+    for matrix, (yaw, pitch, roll) in zip(batch, angles):
+        assert matrix == pytest.approx(rotation_matrix(yaw, pitch, roll))
+
+
+def test_solve_pose_recovers_the_rig():
+    light_systems = {"A": dict(SYSTEM)}
+    tag_tracker = TagTracker(FixtureArray.from_light_systems(light_systems, ["A"]), KalmanFilterBank(1, 0))
+    session = CalibrationSession(tag_tracker, light_systems, poses_path=None)
+    for point in dmx_points(dict(SYSTEM, **TRUE_POSE), TAG_POSITIONS):
+        session.add_point("A", *point)
+
+    fit = session.solve("A")
+    assert fit.position == pytest.approx(TRUE_POSE["position"], abs=0.02)
+    assert (fit.orientation, fit.pitch, fit.roll) == pytest.approx((97.0, 3.0, -2.0), abs=0.5)
+    # 16 bit DMX steps are a hundredth of a degree.
+    assert len(fit.residuals) == len(TAG_POSITIONS)
+    assert fit.rms < 0.05
+
+
+def test_apply_reaims_the_running_tracker(tmp_path):
+    light_systems = {"A": dict(SYSTEM)}
+    tag_tracker = TagTracker(FixtureArray.from_light_systems(light_systems, ["A"]), KalmanFilterBank(1, 0))
+    tag_tracker.update("T1", TAG_POSITIONS[2], timestamp=0)
+    path = str(tmp_path / "poses.json")
+    session = CalibrationSession(tag_tracker, light_systems, poses_path=path)
+    for point in dmx_points(dict(SYSTEM, **TRUE_POSE), TAG_POSITIONS):
+        session.add_point("A", *point)
+
+    universe = np.zeros(513, dtype=np.uint8)
+    session.apply("A", session.solve("A"))
+    tag_tracker.write_dmx(universe)
+    expected = dmx_points(dict(SYSTEM, **TRUE_POSE), [TAG_POSITIONS[2]])[0]
+    assert int(universe[1]) << 8 | int(universe[2]) == pytest.approx(expected[1], abs=30)
+    assert int(universe[3]) << 8 | int(universe[4]) == pytest.approx(expected[2], abs=30)
+    assert light_systems["A"]["mounting"] == "hung"
+
+    # The next start picks the pose up from disk.
+    restarted = {"A": dict(SYSTEM)}
+    assert load_poses(restarted, path) == ["A"]
+    assert restarted["A"]["position"] == pytest.approx(TRUE_POSE["position"], abs=0.02)
+    assert restarted["A"]["orientation"] == pytest.approx(97.0, abs=0.5)
+    assert load_poses(restarted, str(tmp_path / "missing.json")) == []
+
+
+def test_noisy_points_report_residuals():
+    rng = np.random.default_rng(3)
+    positions = np.array(TAG_POSITIONS) + rng.normal(0.0, 0.05, (len(TAG_POSITIONS), 3))
+    points = dmx_points(dict(SYSTEM, **TRUE_POSE), positions)
+    fixture = Fixture.compile("A", SYSTEM)
+    pans, tilts = fixture.angles(np.array([point[1] for point in points], dtype=float),
+                                 np.array([point[2] for point in points], dtype=float))
+
+    fit = solve_pose(fixture, TAG_POSITIONS, pans, tilts, mounting_roll=180.0)
+    assert math.dist(fit.position, TRUE_POSE["position"]) < 0.3
+    assert 0.1 < fit.rms < 3.0
+    assert max(fit.residuals) >= fit.rms
+
+
+def test_invalid_points():
+    light_systems = {"A": dict(SYSTEM)}
+    session = CalibrationSession(TagTracker(FixtureArray.from_light_systems(light_systems, ["A"]),
+                                            KalmanFilterBank(1, 0)), light_systems, poses_path=None)
+    with pytest.raises(ValueError):
+        session.add_point("B", (0, 0, 0), 0, 0)
+    with pytest.raises(ValueError):
+        session.add_point("A", (0, 0, 0), 70000, 0)
+
+    session.add_point("A", (1, 1, 1), 100, 100)
+    session.add_point("A", (2, 1, 1), 200, 100)
+    with pytest.raises(ValueError):
+        session.solve("A")
+    session.remove_last("A")
+    assert len(session.points["A"]) == 1
+    session.clear("A")
+    assert session.points["A"] == []
+    assert calibration.MIN_POINTS == 3
@@ -0,0 +1,123 @@
+import time
+from operator import attrgetter
+
+import pytest
+
+import capture
+from capture import CaptureFormatError, CaptureWriter, ReplaySource, load_capture
+from dwm_mock import MockDWM1001Serial
+from dwm_tlv import DWM1001TlvTransport
+from lec_parser import TagSample, parse_line
+from serial_reader import SerialReader
+
+ANCHOR_IDS = ("1151", "0CA8")
+ANCHOR_POSITIONS = ((0.0, 0.0, 2.5), (8.0, 0.0, 2.5))
+
+
+def sample(x, tag_id="14A2", quality=80):
+    return TagSample(tag_id, x, 2.0, 1.0, quality, ANCHOR_IDS, ANCHOR_POSITIONS, (3.25, 5.5))
+
+
+def write_capture(path, count, tag_id="14A2"):
+    with CaptureWriter(path) as writer:
+        for i in range(count):
+            writer.write(100.0 + i * 0.1, sample(float(i), tag_id))
+
+
+def test_roundtrip(tmp_path):
+    path = tmp_path / "show.cap"
+    with CaptureWriter(path) as writer:
+        writer.write(100.0, sample(1.5))
+        writer.write(100.1, TagSample("0C31", 0.0, 0.0, 0.0, None, ANCHOR_IDS, (), (1.0, 2.0)))
+
+    records = load_capture(path)
+    assert len(records) == 2
+    assert records[1]["timestamp"] == 100.1
+
+    first = capture.record_to_sample(records[0])
+    assert first == sample(1.5)
+    second = capture.record_to_sample(records[1])
+    assert second.tag_id == "0C31"
+    assert second.quality is None
+    assert second.anchor_positions == ()
+    assert second.distances == (1.0, 2.0)
+
+
+def test_append_to_existing_capture(tmp_path):
+    path = tmp_path / "show.cap"
+    write_capture(path, 3)
+    write_capture(path, 2)
+    assert len(load_capture(path)) == 5
+
+
+def test_rejects_foreign_files(tmp_path):
+    path = tmp_path / "show.cap"
+    path.write_bytes(b"POS,0,14A2,1.00,2.00,1.00,80,xx\r\n")
+    with pytest.raises(CaptureFormatError):
+        load_capture(path)
+    with pytest.raises(CaptureFormatError):
+        CaptureWriter(path)
+
+
+def test_coalesced_samples_are_captured(tmp_path):
+    path = tmp_path / "show.cap"
+    with CaptureWriter(path) as writer:
+        reader = SerialReader(None, parse_line, key=attrgetter("tag_id"), capture=writer)
+        reader.feed(b"".join(b"POS,0,14A2,%d.0,2.0,1.0,80\r\n" % i for i in range(3)) +
+                    b"POS,0,0C31,9.0,2.0,1.0,80\r\n", 100.0)
+        samples = reader.take(timeout=0)
+
+        tlv = DWM1001TlvTransport(MockDWM1001Serial(), tag_id="14A2", capture=writer)
+        tlv.poll()
+        tlv.poll()
+
+    # The tracker only sees the newest sample of each tag, the capture has all of them.
+    assert samples["14A2"][1].x == 2.0 and reader.stats()["coalesced"] == 2
+    assert tlv.stats()["coalesced"] == 1
+    records = load_capture(path)
+    assert [capture.record_to_sample(record).x for record in records[:4]] == [0.0, 1.0, 2.0, 9.0]
+    assert len(records) == 6 and (records[4:]["tag_id"] == b"14A2").all()
+
+
+def test_replay_as_fast_as_possible_is_lossless(tmp_path):
+    path = tmp_path / "show.cap"
+    write_capture(path, 50)
+
+    replayed = []
+    with ReplaySource(path, speed=0) as source:
+        assert source.anchor_positions() == list(ANCHOR_POSITIONS)
+        started = time.monotonic()
+        while True:
+            samples = source.take(timeout=5.0)
+            if not samples and source.finished.is_set():
+                break
+            for timestamp, replayed_sample in samples.values():
+                replayed.append((timestamp, replayed_sample))
+
+    # The end of the replay wakes take() instead of leaving it to time out.
+    assert time.monotonic() - started < 2.0
+    assert [replayed_sample.x for _, replayed_sample in replayed] == [float(i) for i in range(50)]
+    spacing = [b[0] - a[0] for a, b in zip(replayed, replayed[1:])]
+    assert spacing == pytest.approx([0.1] * 49)
+    assert source.stats()["coalesced"] == 0
+
+
+def test_replay_in_real_time_keeps_spacing(tmp_path):
+    path = tmp_path / "show.cap"
+    write_capture(path, 3)
+
+    with ReplaySource(path, speed=10) as source:
+        assert source.finished.wait(1.0)
+        samples = source.take(timeout=0)
+
+    timestamp, replayed_sample = samples["14A2"]
+    assert replayed_sample.x == 2.0
+    assert source.stats()["replayed"] == 3
+    assert source.stats()["coalesced"] == 2
+
+
+def test_invalid_replay_speed(tmp_path):
+    path = tmp_path / "show.cap"
+    write_capture(path, 1)
+    with pytest.raises(ValueError):
+        ReplaySource(path, speed=-1)
@@ -16,7 +16,7 @@ def test_set_channel():
     with patch('serial.Serial', autospec=True) as mock_serial:
         dmx = DmxPy('/dev/ttyUSB0')
         dmx.set_channel(1, 255)
-        assert dmx.dmxData[1] == bytes([255])
+        assert dmx.dmxData[1] == 255
 
 
 def test_blackout():
@@ -24,7 +24,7 @@ def test_blackout():
         dmx = DmxPy('/dev/ttyUSB0')
         dmx.set_channel(1, 255)
         dmx.blackout()
-        assert all(channel == bytes([0]) for channel in dmx.dmxData[1:])
+        assert all(channel == 0 for channel in dmx.dmxData[1:])
 
 
 def test_update_lighting():
@@ -41,3 +41,75 @@ def test_context_manager():
             assert dmx.serial is not None
 
         assert dmx.serial.close.called
+
+
+def test_set_channel_accepts_bytes():
+    with patch('serial.Serial', autospec=True) as mock_serial:
+        dmx = DmxPy('/dev/ttyUSB0')
+        dmx.set_channel(7, bytes([42]))
+        assert dmx.dmxData[7] == 42
+
+
+def test_set_channels():
+    with patch('serial.Serial', autospec=True) as mock_serial:
+        dmx = DmxPy('/dev/ttyUSB0')
+        dmx.set_channels(2, bytes([1, 2, 3, 4]))
+        assert bytes(dmx.dmxData[1:7]) == bytes([0, 1, 2, 3, 4, 0])
+
+        dmx.set_channels(10, [300, -5])
+        assert bytes(dmx.dmxData[10:12]) == bytes([255, 0])
+
+
+def test_set_channels_truncates_at_end_of_universe():
+    with patch('serial.Serial', autospec=True) as mock_serial:
+        dmx = DmxPy('/dev/ttyUSB0')
+        dmx.set_channels(511, bytes([9, 9, 9, 9]))
+        assert bytes(dmx.dmxData[511:]) == bytes([9, 9])
+        assert len(dmx.frame) == len(dx.DMX_OPEN + dx.DMX_INTENSITY) + dx.UNIVERSE_SIZE + len(dx.DMX_CLOSE)
+
+
+def test_update_lighting_writes_single_preallocated_frame():
+    with patch('serial.Serial', autospec=True) as mock_serial:
+        dmx = DmxPy('/dev/ttyUSB0')
+        frame = dmx.frame
+        dmx.set_channel(1, 255)
+        dmx.update_lighting()
+        written = dmx.serial.write.call_args.args[0]
+        assert written is frame
+        assert bytes(written) == dx.DMX_OPEN + dx.DMX_INTENSITY + bytes([0, 255]) + bytes(511) + dx.DMX_CLOSE
+
+
+def test_dirty_range_tracking():
+    with patch('serial.Serial', autospec=True) as mock_serial:
+        dmx = DmxPy('/dev/ttyUSB0')
+        assert not dmx.dirty
+
+        dmx.set_channel(5, 0)
+        assert not dmx.dirty
+
+        dmx.set_channel(5, 10)
+        dmx.set_channels(20, bytes([1, 2]))
+        assert (dmx.dirty_start, dmx.dirty_end) == (5, 22)
+
+        dmx.update_lighting()
+        assert not dmx.dirty
+
+
+def test_identical_frames_are_suppressed_until_keepalive():
+    with patch('serial.Serial', autospec=True) as mock_serial, patch('dmx.time.monotonic') as monotonic:
+        monotonic.return_value = 100.0
+        dmx = DmxPy('/dev/ttyUSB0', keepalive_interval=1.0)
+
+        assert dmx.update_lighting()
+        assert not dmx.update_lighting()
+        dmx.set_channel(1, 1)
+        assert dmx.update_lighting()
+        dmx.set_channel(1, 1)
+        assert not dmx.update_lighting()
+
+        monotonic.return_value = 101.5
+        assert dmx.update_lighting()
+        assert dmx.update_lighting(force=True)
+
+        assert dmx.stats() == {"frames_sent": 4, "frames_suppressed": 2, "bytes_written": 4 * len(dmx.frame)}
+        assert dmx.serial.write.call_count == 2 + 4
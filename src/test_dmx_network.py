@@ -0,0 +1,154 @@
+import socket
+import struct
+from unittest.mock import patch
+
+import pytest
+
+import dmx_network
+from dmx import DmxInterface, DmxPy
+from dmx_mock import MockDMXInterface
+from dmx_network import ArtNetInterface, NetworkDmxInterface, SacnInterface
+from dmx_scheduler import DmxRefreshScheduler
+
+CID = bytes(range(16))
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(1.0)
+    yield sock
+    sock.close()
+
+
+def receive(sock, count):
+    return [sock.recv(1024) for _ in range(count)]
+
+
+def test_backends_share_the_interface():
+    assert issubclass(DmxPy, DmxInterface)
+    assert isinstance(MockDMXInterface(), DmxInterface)
+    with ArtNetInterface("127.0.0.1") as artnet:
+        assert isinstance(artnet, DmxInterface)
+    with pytest.raises(TypeError):
+        DmxInterface()
+    with pytest.raises(TypeError):
+        NetworkDmxInterface((0,), dmx_network.ARTNET_PORT)
+
+
+def test_artnet_frames_and_sync(listener):
+    port = listener.getsockname()[1]
+    with ArtNetInterface("127.0.0.1", universes=(0, 0x123), port=port) as artnet:
+        packets = artnet.packets
+        artnet.set_channels(1, bytes([10, 20, 30]))
+        artnet.set_channel(512, 7, universe=0x123)
+        assert artnet.update_lighting()
+
+        first, second, sync = receive(listener, 3)
+        assert first[:8] == b"Art-Net\x00"
+        assert struct.unpack_from("<H", first, 8)[0] == dmx_network.ARTNET_OP_DMX
+        assert struct.unpack_from(">H", first, 10)[0] == 14
+        assert first[12] == 1
+        assert struct.unpack_from("<H", first, 14)[0] == 0
+        assert struct.unpack_from(">H", first, 16)[0] == 512
+        assert first[18:21] == bytes([10, 20, 30]) and len(first) == 530
+        assert struct.unpack_from("<H", second, 14)[0] == 0x123
+        assert second[-1] == 7
+        assert struct.unpack_from("<H", sync, 8)[0] == dmx_network.ARTNET_OP_SYNC and len(sync) == 14
+
+        # Only the universe that changed goes out again, still followed by the sync, from the same buffers.
+        artnet.set_channel(2, 99)
+        assert artnet.update_lighting()
+        first, sync = receive(listener, 2)
+        assert first[12] == 2 and first[19] == 99
+        assert struct.unpack_from("<H", sync, 8)[0] == dmx_network.ARTNET_OP_SYNC
+        assert artnet.packets is packets and artnet.packets[0] is packets[0]
+        assert artnet.stats()["packets_sent"] == 5
+
+
+def test_artnet_sequence_skips_zero():
+    with ArtNetInterface("127.0.0.1") as artnet:
+        assert artnet.next_sequence(255) == 1
+        assert artnet.next_sequence(0) == 1
+        assert not artnet.sync
+
+
+def test_sacn_frames_and_sync(listener):
+    port = listener.getsockname()[1]
+    with SacnInterface("127.0.0.1", universes=(1, 2), port=port, cid=CID) as sacn:
+        sacn.set_channels(0, bytes([0, 255, 128]), universe=2)
+        sacn.update_lighting()
+
+        first, second, sync = receive(listener, 3)
+        assert len(first) == dmx_network.SACN_DATA_LENGTH
+        assert first[4:16] == dmx_network.SACN_IDENTIFIER
+        assert struct.unpack_from(">HI", first, 16) == (0x7000 | 622, dmx_network.VECTOR_ROOT_E131_DATA)
+        assert first[22:38] == CID
+        assert struct.unpack_from(">HI", first, 38) == (0x7000 | 600, dmx_network.VECTOR_E131_DATA_PACKET)
+        assert first[44:52] == b"seguidor" and first[108] == 100
+        # sync address, sequence, options, universe
+        assert struct.unpack_from(">HBBH", first, 109) == (1, 1, 0, 1)
+        assert struct.unpack_from(">HBBHHH", first, 115) == (0x7000 | 523, 2, 0xA1, 0, 1, 513)
+        assert first[125] == 0
+
+        assert struct.unpack_from(">BBH", second, 111) == (1, 0, 2)
+        assert second[126:128] == bytes([255, 128])
+
+        assert len(sync) == dmx_network.SACN_SYNC_LENGTH
+        assert struct.unpack_from(">I", sync, 18)[0] == dmx_network.VECTOR_ROOT_E131_EXTENDED
+        assert struct.unpack_from(">IBH", sync, 40) == (dmx_network.VECTOR_E131_EXTENDED_SYNCHRONIZATION, 1, 1)
+
+        sacn.set_channel(1, 5, universe=2)
+        sacn.update_lighting()
+        second, sync = receive(listener, 2)
+        assert second[111] == 2 and second[126] == 5
+        assert sync[44] == 2
+
+
+def test_sacn_multicast_addresses():
+    with SacnInterface(universes=(1, 300)) as sacn:
+        assert [address for address, _ in sacn.destinations] == ["239.255.0.1", "239.255.1.44"]
+        assert sacn.port == dmx_network.SACN_PORT
+
+
+def test_unchanged_frames_are_suppressed_until_keepalive(listener):
+    port = listener.getsockname()[1]
+    with patch('dmx_network.time.monotonic') as monotonic, \
+            ArtNetInterface("127.0.0.1", port=port, keepalive_interval=1.0) as artnet:
+        monotonic.return_value = 100.0
+        assert artnet.update_lighting()
+        artnet.set_channel(1, 0)
+        assert not artnet.update_lighting()
+        artnet.blackout()
+        assert not artnet.update_lighting()
+
+        monotonic.return_value = 101.5
+        assert artnet.update_lighting()
+        assert artnet.update_lighting(force=True)
+        assert [packet[12] for packet in receive(listener, 3)] == [1, 2, 3]
+        assert artnet.stats()["frames_suppressed"] == 2
+
+
+def test_invalid_universes():
+    with pytest.raises(ValueError):
+        ArtNetInterface("127.0.0.1", universes=())
+    with pytest.raises(ValueError):
+        ArtNetInterface("127.0.0.1", universes=(0x8000,))
+    with pytest.raises(ValueError):
+        SacnInterface("127.0.0.1", universes=(0,))
+    with pytest.raises(ValueError):
+        SacnInterface("127.0.0.1", universes=(1, 1))
+
+
+def test_scheduler_drives_the_network_backend(listener):
+    port = listener.getsockname()[1]
+    with ArtNetInterface("127.0.0.1", port=port) as artnet:
+        scheduler = DmxRefreshScheduler(artnet)
+        scheduler.set_channel(1, 42)
+        scheduler.set_channel(512, 43)
+        scheduler.publish()
+        scheduler.send_frame()
+
+        packet = listener.recv(1024)
+        assert packet[18] == 42 and packet[-1] == 43
@@ -0,0 +1,122 @@
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from dmx_mock import MockDMXInterface
+from dmx_scheduler import DmxRefreshScheduler
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        DmxRefreshScheduler(Mock(), rate_hz=0)
+
+
+def test_set_channel_writes_back_buffer_only():
+    scheduler = DmxRefreshScheduler(Mock())
+    scheduler.set_channel(2, 300)
+    assert scheduler.back_buffer[2] == 255
+    assert scheduler.front_buffer[2] == 0
+
+    scheduler.publish()
+    assert scheduler.front_buffer[2] == 255
+
+
+def test_send_frame_only_forwards_changed_frames():
+    interface = Mock()
+    scheduler = DmxRefreshScheduler(interface)
+    scheduler.set_channel(2, 10)
+    scheduler.set_channel(3, 20)
+    scheduler.publish()
+
+    scheduler.send_frame()
+    assert interface.set_channels.call_count == 1
+    start, values = interface.set_channels.call_args.args
+    assert start == 1
+    assert bytes(values[:3]) == bytes([0, 10, 20])
+    assert interface.update_lighting.call_count == 1
+
+    interface.set_channels.reset_mock()
+    scheduler.publish()
+    scheduler.send_frame()
+    interface.set_channels.assert_not_called()
+    assert interface.update_lighting.call_count == 2
+
+
+def test_unpublished_values_are_not_sent():
+    interface = Mock()
+    scheduler = DmxRefreshScheduler(interface)
+    scheduler.set_channel(2, 10)
+    scheduler.send_frame()
+    interface.set_channels.assert_not_called()
+
+
+def test_refresh_thread_rate_and_stats():
+    interface = Mock()
+    with DmxRefreshScheduler(interface, rate_hz=100) as scheduler:
+        time.sleep(0.3)
+
+    stats = scheduler.stats()
+    assert 10 < stats["frames"] < 40
+    assert stats["fps"] > 50
+    assert stats["jitter_ms"] >= 0
+    assert interface.update_lighting.call_count == stats["frames"]
+
+
+@pytest.mark.parametrize("output_stats, logged", [({}, False), ({"frames_sent": 3}, True)])
+def test_report_logs_output_stats_only_when_there_are_any(caplog, output_stats, logged):
+    interface = MockDMXInterface()
+    interface.stats = lambda: output_stats
+    caplog.set_level("INFO", logger="dmx_scheduler")
+    with DmxRefreshScheduler(interface, rate_hz=100, report_interval=0.02):
+        time.sleep(0.1)
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("dmx refresh") for message in messages)
+    assert any(message.startswith("dmx output") for message in messages) == logged
+
+
+def test_send_errors_do_not_stop_the_thread():
+    interface = Mock()
+    interface.update_lighting.side_effect = IOError("unplugged")
+    with DmxRefreshScheduler(interface, rate_hz=100) as scheduler:
+        time.sleep(0.1)
+
+    assert scheduler.send_errors > 1
+    assert scheduler.send_errors == scheduler.frame_count
+
+
+def test_output_delay_tracks_published_timestamps():
+    scheduler = DmxRefreshScheduler(Mock())
+    for i in range(100):
+        scheduler.set_channel(1, i)
+        scheduler.publish(timestamp=i)
+        scheduler.send_frame(now=i + 0.05)
+    assert abs(scheduler.output_delay - 0.05) < 1e-3
+
+
+def test_frame_callback_runs_before_each_frame():
+    interface = Mock()
+    seen = []
+
+    def render(now):
+        seen.append(now)
+        scheduler.set_channel(1, len(seen) % 256)
+        scheduler.publish(now)
+
+    scheduler = DmxRefreshScheduler(interface, rate_hz=100, frame_callback=render)
+    with scheduler:
+        time.sleep(0.1)
+
+    assert len(seen) == scheduler.frame_count
+    assert interface.set_channels.call_count == scheduler.frame_count
+
+
+def test_publish_swaps_frame_and_timestamp_together():
+    scheduler = DmxRefreshScheduler(Mock())
+    front = scheduler.front
+    scheduler.set_channel(1, 9)
+    scheduler.publish(4.0)
+    assert scheduler.front is not front
+    assert scheduler.front == (scheduler.front_buffer, 4.0)
+    assert scheduler.front_buffer[1] == 9 and scheduler.front_timestamp == 4.0
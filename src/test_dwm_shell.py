@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+import lec_parser
+from dwm_mock import MockDWM1001ShellSerial
+from dwm_shell import AnchorCache, DWM1001Shell, ShellError, parse_anchor_positions, parse_device_key
+
+ANCHORS = [(0.0, 0.0, 2.5), (8.0, 0.0, 2.5), (8.0, 6.0, 2.5), (0.0, 6.0, 2.5)]
+
+
+def test_parse_anchor_positions():
+    lines = ["[000005.690 INF] AN: cnt=2 seq=x03",
+             "[000005.690 INF] 0) id=DECA000000001151 seat=0 pos=0.00:-1.25:2.50",
+             "[000005.690 INF] 1) id=DECA000000000CA8 seat=1 pos=8.00:0.00:2.50"]
+    assert parse_anchor_positions(lines) == [(0.0, -1.25, 2.5), (8.0, 0.0, 2.5)]
+
+
+def test_parse_device_key():
+    assert parse_device_key(["[000011.270 INF] uwb0: panid=x3a9e addr=xDECA0000000014A2"]) == \
+        "3A9E:DECA0000000014A2"
+    assert parse_device_key(["[000011.270 INF] mode: tn (act,twr,np,le)"]) is None
+
+
+@pytest.mark.parametrize("state", ["api", "shell", "streaming"])
+def test_initialize_from_any_state(state):
+    ser = MockDWM1001ShellSerial(state=state)
+    shell = DWM1001Shell(ser)
+
+    assert shell.initialize() == ANCHORS
+    assert shell.device_key == "3A9E:DECA0000000014A2"
+    assert ser.state == "streaming"
+    assert b"la\r" in ser.requests
+    assert lec_parser.parse_line(ser.read(256)) is not None
+
+
+def test_warm_start_uses_the_anchor_cache(tmp_path):
+    cache = AnchorCache(str(tmp_path / "anchors.json"))
+    DWM1001Shell(MockDWM1001ShellSerial(), cache=cache).initialize()
+    assert cache.get("3A9E:DECA0000000014A2") == ANCHORS
+
+    ser = MockDWM1001ShellSerial(state="streaming")
+    shell = DWM1001Shell(ser, cache=cache)
+    started = time.perf_counter()
+    assert shell.initialize() == ANCHORS
+    assert time.perf_counter() - started < 0.1
+    assert shell.anchors_cached
+    assert b"la\r" not in ser.requests
+
+    # Another network misses the cache, a refresh asks the tag again.
+    assert DWM1001Shell(MockDWM1001ShellSerial(panid=0x1234), cache=cache).initialize() == ANCHORS
+    shell = DWM1001Shell(MockDWM1001ShellSerial(state="shell"), cache=cache)
+    shell.initialize(refresh_anchors=True)
+    assert not shell.anchors_cached
+
+
+def test_broken_cache_file_is_empty(tmp_path):
+    path = tmp_path / "anchors.json"
+    path.write_text("{not json")
+    assert AnchorCache(str(path)).get("3A9E:DECA0000000014A2") is None
+
+
+def test_command_retries_then_fails():
+    ser = MockDWM1001ShellSerial(state="shell")
+    answers = iter([b"", b"si\r\n[000011.270 INF] uwb0: panid=x3A9E addr=xDECA0000000014A2\r\ndwm> "])
+    ser.respond = lambda request: next(answers)
+    shell = DWM1001Shell(ser, timeout=0.02)
+    assert shell.system_info() == "3A9E:DECA0000000014A2"
+    assert ser.requests == [b"si\r", b"si\r"]
+
+    ser.respond = lambda request: b""
+    with pytest.raises(ShellError):
+        shell.command(b"la\r")
+    with pytest.raises(ValueError):
+        DWM1001Shell(ser, retries=0)
@@ -0,0 +1,76 @@
+import math
+
+import pytest
+
+import dwm_tlv
+from dwm_mock import MockDWM1001Serial
+from dwm_tlv import DWM1001TlvTransport, TlvError, decode_loc_get
+
+
+def standing_still(timestamp):
+    return 1.5, 2.25, 1.0
+
+
+def test_node_id():
+    transport = DWM1001TlvTransport(MockDWM1001Serial(node_id=0xDECA00000000ABCD))
+    assert transport.node_id() == 0xDECA00000000ABCD
+
+
+def test_loc_get_decodes_position_and_ranges():
+    ser = MockDWM1001Serial(trajectory=standing_still)
+    transport = DWM1001TlvTransport(ser, tag_id="14A2")
+
+    sample = transport.loc_get()
+    assert ser.requests == [dwm_tlv.DWM_LOC_GET]
+    assert sample.tag_id == "14A2"
+    assert sample.position == (1.5, 2.25, 1.0)
+    assert sample.quality == 90
+    assert sample.anchor_ids == ("1151", "0CA8", "111C", "1C2D")
+    assert sample.anchor_positions[1] == (8.0, 0.0, 2.5)
+    assert sample.distances[0] == pytest.approx(math.dist((1.5, 2.25, 1.0), (0.0, 0.0, 2.5)), abs=1e-3)
+    assert ser.in_waiting == 0
+
+
+def test_decode_anchor_node_ranges():
+    response = bytes([dwm_tlv.TLV_POS_XYZ, 13]) + dwm_tlv.POSITION.pack(1000, -2000, 500, 50) + \
+        bytes([dwm_tlv.TLV_RNG_AN_DIST, 1 + 13, 1]) + dwm_tlv.ANCHOR_RANGE.pack(0xDECA000000001151, 3250, 100)
+    sample = decode_loc_get(response)
+    assert sample.position == (1.0, -2.0, 0.5)
+    assert sample.anchor_ids == ("1151",)
+    assert sample.distances == (3.25,)
+    assert sample.anchor_positions == ()
+
+
+def test_decode_rejects_malformed_responses():
+    with pytest.raises(TlvError):
+        decode_loc_get(bytes([0x42, 13]) + bytes(13))
+    with pytest.raises(TlvError):
+        decode_loc_get(bytes([dwm_tlv.TLV_POS_XYZ, 13]) + bytes(13) + bytes([dwm_tlv.TLV_RNG_AN_POS_DIST, 21, 2]))
+
+
+def test_error_return_value():
+    transport = DWM1001TlvTransport(MockDWM1001Serial())
+    with pytest.raises(TlvError):
+        transport.request(bytes([0x7F, 0x00]))
+
+
+def test_short_read_is_a_timeout():
+    ser = MockDWM1001Serial()
+    ser.respond = lambda request: bytes([dwm_tlv.TLV_RET_VAL, 1])
+    with pytest.raises(TlvError):
+        DWM1001TlvTransport(ser).loc_get()
+
+
+def test_polling_thread_delivers_latest_sample():
+    with DWM1001TlvTransport(MockDWM1001Serial(trajectory=standing_still), rate_hz=50) as transport:
+        samples = transport.take(timeout=1.0)
+
+    assert list(samples) == ["14A2"]
+    timestamp, sample = samples["14A2"]
+    assert sample.position == (1.5, 2.25, 1.0)
+    assert transport.stats()["errors"] == 0
+
+
+def test_invalid_poll_rate():
+    with pytest.raises(ValueError):
+        DWM1001TlvTransport(MockDWM1001Serial(), rate_hz=0)
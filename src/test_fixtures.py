@@ -0,0 +1,161 @@
+import math
+
+import numpy as np
+import pytest
+
+from fixtures import Fixture, FixtureArray
+
+LIGHT_SYSTEMS = {
+    "A": {
+        "position": (1, 1, 1),
+        "pan_range": (0, 615),
+        "tilt_range": (0, 260),
+        "pan_dmx_range": (0, 65535),
+        "tilt_dmx_range": (0, 65535),
+        "pan_channel": 2,
+        "pan_fine_channel": 3,
+        "tilt_channel": 4,
+        "tilt_fine_channel": 5
+    },
+    "B": {
+        "position": (5, -2, 3),
+        "orientation": 90,
+        "pan_range": (0, 540),
+        "tilt_range": (0, 250),
+        "pan_dmx_range": (0, 65535),
+        "tilt_dmx_range": (0, 65535),
+        "pan_channel": 10,
+        "pan_fine_channel": 11,
+        "tilt_channel": 12,
+        "tilt_fine_channel": 13
+    }
+}
+
+
+def scalar_pan_tilt(target, position, yaw, pan_range, tilt_range):
+    x, y, z = (target[i] - position[i] for i in range(3))
+    x, y = (x * math.cos(yaw) + y * math.sin(yaw), y * math.cos(yaw) - x * math.sin(yaw))
+    horizontal = math.sqrt(x ** 2 + y ** 2)
+    pan = max(min(math.degrees(math.atan2(y, x)), pan_range[1]), pan_range[0])
+    tilt = max(min(math.degrees(math.atan2(z, horizontal)), tilt_range[1]), tilt_range[0])
+    return pan, tilt
+
+
+def test_unknown_light_system():
+    with pytest.raises(ValueError):
+        FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A", "C"])
+
+
+def test_pan_tilt_matches_scalar_math():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A", "B"])
+    target = (3.0, 4.0, 5.0)
+    pan, tilt = fixtures.pan_tilt(target)
+
+    for i, name in enumerate(["A", "B"]):
+        system = LIGHT_SYSTEMS[name]
+        expected_pan, expected_tilt = scalar_pan_tilt(target, system["position"],
+                                                      math.radians(system.get("orientation", 0)),
+                                                      system["pan_range"], system["tilt_range"])
+        assert pan[i] == pytest.approx(expected_pan)
+        assert tilt[i] == pytest.approx(expected_tilt)
+
+
+def test_per_fixture_targets():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A", "B"])
+    pan, tilt = fixtures.pan_tilt([(2.0, 2.0, 1.0), (5.0, 0.0, 3.0)])
+    assert pan[0] == pytest.approx(45.0)
+    assert tilt[0] == pytest.approx(0.0)
+    # B faces +y, a target straight ahead of it is pan zero.
+    assert pan[1] == pytest.approx(0.0, abs=1e-9)
+
+
+def test_to_dmx_splits_16_bit_values():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    values = fixtures.to_dmx(np.array([615.0]), np.array([130.0]))
+    assert values.dtype == np.uint8
+    assert int(values[0, 0]) * 256 + int(values[0, 1]) == 65535
+    assert int(values[0, 2]) * 256 + int(values[0, 3]) == int(130 * 65535 / 260)
+
+
+def test_write_dmx_into_shared_universe():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A", "B"])
+    buffer = bytearray(513)
+    universe = np.frombuffer(buffer, dtype=np.uint8)
+
+    values = fixtures.write_dmx(universe, (3.0, 4.0, 5.0))
+    assert bytes(buffer[2:6]) == bytes(values[0])
+    assert bytes(buffer[10:14]) == bytes(values[1])
+    assert buffer[0] == 0
+    assert sum(buffer[6:10]) == 0
+
+
+def test_pan_takes_the_shortest_way_around():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    # Just right of the fixture's front is -10 degrees. From home, flipping the tilt over the top to pan 170 is
+    # less travel than panning to 350.
+    pan, tilt = fixtures.pan_tilt((2.0, 1.0 - math.tan(math.radians(10)), 1.0))
+    assert (pan[0], tilt[0]) == pytest.approx((170.0, 180.0))
+
+    # Swinging to +10 degrees stays flipped, 20 degrees of pan instead of 180 of tilt.
+    pan, tilt = fixtures.pan_tilt((2.0, 1.0 + math.tan(math.radians(10)), 1.0))
+    assert (pan[0], tilt[0]) == pytest.approx((190.0, 180.0))
+
+    # From 350 the same target is 20 degrees away at 370, not back at 10.
+    fixtures.pan = np.array([350.0])
+    fixtures.tilt = np.array([0.0])
+    pan, tilt = fixtures.pan_tilt((2.0, 1.0 + math.tan(math.radians(10)), 1.0))
+    assert (pan[0], tilt[0]) == pytest.approx((370.0, 0.0))
+
+    # Walking behind the fixture, over the top is shorter than panning half a turn.
+    fixtures.pan = np.array([180.0])
+    fixtures.tilt = np.array([130.0])
+    pan, tilt = fixtures.pan_tilt((1.0 + math.cos(math.radians(45)), 1.0 + math.sin(math.radians(45)), 1.5))
+    assert pan[0] == pytest.approx(225.0)
+    assert tilt[0] == pytest.approx(180.0 - math.degrees(math.atan2(0.5, 1.0)))
+
+
+def test_below_a_floor_fixture_tilts_over_the_top():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    pan, tilt = fixtures.pan_tilt((2.0, 1.0, 0.0))
+    assert (pan[0], tilt[0]) == pytest.approx((180.0, 225.0))
+
+
+def test_hung_fixture():
+    hung = dict(LIGHT_SYSTEMS["A"], position=(0, 0, 6), mounting="hung")
+    fixtures = FixtureArray.from_light_systems({"H": hung}, ["H"])
+    # Upside down, the floor is above the fixture's horizon and stage +y is the fixture's -y: pan 270 tilt 45, or
+    # flipped over the top, the shorter move from home.
+    pan, tilt = fixtures.pan_tilt((0.0, 6.0, 0.0))
+    assert (pan[0], tilt[0]) == pytest.approx((90.0, 135.0))
+    fixtures.pan = np.array([300.0])
+    pan, tilt = fixtures.pan_tilt((0.0, 6.0, 0.0))
+    assert (pan[0], tilt[0]) == pytest.approx((270.0, 45.0))
+
+    with pytest.raises(ValueError):
+        Fixture.compile("H", dict(hung, mounting="sideways"))
+
+
+def test_scalar_fixture_matches_array_and_points_at_the_target():
+    light_systems = dict(LIGHT_SYSTEMS, C=dict(LIGHT_SYSTEMS["B"], mounting="hung", pitch=10, position=(2, 8, 5)))
+    names = ["A", "B", "C"]
+    fixtures = FixtureArray.from_light_systems(light_systems, names)
+    scalar = [Fixture.compile(name, light_systems[name]) for name in names]
+
+    for target in [(3.0, 4.0, 0.5), (-2.0, 1.0, 2.0), (6.0, -3.0, 1.0), (1.5, 9.0, 0.0)]:
+        pan, tilt = fixtures.pan_tilt(target)
+        for i, fixture in enumerate(scalar):
+            assert fixture.aim(target) == pytest.approx((pan[i], tilt[i]))
+            if fixture.pan_min < pan[i] < fixture.pan_max and fixture.tilt_min < tilt[i] < fixture.tilt_max:
+                wanted = np.subtract(target, fixture.position)
+                assert fixture.direction(pan[i], tilt[i]) == pytest.approx(wanted / np.linalg.norm(wanted))
+
+
+def test_affine_dmx_coefficients():
+    system = dict(LIGHT_SYSTEMS["A"], pan_range=(-270, 270), pan_dmx_range=(1000, 64000))
+    fixture = Fixture.compile("A", system)
+    fixtures = FixtureArray([fixture])
+    values = fixtures.to_dmx(np.array([0.0]), np.array([260.0]))
+    assert int(values[0, 0]) * 256 + int(values[0, 1]) == 32500
+    assert fixture.dmx_values(0.0, 260.0) == tuple(int(value) for value in values[0])
+    assert fixture.dmx_values(900.0, -5.0) == (64000 >> 8, 64000 & 0xFF, 0, 0)
+    assert fixture.angles(32500, 65535) == pytest.approx((0.0, 260.0))
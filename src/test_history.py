@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from history import OccupancyGrid, PositionHistory
+from tracker import Snapshot
+
+
+def snapshot(tag_ids, positions, last_seen):
+    positions = np.array(positions, dtype=float).reshape(-1, 3)
+    return Snapshot(max(last_seen, default=None), tuple(tag_ids), positions, np.zeros_like(positions),
+                    np.array(last_seen, dtype=float), tag_ids[-1] if tag_ids else None, None)
+
+
+def test_ring_keeps_the_newest_rows_in_order():
+    positions = PositionHistory(capacity=4)
+    for i in range(6):
+        positions.append("14A2", float(i), (i, 0.0, 1.0))
+
+    assert positions.rows("14A2")[:, 0].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert positions.trail("14A2", 2).tolist() == [[4.0, 0.0, 1.0], [5.0, 0.0, 1.0]]
+    assert positions.latest_timestamp("14A2") == 5.0
+    assert positions.trail("0C31").shape == (0, 3)
+
+
+def test_add_snapshot_appends_only_new_positions():
+    positions = PositionHistory()
+    assert positions.add_snapshot(snapshot(["14A2", "0C31"], [(1, 1, 1), (2, 2, 1)], [0.1, 0.1])) == ["14A2", "0C31"]
+    assert positions.add_snapshot(snapshot(["14A2", "0C31"], [(1.1, 1, 1), (2, 2, 1)], [0.2, 0.1])) == ["14A2"]
+    assert len(positions.rows("14A2")) == 2
+
+    assert positions.add_snapshot(snapshot(["14A2"], [(1.2, 1, 1)], [0.3])) == ["14A2"]
+    assert "0C31" not in positions
+
+
+def test_occupancy_levels_and_bounds():
+    grid = OccupancyGrid(origin=(0.0, 0.0), size=(2.0, 1.0), cell=0.5, levels=4)
+    assert grid.shape == (2, 4)
+
+    changed = [grid.add((1.2, 0.7)) for _ in range(5)]
+    # levels change at 1, 2 and 4 visits
+    assert changed == [(1, 2), (1, 2), None, (1, 2), None]
+    assert grid.level(100) == 3
+    assert grid.add((-0.1, 0.2)) is None
+    assert grid.add((2.0, 0.2)) is None
+    assert grid.occupied() == [(1, 2, 5)]
+    assert grid.cell_center(1, 2) == pytest.approx((1.25, 0.75))
+
+    grid.clear()
+    assert grid.occupied() == []
@@ -1,4 +1,7 @@
-from kalman_filter import KalmanFilter
+import numpy as np
+import pytest
+
+from kalman_filter import KalmanFilter, KalmanFilterBank, ConstantVelocityKalmanFilterBank, FilterBank
 
 
 def test_initialization():
@@ -56,3 +59,175 @@ def test_negative_measurement_input():
     kf = KalmanFilter(1, 1)
     kf.input_latest_noisy_measurement(-5)
     assert kf.posteri_estimate < 0
+
+
+def test_filter_bank_matches_scalar_filter():
+    bank = KalmanFilterBank(1e-4, 1e-2)
+    scalar = [KalmanFilter(1e-4, 1e-2) for _ in range(3)]
+    for i, measurement in enumerate([(1.0, 2.0, 3.0), (1.5, 2.5, 2.0), (0.5, 3.0, 1.0)]):
+        bank.input_latest_noisy_measurement("A", measurement, timestamp=i)
+        for axis, kf in enumerate(scalar):
+            kf.input_latest_noisy_measurement(measurement[axis])
+
+    estimate = bank.get_latest_estimated_measurement("A")
+    assert list(estimate) == pytest.approx([kf.get_latest_estimated_measurement() for kf in scalar])
+
+
+def test_filter_bank_keeps_tags_separate():
+    bank = KalmanFilterBank(1, 0)
+    bank.input_latest_noisy_measurement("A", (1.0, 1.0, 1.0), timestamp=0)
+    bank.input_latest_noisy_measurement("B", (5.0, 5.0, 5.0), timestamp=0)
+    assert len(bank) == 2
+    assert list(bank.get_latest_estimated_measurement("A")) == [1.0, 1.0, 1.0]
+    assert list(bank.get_latest_estimated_measurement("B")) == [5.0, 5.0, 5.0]
+
+
+def test_filter_bank_grows_past_capacity():
+    bank = KalmanFilterBank(1, 0, capacity=2)
+    for i in range(5):
+        bank.input_latest_noisy_measurement(f"T{i}", (i, i, i), timestamp=0)
+    assert bank.capacity >= 5
+    assert [bank.get_latest_estimated_measurement(f"T{i}")[0] for i in range(5)] == [0, 1, 2, 3, 4]
+
+
+def test_filter_bank_evicts_stale_tags_and_reuses_rows():
+    bank = KalmanFilterBank(1, 0, stale_timeout=2.0)
+    bank.input_latest_noisy_measurement("A", (1.0, 1.0, 1.0), timestamp=0)
+    bank.input_latest_noisy_measurement("B", (2.0, 2.0, 2.0), timestamp=1.5)
+    row_a = bank.slots["A"]
+    generation = bank.generation
+
+    assert bank.evict_stale(now=2.5) == ["A"]
+    assert "A" not in bank
+    assert "B" in bank
+    assert bank.generation > generation
+
+    assert bank.slot("C") == row_a
+    assert list(bank.get_latest_estimated_measurement("C")) == [0.0, 0.0, 0.0]
+
+
+def walking_trajectory(speed=1.4, rate=10.0, duration=20.0, noise=0.05, seed=1):
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(0.0, duration, 1.0 / rate)
+    truth = np.stack([speed * timestamps, np.zeros_like(timestamps), np.ones_like(timestamps)], axis=1)
+    return timestamps, truth, truth + rng.normal(0.0, noise, truth.shape)
+
+
+def along_track_lag(estimates, truth, settle=30):
+    # Distance the estimate trails behind the performer along the walking direction (+x).
+    return float(np.mean(truth[settle:, 0] - estimates[settle:, 0]))
+
+
+def test_cv_filter_initializes_on_first_measurement():
+    bank = ConstantVelocityKalmanFilterBank()
+    bank.input_latest_noisy_measurement("A", (1.0, 2.0, 3.0), timestamp=10.0)
+    assert list(bank.get_latest_estimated_measurement("A")) == [1.0, 2.0, 3.0]
+    assert list(bank.velocities[bank.slots["A"]]) == [0.0, 0.0, 0.0]
+
+
+def test_cv_filter_estimates_velocity():
+    bank = ConstantVelocityKalmanFilterBank()
+    timestamps, truth, _ = walking_trajectory(noise=0.0)
+    for timestamp, position in zip(timestamps, truth):
+        bank.input_latest_noisy_measurement("A", position, timestamp)
+
+    assert list(bank.velocities[bank.slots["A"]]) == pytest.approx([1.4, 0.0, 0.0], abs=1e-3)
+
+
+def test_cv_filter_handles_variable_dt():
+    bank = ConstantVelocityKalmanFilterBank()
+    rng = np.random.default_rng(3)
+    timestamps = np.cumsum(rng.uniform(0.02, 0.3, 100))
+    for timestamp in timestamps:
+        bank.input_latest_noisy_measurement("A", (2.0 * timestamp, 0.0, 0.0), timestamp)
+
+    assert bank.velocities[bank.slots["A"]][0] == pytest.approx(2.0, abs=1e-3)
+    assert bank.positions[bank.slots["A"]][0] == pytest.approx(2.0 * timestamps[-1], abs=1e-3)
+
+
+def test_cv_filter_batch_matches_single_steps():
+    batch = ConstantVelocityKalmanFilterBank()
+    single = ConstantVelocityKalmanFilterBank()
+    timestamps, truth, measurements = walking_trajectory(duration=3.0)
+    offsets = np.array([[0.0, 0.0, 0.0], [5.0, -2.0, 0.0], [-3.0, 4.0, 1.0]])
+    tags = ["A", "B", "C"]
+
+    for timestamp, measurement in zip(timestamps, measurements):
+        batch.input_measurements(tags, measurement + offsets, timestamp)
+        for tag, offset in zip(tags, offsets):
+            single.input_latest_noisy_measurement(tag, measurement + offset, timestamp)
+
+    for tag in tags:
+        assert list(batch.get_latest_estimated_measurement(tag)) == \
+               pytest.approx(list(single.get_latest_estimated_measurement(tag)))
+
+
+def test_cv_filter_lags_less_than_scalar_filters_on_walking_trajectory():
+    bank = ConstantVelocityKalmanFilterBank()
+    scalar = [KalmanFilter(process_variance=1e-4, estimated_measurement_variance=0.1 ** 4) for _ in range(3)]
+    timestamps, truth, measurements = walking_trajectory()
+
+    cv_estimates, scalar_estimates = [], []
+    for timestamp, measurement in zip(timestamps, measurements):
+        bank.input_latest_noisy_measurement("A", measurement, timestamp)
+        cv_estimates.append(bank.get_latest_estimated_measurement("A").copy())
+        for axis, kf in enumerate(scalar):
+            kf.input_latest_noisy_measurement(measurement[axis])
+        scalar_estimates.append([kf.get_latest_estimated_measurement() for kf in scalar])
+
+    cv_lag = along_track_lag(np.array(cv_estimates), truth)
+    scalar_lag = along_track_lag(np.array(scalar_estimates), truth)
+    cv_error = np.mean(np.linalg.norm(np.array(cv_estimates) - truth, axis=1)[30:])
+    scalar_error = np.mean(np.linalg.norm(np.array(scalar_estimates) - truth, axis=1)[30:])
+
+    assert abs(cv_lag) < 0.02
+    assert scalar_lag > 0.05
+    assert cv_error < scalar_error
+
+
+def test_cv_filter_evicts_and_restarts_tracks():
+    bank = ConstantVelocityKalmanFilterBank(stale_timeout=1.0)
+    bank.input_latest_noisy_measurement("A", (1.0, 1.0, 1.0), timestamp=0.0)
+    assert bank.evict_stale(now=2.0) == ["A"]
+
+    bank.input_latest_noisy_measurement("A", (4.0, 4.0, 4.0), timestamp=2.0)
+    assert list(bank.get_latest_estimated_measurement("A")) == [4.0, 4.0, 4.0]
+
+
+def test_cv_filter_rejects_multipath_jumps():
+    bank = ConstantVelocityKalmanFilterBank()
+    timestamps, truth, measurements = walking_trajectory(duration=5.0)
+    for timestamp, measurement in zip(timestamps, measurements):
+        assert bank.input_latest_noisy_measurement("A", measurement, timestamp)
+
+    before = bank.get_latest_estimated_measurement("A").copy()
+    assert not bank.input_latest_noisy_measurement("A", before + (3.0, -2.0, 0.0), timestamps[-1] + 0.1)
+    assert list(bank.get_latest_estimated_measurement("A")) == list(before)
+    assert bank.stats() == {"accepted": len(timestamps), "rejected": 1, "track_resets": 0}
+
+
+def test_cv_filter_restarts_track_after_consecutive_rejections():
+    bank = ConstantVelocityKalmanFilterBank(max_rejections=3)
+    for i in range(20):
+        bank.input_latest_noisy_measurement("A", (0.0, 0.0, 0.0), i / 10)
+
+    for i in range(3):
+        accepted = bank.input_latest_noisy_measurement("A", (6.0, 0.0, 0.0), 2.0 + i / 10)
+        assert not accepted
+
+    assert list(bank.get_latest_estimated_measurement("A")) == [6.0, 0.0, 0.0]
+    assert bank.stats()["track_resets"] == 1
+    assert bank.input_latest_noisy_measurement("A", (6.0, 0.0, 0.0), 2.3)
+
+
+def test_cv_filter_gating_can_be_disabled():
+    bank = ConstantVelocityKalmanFilterBank(gate_threshold=None)
+    for i in range(20):
+        bank.input_latest_noisy_measurement("A", (0.0, 0.0, 0.0), i / 10)
+    assert bank.input_latest_noisy_measurement("A", (6.0, 0.0, 0.0), 2.0)
+    assert bank.stats()["rejected"] == 0
+
+
+def test_filter_bank_is_abstract():
+    with pytest.raises(TypeError):
+        FilterBank()
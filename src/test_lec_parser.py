@@ -0,0 +1,64 @@
+import math
+
+import lec_parser
+from lec_parser import TagSample, parse_line
+
+LISTENER_LINE = b"POS,0,14a2,1.23,0.45,0.67,55,x0D\r\n"
+LEP_LINE = b"POS,2.50,1.00,0.80,71\r\n"
+DIST_LINE = b"DIST,3,AN0,1151,0.00,0.00,0.00,2.47,AN1,0CA8,4.00,0.00,0.00,3.01,AN2,111C,0.00,3.00,0.00,2.12," \
+            b"POS,1.52,1.71,0.92,63\r\n"
+
+
+def test_listener_pos_line():
+    sample = parse_line(LISTENER_LINE)
+    assert sample == TagSample("14A2", 1.23, 0.45, 0.67, 55)
+    assert sample.position == (1.23, 0.45, 0.67)
+
+
+def test_lep_pos_line():
+    assert parse_line(LEP_LINE) == TagSample(None, 2.5, 1.0, 0.8, 71)
+
+
+def test_dist_line_with_position():
+    sample = parse_line(DIST_LINE)
+    assert sample.position == (1.52, 1.71, 0.92)
+    assert sample.quality == 63
+    assert sample.anchor_ids == ("1151", "0CA8", "111C")
+    assert sample.anchor_positions == ((0.0, 0.0, 0.0), (4.0, 0.0, 0.0), (0.0, 3.0, 0.0))
+    assert sample.distances == (2.47, 3.01, 2.12)
+
+
+def test_dist_line_without_position():
+    sample = parse_line(b"DIST,1,AN0,1151,0.00,0.00,0.00,2.47\r\n")
+    assert not sample.has_position
+    assert sample.distances == (2.47,)
+
+
+def test_accepts_bytearray_and_memoryview():
+    assert parse_line(bytearray(LISTENER_LINE)) == parse_line(LISTENER_LINE)
+    assert parse_line(memoryview(LISTENER_LINE)) == parse_line(LISTENER_LINE)
+
+
+def test_nan_position_is_dropped():
+    assert parse_line(b"POS,0,14A2,nan,nan,nan,0,x00\r\n") is None
+
+
+def test_corrupt_lines_do_not_raise():
+    corrupt = [b"", b"\r\n", b"dwm> ", b"POS", b"POS,0,14A2,1.2", b"POS,0,14A2,1.2,xx,0.3,5\r\n",
+               b"DIST,9,AN0,1151\r\n", b"DIST,x\r\n", b"DIST,-1\r\n", b"\xff\xfe,POS\r\n", LISTENER_LINE[:17],
+               DIST_LINE[:40]]
+    for line in corrupt:
+        assert parse_line(line) is None
+
+
+def test_corrupt_quality_is_none():
+    sample = parse_line(b"POS,0,14A2,1.0,2.0,3.0,??\r\n")
+    assert sample.quality is None
+    assert not math.isnan(sample.x)
+
+
+def test_tag_id_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(lec_parser, "_tag_ids", {})
+    for i in range(lec_parser.MAX_TAG_IDS + 10):
+        assert parse_line(b"POS,0,%X,1.0,2.0,3.0,50\r\n" % i).tag_id == "%X" % i
+    assert len(lec_parser._tag_ids) == lec_parser.MAX_TAG_IDS
@@ -0,0 +1,126 @@
+import logging
+import queue
+
+import pytest
+
+import log_utils
+from log_utils import NonBlockingQueueHandler, RateLimitFilter, StructuredLogHandler, read_structured_log
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers, root.level
+    yield root
+    root.handlers, root.level = handlers, level
+
+
+def test_rate_limit_per_template():
+    clock = FakeClock()
+    limiter = RateLimitFilter(rate=10, burst=2, clock=clock)
+
+    assert [limiter.filter(record("pan %s", i)) for i in range(4)] == [True, True, False, False]
+    assert limiter.filter(record("tilt %s", 1))
+    assert limiter.filter(record("pan %s", 5, level=logging.WARNING))
+
+    clock.now = 0.1
+    passed = record("pan %s", 6)
+    assert limiter.filter(passed)
+    assert passed.getMessage() == "pan 6 (2 similar suppressed)"
+    assert limiter.dropped == 2
+
+
+def test_rate_limit_overrides():
+    limiter = RateLimitFilter(rate=10, burst=1, limits={"raw %r": None, "noise": 0}, clock=FakeClock())
+    assert all(limiter.filter(record("raw %r", b"POS")) for _ in range(100))
+    assert not limiter.filter(record("noise"))
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(2))
+    for i in range(5):
+        handler.handle(record("sample %d", i))
+    assert handler.dropped == 3
+    queued = handler.queue.get_nowait()
+    # Formatting is left to the listener.
+    assert queued.msg == "sample %d" and queued.args == (0,)
+
+
+def test_queue_handler_formats_mutable_args_at_enqueue():
+    handler = NonBlockingQueueHandler(queue.Queue())
+    evicted = ["T1"]
+    handler.handle(record("evicted %s", evicted))
+    handler.handle(record("stats %s, count %d", (1, "a"), 2))
+    evicted.append("T2")
+
+    formatted, untouched = handler.queue.get_nowait(), handler.queue.get_nowait()
+    assert formatted.getMessage() == "evicted ['T1']" and formatted.template == "evicted %s"
+    assert untouched.msg == "stats %s, count %d" and untouched.args == ((1, "a"), 2)
+
+    # The rate limit still counts the formatted record against its template.
+    limiter = RateLimitFilter(rate=10, burst=1, clock=FakeClock())
+    assert limiter.filter(formatted)
+    assert not limiter.filter(record("evicted %s", "T3"))
+
+
+def test_structured_log_roundtrip(tmp_path):
+    path = tmp_path / "trace.bin"
+    handler = StructuredLogHandler(path)
+    handler.handle(record("pan: %s, tilt: %s", 12.5, 3.0))
+    handler.handle(record("pan: %s, tilt: %s", 13.0, 3.5, level=logging.DEBUG))
+    handler.handle(record("stats %s", {"tags": 1}))
+    handler.handle(record("object %s", object()))
+    handler.close()
+
+    records = list(read_structured_log(path))
+    assert [message for _, _, _, message in records[:3]] == ["pan: 12.5, tilt: 3.0", "pan: 13.0, tilt: 3.5",
+                                                             "stats {'tags': 1}"]
+    assert records[1][1] == logging.DEBUG
+    assert records[3][3].startswith("object <object object")
+    assert len(handler.templates) == 3
+
+
+def test_setup_formats_on_the_listener(tmp_path, root_logger):
+    text_path, structured_path = tmp_path / "uwb_data.log", tmp_path / "trace.bin"
+    pipeline = log_utils.setup(filename=text_path, level=logging.DEBUG, structured_path=structured_path, rate=1,
+                               burst=3)
+    logger = logging.getLogger("seguidor.test")
+    for i in range(10):
+        logger.debug("setting channel %d to value %d", 2, i)
+    logger.warning("exception %s", "boom")
+    pipeline.stop()
+
+    lines = text_path.read_text().splitlines()
+    assert len(lines) == 4
+    assert lines[0].endswith(" - setting channel 2 to value 0")
+    assert lines[-1].endswith(" - exception boom")
+    assert len(list(read_structured_log(structured_path))) == 11
+    assert pipeline.stats() == {"queue_dropped": 0, "rate_limited": 7}
+
+
+def test_setup_rate_limits_once_for_every_text_output(tmp_path, root_logger, capsys):
+    text_path, structured_path = tmp_path / "uwb_data.log", tmp_path / "trace.bin"
+    pipeline = log_utils.setup(filename=text_path, terminal=True, structured_path=structured_path, rate=1e-6,
+                               burst=2)
+    logger = logging.getLogger("seguidor.test")
+    for values in ([1], [2], [3]):
+        logger.info("evicted stale tags %s", values)
+    pipeline.stop()
+
+    # One token per record, not one per output, and the same bucket on both.
+    expected = ["evicted stale tags [1]", "evicted stale tags [2]"]
+    assert [line.split(" - ", 1)[1] for line in text_path.read_text().splitlines()] == expected
+    assert [line.split(" ", 1)[1] for line in capsys.readouterr().err.splitlines()] == expected
+    assert pipeline.stats()["rate_limited"] == 1
@@ -0,0 +1,46 @@
+import pytest
+
+import dmx_scheduler
+import main
+import tracker
+from capture import CaptureWriter
+from lec_parser import TagSample
+
+
+@pytest.fixture
+def created(monkeypatch):
+    # The tracker and the DMX scheduler init() builds, to look at once the replay is over.
+    instances = {}
+
+    class RecordingTagTracker(tracker.TagTracker):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            instances["tracker"] = self
+
+    class RecordingScheduler(dmx_scheduler.DmxRefreshScheduler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            instances["dmx"] = self
+
+    monkeypatch.setattr(tracker, "TagTracker", RecordingTagTracker)
+    monkeypatch.setattr(dmx_scheduler, "DmxRefreshScheduler", RecordingScheduler)
+    return instances
+
+
+@pytest.mark.parametrize("speed", [0.5, 2.0])
+def test_replay_speed_keeps_output_delay_and_latency(tmp_path, created, speed):
+    path = tmp_path / "show.cap"
+    with CaptureWriter(path) as writer:
+        # 1.2 s of real time at either speed.
+        for i in range(round(1.2 * speed * 20)):
+            writer.write(100.0 + i * 0.05, TagSample("14A2", 3.0 + 0.01 * i, 2.0, 1.0, 80))
+
+    main.init(None, None, ["BadBoy"], use_dmx_mock=True, replay=str(path), replay_speed=speed, headless=True,
+              poses_path=None)
+
+    # Frames go out on the replay's clock, so the delay is what it is live: part of a frame period, which at a
+    # different replay speed lasts that much longer in replay time. On the wall clock it would drift apart from the
+    # sample timestamps at 0.5 s per second, or go negative and be clamped to 0 above speed 1.
+    output_delay = created["dmx"].output_delay
+    assert 0.1 * speed / dmx_scheduler.DEFAULT_RATE_HZ < output_delay < 0.1
+    assert created["tracker"].latency == pytest.approx(main.FIXTURE_LATENCY + output_delay, abs=0.05)
@@ -0,0 +1,73 @@
+import urllib.error
+import urllib.request
+from unittest.mock import Mock
+
+import pytest
+
+import metrics
+from dmx_scheduler import DmxRefreshScheduler
+from metrics import Histogram, Metrics, MetricsServer
+from serial_reader import SerialReader
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(bounds=(0.001, 0.01, 0.1))
+    for value in (0.0005, 0.001, 0.005, 0.05, 5.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(5.0565)
+    assert histogram.quantile(0.2) == pytest.approx(0.0005)
+    assert histogram.quantile(0.6) == pytest.approx(0.01)
+    assert histogram.quantile(1.0) == 0.1
+    assert Histogram().quantile(0.5) is None
+
+
+def test_disabled_metrics_record_nothing():
+    disabled = Metrics(enabled=False)
+    disabled.observe("filter", 0.001)
+    assert disabled.stages == {}
+    assert metrics.DISABLED.enabled is False
+
+
+def test_render_prometheus_text():
+    registry = Metrics(bounds=(0.001, 0.01))
+    registry.observe("filter", 0.0005)
+    registry.observe("filter", 0.02)
+    registry.add_collector("tracker", lambda: {"tags": 2, "name": "ignored"})
+    registry.add_collector("broken", Mock(side_effect=RuntimeError("gone")))
+
+    text = registry.render()
+    assert 'seguidor_stage_seconds_bucket{stage="filter",le="0.001"} 1' in text
+    assert 'seguidor_stage_seconds_bucket{stage="filter",le="0.01"} 1' in text
+    assert 'seguidor_stage_seconds_bucket{stage="filter",le="+Inf"} 2' in text
+    assert 'seguidor_stage_seconds_count{stage="filter"} 2' in text
+    assert "seguidor_tracker_tags 2" in text
+    assert "ignored" not in text
+    assert registry.summary().startswith("p50/p99 ms  filter")
+
+
+def test_stages_instrumented_by_reader_and_scheduler():
+    registry = Metrics()
+    reader = SerialReader(None, lambda line: ("14A2", line), metrics=registry)
+    reader.feed(b"POS,14A2\nPOS,14A2\n", 1.0)
+    assert registry.stages["parse"].count == 2
+
+    scheduler = DmxRefreshScheduler(Mock(), metrics=registry)
+    scheduler.publish(timestamp=10.0)
+    scheduler.send_frame(now=10.025)
+    assert registry.stages["dmx_output"].sum == pytest.approx(0.025)
+    assert registry.stages["dmx_write"].count == 1
+
+
+def test_server_serves_metrics():
+    registry = Metrics()
+    registry.observe("aim", 0.0001)
+    with MetricsServer(registry, port=0) as server:
+        url = f"http://127.0.0.1:{server.port}"
+        with urllib.request.urlopen(f"{url}/metrics", timeout=2) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert 'seguidor_stage_seconds_count{stage="aim"} 1' in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other", timeout=2)
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from fixtures import FixtureArray, split_dmx
+from kalman_filter import KalmanFilterBank
+from motion import MotionLimiter, configured
+from tracker import TagTracker
+
+LIGHT_SYSTEMS = {
+    name: {
+        "position": (0, 0, 0),
+        "pan_range": (0, 540),
+        "tilt_range": (0, 270),
+        "pan_dmx_range": (0, 65535),
+        "tilt_dmx_range": (0, 65535),
+        "pan_channel": channel,
+        "pan_fine_channel": channel + 1,
+        "tilt_channel": channel + 2,
+        "tilt_fine_channel": channel + 3
+    } for name, channel in (("A", 1), ("B", 5))
+}
+PAN_STEPS = 65535 / 540  # 16 bit values per degree
+TILT_STEPS = 65535 / 270
+DT = 1 / 40
+
+
+def run(limiter, frames, start=0):
+    # Positions in degrees after every frame, (frames, 2, N).
+    universe = np.zeros(513, dtype=np.uint8)
+    trace = []
+    for frame in range(start, start + frames):
+        limiter.write_dmx(universe, frame * DT)
+        trace.append(limiter.positions / np.array([[PAN_STEPS], [TILT_STEPS]]))
+    return np.array(trace)
+
+
+def test_speed_and_acceleration_limits():
+    fixture_array = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    limiter = MotionLimiter(fixture_array, [(180, 90)], [720])
+    limiter.set_targets(np.array([[270 * PAN_STEPS], [60 * TILT_STEPS]]))
+
+    trace = run(limiter, 120)
+    speeds = np.diff(trace, axis=0) / DT
+    accelerations = np.diff(speeds, axis=0) / DT
+    assert np.abs(speeds[:, 0]).max() == pytest.approx(180)
+    assert np.abs(speeds[:, 1]).max() == pytest.approx(90)
+    assert np.abs(accelerations).max() <= 720 + 1e-6
+    # Brakes onto the target, it never goes past it.
+    assert trace[:, 0].max() <= 270 + 1e-9 and trace[:, 1].max() <= 60 + 1e-9
+    assert trace[-1, :, 0] == pytest.approx((270, 60))
+    assert not limiter.moving()
+
+
+def test_jump_mid_move_reverses_smoothly():
+    fixture_array = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    limiter = MotionLimiter(fixture_array, [200], [600])
+    limiter.set_targets(np.array([[400 * PAN_STEPS], [0.0]]))
+    first = run(limiter, 30)
+    limiter.set_targets(np.array([[100 * PAN_STEPS], [0.0]]))
+    second = run(limiter, 150, start=30)
+
+    trace = np.concatenate((first, second))[:, 0, 0]
+    speeds = np.diff(trace) / DT
+    assert np.abs(np.diff(speeds) / DT).max() <= 600 + 1e-6
+    assert trace[30:].min() >= 100 - 1e-9
+    assert trace[-1] == pytest.approx(100)
+
+
+def test_unlimited_follows_in_one_frame():
+    fixture_array = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    limiter = MotionLimiter(fixture_array)
+    limiter.set_targets(np.array([[30000.0], [20000.0]]))
+
+    universe = np.zeros(513, dtype=np.uint8)
+    limiter.write_dmx(universe, 0.0)
+    limiter.write_dmx(universe, DT)
+    assert list(universe[1:5]) == [30000 >> 8, 30000 & 0xFF, 20000 >> 8, 20000 & 0xFF]
+
+
+def test_only_targeted_fixtures_are_written():
+    fixture_array = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A", "B"])
+    limiter = MotionLimiter(fixture_array)
+    universe = np.full(513, 7, dtype=np.uint8)
+    assert limiter.write_dmx(universe, 0.0) is None
+
+    limiter.set_targets(np.array([[1000.0, 2000.0], [1000.0, 2000.0]]), np.array([False, True]), timestamp=5.0)
+    limiter.write_dmx(universe, DT)
+    assert limiter.fresh_timestamp == 5.0
+    assert list(universe[1:5]) == [7, 7, 7, 7]
+    assert list(universe[5:9]) == [2000 >> 8, 2000 & 0xFF, 2000 >> 8, 2000 & 0xFF]
+
+    # A later partial update keeps the other fixture's target.
+    limiter.set_targets(np.array([[3000.0, 0.0], [3000.0, 0.0]]), np.array([True, False]))
+    limiter.write_dmx(universe, 2 * DT)
+    limiter.write_dmx(universe, 3 * DT)
+    assert limiter.fresh_timestamp is None
+    assert list(universe[1:3]) == [3000 >> 8, 3000 & 0xFF]
+    assert list(universe[5:7]) == [2000 >> 8, 2000 & 0xFF]
+
+
+def test_light_system_limits_and_tracker_targets():
+    light_systems = {"A": dict(LIGHT_SYSTEMS["A"], max_speed=(90, 45)), "B": LIGHT_SYSTEMS["B"]}
+    assert configured(light_systems, ["A", "B"]) and not configured(LIGHT_SYSTEMS, ["A", "B"])
+    fixture_array = FixtureArray.from_light_systems(light_systems, ["A", "B"])
+    limiter = MotionLimiter.from_light_systems(fixture_array, light_systems, max_speed=180)
+    assert limiter.max_speed[:, 0] == pytest.approx((90 * PAN_STEPS, 45 * TILT_STEPS))
+    assert limiter.max_speed[:, 1] == pytest.approx((180 * PAN_STEPS, 180 * TILT_STEPS))
+    assert np.isinf(limiter.max_acceleration).all()
+
+    # The limiter's targets are what write_dmx would have sent straight away.
+    tag_tracker = TagTracker(fixture_array, KalmanFilterBank(1, 0))
+    tag_tracker.update("T1", (1.0, 2.0, 0.5), timestamp=0)
+    values, mask = tag_tracker.dmx_targets()
+    assert mask.all()
+    assert (split_dmx(values.T.astype(np.int32)) == fixture_array.to_dmx(fixture_array.pan, fixture_array.tilt)).all()
+
+    with pytest.raises(ValueError):
+        MotionLimiter(fixture_array, [-1, None])
+    with pytest.raises(ValueError):
+        MotionLimiter(fixture_array, [100])
@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+import pytest
+
+from lec_parser import TagSample, parse_line
+from multilateration import Multilaterator, gauss_newton
+
+ANCHORS = [(0.0, 0.0, 2.5), (8.0, 0.0, 2.5), (8.0, 6.0, 2.5), (0.0, 6.0, 2.5)]
+ANCHOR_IDS = ("1151", "0CA8", "111C", "1C2D")
+
+
+def ranges_sample(position, anchors=ANCHORS, anchor_ids=ANCHOR_IDS, with_positions=True):
+    # lec without a POS section, the module did not compute a position.
+    distances = tuple(math.dist(position, anchor) for anchor in anchors)
+    return TagSample("14A2", math.nan, math.nan, math.nan, 80, anchor_ids, tuple(anchors) if with_positions else (),
+                     distances)
+
+
+def test_gauss_newton_batch():
+    truth = np.array([[4.0, 3.0, 1.2], [1.0, 5.0, 0.3], [7.5, 0.5, 1.8]])
+    anchors = np.broadcast_to(np.array(ANCHORS), (3, 4, 3))
+    distances = np.linalg.norm(truth[:, None, :] - anchors, axis=2)
+
+    # Anchors all at 2.5 m, starting below them finds the tag and not its mirror above.
+    positions, residuals = gauss_newton(anchors, distances, np.tile((4.0, 3.0, 1.0), (3, 1)))
+    assert positions == pytest.approx(truth, abs=1e-4)
+    assert residuals == pytest.approx(0.0, abs=1e-4)
+
+
+def test_gauss_newton_masked_anchor_counts():
+    truth = (2.0, 2.0, 1.0)
+    anchors = np.zeros((1, 6, 3))
+    anchors[0, :3] = ANCHORS[:3]
+    anchors[0, 3:] = (4.0, 3.0, 0.0)  # padding, must not count
+    distances = np.full((1, 6), np.nan)
+    distances[0, :3] = [math.dist(truth, anchor) for anchor in ANCHORS[:3]]
+    mask = np.array([[1, 1, 1, 0, 0, 0]])
+
+    positions, residuals = gauss_newton(anchors, distances, [(3.0, 3.0, 1.5)], mask)
+    assert positions[0] == pytest.approx(truth, abs=1e-4)
+
+
+def test_more_anchors_than_the_module_reports():
+    rng = np.random.default_rng(1)
+    anchors = [(x, y, z) for x in (0.0, 6.0, 12.0) for y in (0.0, 8.0) for z in (0.3, 2.8)]
+    truth = (5.0, 3.0, 1.1)
+    distances = np.array([math.dist(truth, anchor) for anchor in anchors]) + rng.normal(0.0, 0.05, len(anchors))
+
+    positions, residuals = gauss_newton([anchors], [distances], [(6.0, 4.0, 1.2)])
+    assert len(anchors) == 12
+    assert math.dist(positions[0], truth) < 0.1
+    assert residuals[0] == pytest.approx(0.05, abs=0.03)
+
+
+def test_locate_warm_starts_each_tag():
+    multilaterator = Multilaterator(ANCHORS)
+    walk = [(1.0 + 0.1 * step, 2.0, 1.2) for step in range(5)]
+    for timestamp, position in enumerate(walk):
+        located = multilaterator.locate({"14A2": (timestamp, ranges_sample(position))})
+        assert located["14A2"].position == pytest.approx(position, abs=1e-4)
+        assert located["14A2"].distances == ranges_sample(position).distances
+    assert multilaterator.estimates["14A2"] == pytest.approx(walk[-1], abs=1e-4)
+    assert multilaterator.stats() == {"solved": 5, "rejected": 0, "skipped": 0, "anchors": 4}
+
+
+def test_locate_parsed_lec_line():
+    truth = (2.0, 3.0, 1.0)
+    fields = [f"AN{i},{anchor_id},{x:.2f},{y:.2f},{z:.2f},{math.dist(truth, (x, y, z)):.2f}"
+              for i, (anchor_id, (x, y, z)) in enumerate(zip(ANCHOR_IDS, ANCHORS))]
+    line = f"DIST,4,{','.join(fields)},POS,2.10,3.20,1.00,63\r\n".encode()
+
+    located = Multilaterator(ANCHORS).locate({None: (0.0, parse_line(line))})
+    # Ranges are printed to the centimetre.
+    assert located[None].position == pytest.approx(truth, abs=0.05)
+    assert located[None].quality == 63
+
+
+def test_ranges_without_positions_use_learned_anchors():
+    multilaterator = Multilaterator()
+    multilaterator.locate({"14A2": (0.0, ranges_sample((3.0, 3.0, 1.0)))})
+
+    # Anchor node style ranges: ids and distances only, plus an anchor nobody has seen, which is ignored.
+    sample = ranges_sample((5.0, 2.0, 1.0), ANCHORS + [(4.0, 3.0, 2.5)], ANCHOR_IDS + ("FFFF",),
+                           with_positions=False)
+    located = multilaterator.locate({"14A2": (1.0, sample)})
+    assert located["14A2"].position == pytest.approx((5.0, 2.0, 1.0), abs=1e-4)
+
+
+def test_bad_fits_and_too_few_ranges_are_left_to_the_module():
+    multilaterator = Multilaterator(ANCHORS)
+    good = ranges_sample((3.0, 3.0, 1.0))
+    bad = TagSample("0C31", 1.0, 1.0, 1.0, 50, ANCHOR_IDS, tuple(ANCHORS), (1.0, 9.0, 1.0, 9.0))
+    short = TagSample("1D00", 1.0, 1.0, 1.0, 50, ANCHOR_IDS[:2], tuple(ANCHORS[:2]), (3.0, 3.0))
+    position_only = TagSample("2E00", 1.0, 1.0, 1.0, 50)
+
+    located = multilaterator.locate({"14A2": (0.0, good), "0C31": (0.0, bad), "1D00": (0.0, short),
+                                     "2E00": (0.0, position_only)})
+    assert list(located) == ["14A2"]
+    assert "0C31" not in multilaterator.estimates
+    assert multilaterator.stats()["rejected"] == 1
+    assert multilaterator.stats()["skipped"] == 1
+
+    with pytest.raises(ValueError):
+        Multilaterator(min_anchors=2)
@@ -0,0 +1,103 @@
+import threading
+import time
+
+from serial_reader import LineRingBuffer, LatestSamples, SerialReader
+
+
+def parse(line):
+    fields = line.strip().split(b",")
+    if fields[0] != b"POS":
+        return None
+    return fields[1].decode(), float(fields[2])
+
+
+class FakeSerial:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.done = threading.Event()
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, size):
+        if not self.chunks:
+            self.done.set()
+            time.sleep(0.01)
+            return b""
+        chunk = self.chunks[0]
+        data, rest = chunk[:size], chunk[size:]
+        if rest:
+            self.chunks[0] = rest
+        else:
+            self.chunks.pop(0)
+        return data
+
+
+def test_ring_buffer_frames_lines_across_writes():
+    ring = LineRingBuffer(64)
+    ring.write(b"POS,A,1\nPOS,")
+    assert ring.readline() == b"POS,A,1\n"
+    assert ring.readline() is None
+    ring.write(b"B,2\n")
+    assert ring.readline() == b"POS,B,2\n"
+    assert len(ring) == 0
+
+
+def test_ring_buffer_wraps_around():
+    ring = LineRingBuffer(16)
+    for i in range(10):
+        ring.write(b"line %d\n" % i)
+        assert ring.readline() == b"line %d\n" % i
+    assert ring.overflow_bytes == 0
+
+
+def test_ring_buffer_drops_overwritten_line():
+    ring = LineRingBuffer(16)
+    ring.write(b"0123456789\n")
+    ring.write(b"abcdefghij\n")
+    assert ring.overflow_bytes == 6
+    assert ring.readline() == b"abcdefghij\n"
+    assert ring.dropped_lines == 1
+
+
+def test_ring_buffer_write_larger_than_capacity():
+    ring = LineRingBuffer(8)
+    ring.write(b"xxxxxxxxxxxx\nabc\n")
+    assert ring.readline() == b"abc\n"
+    assert ring.readline() is None
+
+
+def test_latest_samples_coalesce_per_key():
+    samples = LatestSamples()
+    samples.put("A", 1)
+    samples.put("B", 1)
+    samples.put("A", 2)
+    assert samples.take(timeout=0) == {"A": 2, "B": 1}
+    assert samples.coalesced == 1
+    assert samples.take(timeout=0) == {}
+
+
+def test_latest_samples_take_waits_for_data():
+    samples = LatestSamples()
+    threading.Timer(0.05, samples.put, args=("A", 1)).start()
+    assert samples.take(timeout=1.0) == {"A": 1}
+
+
+def test_reader_keeps_latest_sample_per_tag():
+    reader = SerialReader(None, parse)
+    reader.feed(b"POS,A,1\nPOS,B,5\nDIST,x\nPOS,A,2\nPOS,A,", timestamp=10.0)
+    reader.feed(b"3\n", timestamp=11.0)
+
+    assert reader.take(timeout=0) == {"A": (11.0, ("A", 3.0)), "B": (10.0, ("B", 5.0))}
+    assert reader.stats() == {"lines": 5, "unparsed": 1, "coalesced": 2, "dropped_lines": 0, "overflow_bytes": 0}
+
+
+def test_reader_thread():
+    ser = FakeSerial([b"POS,A,1\nPO", b"S,A,2\n", b"POS,B,7\n"])
+    with SerialReader(ser, parse) as reader:
+        assert ser.done.wait(1.0)
+
+    samples = reader.take(timeout=0)
+    assert samples["A"][1] == ("A", 2.0)
+    assert samples["B"][1] == ("B", 7.0)
@@ -0,0 +1,42 @@
+import json
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from state_server import StateServer, iter_states, snapshot_to_dict
+from tracker import Snapshot
+
+
+def snapshot(x, timestamp):
+    return Snapshot(timestamp, ("14A2",), np.array([[x, 2.0, 1.0]]), np.array([[1.4, 0.0, 0.0]]),
+                    np.array([timestamp]), "14A2", {"tracker": {"tags": 1}})
+
+
+def test_snapshot_to_dict_is_json():
+    state = json.loads(json.dumps(snapshot_to_dict(snapshot(1.5, 10.0))))
+    assert state == {"timestamp": 10.0, "latest_tag": "14A2",
+                     "tags": {"14A2": {"position": [1.5, 2.0, 1.0], "velocity": [1.4, 0.0, 0.0], "last_seen": 10.0}},
+                     "stats": {"tracker": {"tags": 1}}}
+
+
+def test_clients_receive_the_latest_state():
+    with StateServer(port=0, rate_hz=100) as server:
+        states = iter_states(port=server.port, timeout=2.0)
+        server.publish(snapshot(1.0, 1.0))
+        assert next(states)["tags"]["14A2"]["position"][0] == 1.0
+        server.publish(snapshot(2.0, 2.0))
+        assert next(states)["timestamp"] == 2.0
+        assert server.stats()["clients"] == 1
+        states.close()
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        StateServer(port=0, rate_hz=0)
+
+
+def test_main_does_not_import_tkinter():
+    code = "import sys, main; assert 'tkinter' not in sys.modules and 'uwb_visualizer' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
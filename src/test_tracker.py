@@ -0,0 +1,192 @@
+import numpy as np
+import pytest
+
+from fixtures import Fixture, FixtureArray
+from kalman_filter import KalmanFilterBank, ConstantVelocityKalmanFilterBank
+from tracker import TagTracker, parse_assignments
+
+LIGHT_SYSTEMS = {
+    name: {
+        "position": (0, 0, 0),
+        "pan_range": (0, 540),
+        "tilt_range": (0, 270),
+        "pan_dmx_range": (0, 65535),
+        "tilt_dmx_range": (0, 65535),
+        "pan_channel": channel,
+        "pan_fine_channel": channel + 1,
+        "tilt_channel": channel + 2,
+        "tilt_fine_channel": channel + 3
+    } for name, channel in (("A", 1), ("B", 5), ("C", 9))
+}
+
+
+def make_tracker(assignments=None):
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A", "B", "C"])
+    bank = KalmanFilterBank(1, 0, stale_timeout=1.0)
+    return TagTracker(fixtures, bank, assignments)
+
+
+def test_parse_assignments():
+    assert parse_assignments("") == {}
+    assert parse_assignments("A=14a2, B = 0C31") == {"A": "14A2", "B": "0C31"}
+    with pytest.raises(ValueError):
+        parse_assignments("A14A2")
+
+
+def test_unknown_fixture_assignment():
+    with pytest.raises(ValueError):
+        make_tracker({"D": "14A2"})
+
+
+def test_unassigned_fixtures_follow_latest_tag():
+    tag_tracker = make_tracker({"A": "T1"})
+    tag_tracker.update("T1", (1.0, 0.0, 0.0), timestamp=0)
+    tag_tracker.update("T2", (0.0, 1.0, 0.0), timestamp=0)
+
+    targets, mask = tag_tracker.targets()
+    assert mask.all()
+    assert list(targets[0]) == [1.0, 0.0, 0.0]
+    assert list(targets[1]) == [0.0, 1.0, 0.0]
+    assert list(targets[2]) == [0.0, 1.0, 0.0]
+
+
+def test_missing_tag_leaves_fixture_untouched():
+    tag_tracker = make_tracker({"A": "T1", "B": "T2"})
+    tag_tracker.update("T2", (0.0, 1.0, 0.0), timestamp=0)
+
+    universe = np.full(513, 7, dtype=np.uint8)
+    tag_tracker.write_dmx(universe)
+    assert list(universe[1:5]) == [7, 7, 7, 7]
+    assert list(universe[5:9]) != [7, 7, 7, 7]
+
+
+def test_stale_tags_are_evicted():
+    tag_tracker = make_tracker({"A": "T1"})
+    tag_tracker.update("T1", (1.0, 0.0, 0.0), timestamp=0)
+    _, evicted = tag_tracker.update("T2", (0.0, 1.0, 0.0), timestamp=5)
+    assert evicted == ["T1"]
+
+    _, mask = tag_tracker.targets()
+    assert list(mask) == [False, True, True]
+
+
+def test_targets_are_extrapolated_by_latency():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    bank = ConstantVelocityKalmanFilterBank()
+    tag_tracker = TagTracker(fixtures, bank, latency=0.2)
+    for i in range(50):
+        tag_tracker.update("T1", (1.0 * i / 10, 0.0, 0.0), timestamp=i / 10)
+
+    targets, _ = tag_tracker.targets()
+    assert targets[0][0] == pytest.approx(4.9, abs=1e-3)
+
+    targets, _ = tag_tracker.targets(now=4.9)
+    assert targets[0][0] == pytest.approx(5.1, abs=1e-3)
+
+    # Between UWB samples the output keeps moving with the filtered velocity.
+    targets, _ = tag_tracker.targets(now=4.95)
+    assert targets[0][0] == pytest.approx(5.15, abs=1e-3)
+
+
+def test_extrapolation_is_capped_for_silent_tags():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    bank = ConstantVelocityKalmanFilterBank()
+    tag_tracker = TagTracker(fixtures, bank, latency=0.2, max_prediction=0.5)
+    for i in range(50):
+        tag_tracker.update("T1", (1.0 * i / 10, 0.0, 0.0), timestamp=i / 10)
+
+    targets, _ = tag_tracker.targets(now=100.0)
+    assert targets[0][0] == pytest.approx(5.4, abs=1e-3)
+
+
+def test_low_quality_samples_are_dropped():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    tag_tracker = TagTracker(fixtures, ConstantVelocityKalmanFilterBank(), min_quality=50)
+
+    position, _ = tag_tracker.update("T1", (1.0, 0.0, 0.0), timestamp=0, quality=20)
+    assert position is None
+    assert "T1" not in tag_tracker.filter_bank
+
+    position, _ = tag_tracker.update("T1", (1.0, 0.0, 0.0), timestamp=0.1, quality=80)
+    assert list(position) == [1.0, 0.0, 0.0]
+    assert tag_tracker.stats() == {"low_quality": 1, "tags": 1, "accepted": 1, "rejected": 0, "track_resets": 0}
+    assert TagTracker(fixtures, KalmanFilterBank(1, 0)).stats() == {"low_quality": 0, "tags": 0}
+
+
+def test_gated_samples_do_not_move_the_target():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    tag_tracker = TagTracker(fixtures, ConstantVelocityKalmanFilterBank())
+    for i in range(20):
+        tag_tracker.update("T1", (1.0, 0.0, 0.0), timestamp=i / 10)
+
+    position, _ = tag_tracker.update("T1", (5.0, 5.0, 0.0), timestamp=2.0)
+    assert position is None
+    targets, _ = tag_tracker.targets()
+    assert list(targets[0]) == pytest.approx([1.0, 0.0, 0.0])
+
+
+def test_snapshot_is_a_copy():
+    bank = ConstantVelocityKalmanFilterBank()
+    tag_tracker = TagTracker(FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"]), bank)
+    tag_tracker.update("14A2", (1.0, 2.0, 1.0), 0.0)
+    tag_tracker.update("0C31", (3.0, 1.0, 1.0), 0.0)
+    tag_tracker.update("14A2", (1.1, 2.0, 1.0), 0.1)
+
+    snapshot = tag_tracker.snapshot(0.1, {"tags": 2})
+    assert snapshot.tag_ids == ("14A2", "0C31")
+    assert snapshot.latest_tag == "14A2"
+    assert snapshot.position == pytest.approx(tuple(bank.get_latest_estimated_measurement("14A2")))
+    assert snapshot.velocity[0] > 0
+    assert snapshot.stats == {"tags": 2}
+
+    tag_tracker.update("14A2", (1.2, 2.0, 1.0), 0.2)
+    assert snapshot.position[0] < bank.positions[bank.slots["14A2"], 0]
+
+
+def test_snapshot_without_tags():
+    fixtures = FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"])
+    snapshot = TagTracker(fixtures, ConstantVelocityKalmanFilterBank()).snapshot()
+    assert snapshot.tag_ids == ()
+    assert snapshot.positions.shape == (0, 3)
+    assert snapshot.position is None
+
+
+def test_replace_fixture_takes_effect_at_the_next_aim():
+    tag_tracker = make_tracker()
+    tag_tracker.update("T1", (1.0, 1.0, 0.0), timestamp=0)
+    universe = np.zeros(513, dtype=np.uint8)
+    tag_tracker.write_dmx(universe)
+    before = tag_tracker.fixture_array
+
+    moved = Fixture.compile("B", dict(LIGHT_SYSTEMS["B"], position=(2.0, 0.0, 0.0)))
+    tag_tracker.replace_fixture(moved)
+    assert tag_tracker.fixture_array is not before
+    assert tag_tracker.fixture_array.fixtures[1] is moved
+    assert list(tag_tracker.fixture_array.angles[:, 0]) == list(before.angles[:, 0])
+
+    moved_universe = universe.copy()
+    tag_tracker.write_dmx(moved_universe)
+    assert list(moved_universe[1:5]) == list(universe[1:5])
+    assert list(moved_universe[5:9]) != list(universe[5:9])
+
+    with pytest.raises(ValueError):
+        tag_tracker.replace_fixture(Fixture.compile("D", LIGHT_SYSTEMS["A"]))
+
+
+@pytest.mark.parametrize("make_bank", [lambda: KalmanFilterBank(1, 0), ConstantVelocityKalmanFilterBank])
+def test_update_batch_matches_sample_by_sample(make_bank):
+    single = TagTracker(FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"]), make_bank(), min_quality=50)
+    batched = TagTracker(FixtureArray.from_light_systems(LIGHT_SYSTEMS, ["A"]), make_bank(), min_quality=50)
+    for step in range(10):
+        position, other = (0.1 * step, 1.0, 1.2), (0.1 * step, 3.0, 1.2)
+        for tag_id, sample, quality in (("T1", position, 80), ("T2", other, 80), ("T3", other, 10)):
+            single.update(tag_id, sample, step / 10, quality)
+        accepted, _ = batched.update_batch(["T1", "T2", "T3"], [position, other, other], [step / 10] * 3,
+                                           [80, 80, 10])
+        assert list(accepted) == [True, True, False]
+
+    for tag_id in ("T1", "T2"):
+        assert batched.filter_bank.get_latest_estimated_measurement(tag_id) == \
+            pytest.approx(single.filter_bank.get_latest_estimated_measurement(tag_id))
+    assert "T3" not in batched.filter_bank
+    assert batched.low_quality == single.low_quality == 10
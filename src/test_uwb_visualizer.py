@@ -1,5 +1,8 @@
 import unittest.mock as mock
 
+import numpy as np
+import pytest
+
 from uwb_visualizer import UWBVisualizer  # replace with your actual module name
 
 
@@ -77,3 +80,43 @@ def test_on_anchor_click(mock_save_anchor_colors):
     assert visualizer.anchor_colors == [0, 1, 0]
     mock_save_anchor_colors.assert_called_once()  # Ensure save_anchor_colors is called
 
+
+
+def test_view_transform_matches_rotate_scale_and_offset():
+    visualizer = UWBVisualizer()
+    visualizer.offset_x, visualizer.offset_y, visualizer.scale, visualizer.rotation_angle = 40, -20, 60, 1.2
+    canvas = mock.Mock()
+    canvas.winfo_width.return_value = 650
+    canvas.winfo_height.return_value = 250
+
+    transform = visualizer.view_transform(650, 250)
+    for pos in [(0.0, 0.0), (1.5, -2.0), (8.0, 6.0)]:
+        expected = visualizer.rotate_scale_and_offset((325, 125), pos, canvas)
+        assert visualizer.to_canvas(transform, pos) == pytest.approx(expected)
+
+
+def test_publish_snapshot():
+    visualizer = UWBVisualizer()
+    snapshot = mock.Mock(position=(4.0, 5.0, 1.0))
+    visualizer.publish(snapshot)
+    assert visualizer.snapshot is snapshot
+    assert visualizer.position == (4.0, 5.0, 1.0)
+
+    visualizer.publish(mock.Mock(position=None))
+    assert visualizer.position == (4.0, 5.0, 1.0)
+
+
+def test_to_canvas_array_and_heat_cells():
+    visualizer = UWBVisualizer()
+    visualizer.offset_x, visualizer.offset_y, visualizer.scale, visualizer.rotation_angle = 0, 0, 40, 0.7
+    transform = visualizer.view_transform(650, 250)
+
+    points = np.array([[0.0, 0.0, 1.0], [1.5, -2.0, 1.0]])
+    expected = [visualizer.to_canvas(transform, point) for point in points]
+    assert visualizer.to_canvas_array(transform, points) == pytest.approx(np.array(expected))
+
+    x0, y0, x1, y1 = visualizer.heat_cell_rect(transform, 8, 8, 650, 250)
+    assert (x1 - x0, y1 - y0) == (10, 10)
+    center = visualizer.to_canvas(transform, visualizer.occupancy.cell_center(8, 8))
+    assert x0 < center[0] < x1 and y0 < center[1] < y1
+    assert visualizer.heat_cell_rect(transform, 0, 1000, 650, 250) is None
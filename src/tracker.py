@@ -0,0 +1,156 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+def parse_assignments(assignments):
+    # "BadBoy=14A2,Sparky=0C31" -> {"BadBoy": "14A2", "Sparky": "0C31"}
+    parsed = {}
+    if not assignments:
+        return parsed
+    for assignment in assignments.split(","):
+        fixture, sep, tag_id = assignment.partition("=")
+        if not sep or not fixture.strip() or not tag_id.strip():
+            raise ValueError(f"Invalid tag assignment '{assignment}', expected <light system>=<tag id>")
+        parsed[fixture.strip()] = tag_id.strip().upper()
+    return parsed
+
+
+class Snapshot(namedtuple("Snapshot", "timestamp tag_ids positions velocities last_seen latest_tag stats")):
+    # Immutable tracker state handed to other threads by swapping a single reference. The arrays are copies made
+    # when the snapshot was taken, row i belongs to tag_ids[i].
+    __slots__ = ()
+
+    @property
+    def position(self):
+        if self.latest_tag not in self.tag_ids:
+            return None
+        return tuple(float(axis) for axis in self.positions[self.tag_ids.index(self.latest_tag)])
+
+    @property
+    def velocity(self):
+        if self.latest_tag not in self.tag_ids:
+            return None
+        return tuple(float(axis) for axis in self.velocities[self.tag_ids.index(self.latest_tag)])
+
+
+class TagTracker:
+    # latency is how far ahead of the last measurement fixtures are aimed, max_prediction caps how long a tag that
+    # stopped reporting keeps being extrapolated. Samples reporting a quality factor below min_quality are dropped
+    # before reaching the filter.
+    def __init__(self, fixture_array, filter_bank, assignments=None, latency=0.0, max_prediction=0.5,
+                 min_quality=0):
+        self.fixture_array = fixture_array
+        self.filter_bank = filter_bank
+        self.latency = latency
+        self.max_prediction = max_prediction
+        self.min_quality = min_quality
+        self.low_quality = 0
+        self.assignments = {}
+        self.latest_tag = None
+        self._assigned_rows = None
+        self._follow_latest = None
+        self._rows_generation = -1
+
+        for fixture, tag_id in (assignments or {}).items():
+            self.assign(fixture, tag_id)
+
+    def assign(self, fixture, tag_id):
+        if fixture not in self.fixture_array.index:
+            raise ValueError(f"Unknown light system '{fixture}'. Please select from {self.fixture_array.names}")
+        self.assignments[fixture] = tag_id
+        self._rows_generation = -1
+
+    def replace_fixture(self, fixture):
+        # Takes effect at the next aim, from whichever thread. Names and rows do not change.
+        if fixture.name not in self.fixture_array.index:
+            raise ValueError(f"Unknown light system '{fixture.name}'. Please select from {self.fixture_array.names}")
+        self.fixture_array = self.fixture_array.with_fixture(fixture)
+
+    def update(self, tag_id, position, timestamp, quality=None):
+        # Returns the filtered position, or None when the sample was rejected, and the tags evicted as stale.
+        evicted = self.filter_bank.evict_stale(timestamp)
+        if quality is not None and quality < self.min_quality:
+            self.low_quality += 1
+            return None, evicted
+
+        if not self.filter_bank.input_latest_noisy_measurement(tag_id, position, timestamp):
+            return None, evicted
+
+        self.latest_tag = tag_id
+        return self.filter_bank.get_latest_estimated_measurement(tag_id), evicted
+
+    def update_batch(self, tag_ids, positions, timestamps, qualities=None):
+        # update() for a batch with at most one sample per tag, as taken from a source, in one filter call.
+        # Returns the mask of samples the filter accepted and the tags evicted as stale.
+        timestamps = np.asarray(timestamps, dtype=float)
+        evicted = self.filter_bank.evict_stale(float(timestamps.max()))
+        accepted = np.zeros(len(tag_ids), dtype=bool)
+        usable = np.ones(len(tag_ids), dtype=bool)
+        if qualities is not None:
+            usable = np.array([quality is None or quality >= self.min_quality for quality in qualities], dtype=bool)
+            self.low_quality += len(tag_ids) - int(np.count_nonzero(usable))
+        if not usable.any():
+            return accepted, evicted
+
+        rows = np.flatnonzero(usable)
+        ids = [tag_ids[row] for row in rows]
+        accepted[rows] = self.filter_bank.input_measurements(ids, np.asarray(positions, dtype=float)[rows],
+                                                             timestamps[rows])
+        if accepted.any():
+            # The newest accepted sample's tag is the one unassigned fixtures follow.
+            newest = rows[accepted[rows]][np.argmax(timestamps[rows][accepted[rows]])]
+            self.latest_tag = tag_ids[newest]
+        return accepted, evicted
+
+    def stats(self):
+        stats = {"low_quality": self.low_quality, "tags": len(self.filter_bank)}
+        stats.update(self.filter_bank.stats())
+        return stats
+
+    def snapshot(self, timestamp=None, stats=None):
+        bank = self.filter_bank
+        tag_ids = tuple(bank.slots)
+        rows = np.fromiter(bank.slots.values(), dtype=np.intp, count=len(tag_ids))
+        velocities = bank.velocities[rows] if hasattr(bank, "velocities") else np.zeros((len(rows), 3))
+        return Snapshot(timestamp, tag_ids, bank.positions[rows], velocities, bank.last_seen[rows], self.latest_tag,
+                        stats)
+
+    def fixture_rows(self):
+        # Filter bank row per fixture, -1 when its tag is not being tracked. Assigned rows are only re-resolved
+        # when the bank hands out or frees rows, unassigned fixtures follow the most recently updated tag.
+        if self._rows_generation != self.filter_bank.generation:
+            slots = self.filter_bank.slots
+            names = self.fixture_array.names
+            self._assigned_rows = np.array([slots.get(self.assignments[name], -1) if name in self.assignments else -1
+                                            for name in names], dtype=np.intp)
+            self._follow_latest = np.array([name not in self.assignments for name in names], dtype=bool)
+            self._rows_generation = self.filter_bank.generation
+
+        rows = self._assigned_rows.copy()
+        rows[self._follow_latest] = self.filter_bank.slots.get(self.latest_tag, -1)
+        return rows
+
+    def targets(self, now=None):
+        rows = self.fixture_rows()
+        positions = self.filter_bank.positions[rows]
+        if now is not None and hasattr(self.filter_bank, "velocities"):
+            ahead = np.clip(now - self.filter_bank.last_seen[rows] + self.latency, 0.0, self.max_prediction)
+            positions = positions + self.filter_bank.velocities[rows] * ahead[:, None]
+        return positions, rows >= 0
+
+    def dmx_targets(self, now=None):
+        # 16 bit pan/tilt values (2, N) for the motion limiter and the mask of fixtures whose tag is tracked, values
+        # is None when there are none.
+        targets, mask = self.targets(now)
+        if not mask.any():
+            return None, mask
+        fixture_array = self.fixture_array
+        pan, tilt = fixture_array.pan_tilt(targets, mask)
+        return fixture_array.dmx_positions(pan, tilt), mask
+
+    def write_dmx(self, universe, now=None):
+        targets, mask = self.targets(now)
+        if not mask.any():
+            return None
+        return self.fixture_array.write_dmx(universe, targets, mask)
@@ -2,7 +2,9 @@ import json
 import tkinter as tk
 from tkinter import ttk
 import math
+import numpy as np
 import geometry_utils as g
+import history
 
 SCALING_CANVAS = 50
 OFFSET_CANVAS_X = 50
@@ -13,14 +15,22 @@ WIDTH_INN = 650
 HEIGHT_EXT = 250
 HEIGHT_INN = 250
 
+REFRESH_HZ = 30
+
+TRAIL_POINTS = 100
+
 colors = ["blue", "green", "orange", "red"]
+trail_colors = ["purple", "teal", "magenta", "brown", "navy"]
+# One colour per OccupancyGrid level, level 0 is the canvas background.
+heat_colors = ["#ffffff", "#fff5cc", "#ffe699", "#ffcc66", "#ffaa33", "#ff8000", "#ff4d00", "#e60000"]
 
 
 class UWBVisualizer:
     def __init__(self):
-        self.x_filtered = 0
-        self.y_filtered = 0
-        self.z_filtered = 0
+        # Written by the tracking thread, read by the Tk thread. Each is replaced by a single reference swap, so the
+        # GUI reads a whole position or snapshot at its own rate and the tracker never waits for it.
+        self.position = (0, 0, 0)
+        self.snapshot = None
         self.dot_radius = 25
         self.anchor_positions = []
         self.anchor_colors = [0] * len(self.anchor_positions)
@@ -28,6 +38,11 @@ class UWBVisualizer:
         self.offset_x = 0
         self.offset_y = 0
         self.scale = 0
+        self.metrics = None  # metrics.Metrics shown in the status bar when set
+        self.calibration = None  # calibration.CalibrationSession behind the "Setup light" tab
+        # Only touched by the Tk thread, fed from the published snapshots.
+        self.history = history.PositionHistory()
+        self.occupancy = history.OccupancyGrid(levels=len(heat_colors))
 
     def save_anchor_colors(self):
         with open("./anchor_colors.json", "w") as outfile:
@@ -58,10 +73,27 @@ class UWBVisualizer:
     def on_anchor_click(self, event, anchor_index):
         self.toggle_anchor_color(anchor_index)
 
+    @property
+    def x_filtered(self):
+        return self.position[0]
+
+    @property
+    def y_filtered(self):
+        return self.position[1]
+
+    @property
+    def z_filtered(self):
+        return self.position[2]
+
     def update_position(self, pos):
-        self.x_filtered = pos[0]
-        self.y_filtered = pos[1]
-        self.z_filtered = pos[2]
+        self.position = (pos[0], pos[1], pos[2])
+
+    def publish(self, snapshot):
+        # snapshot is a tracker.Snapshot
+        self.snapshot = snapshot
+        position = snapshot.position
+        if position is not None:
+            self.position = position
 
     def update_anchor_positions(self, anchor_positions):
         self.anchor_positions = anchor_positions
@@ -74,6 +106,37 @@ class UWBVisualizer:
         (x, y) = g.flip_x((x, y), center)
         return x, y
 
+    def view_transform(self, width, height):
+        # rotate_scale_and_offset folded into one affine map for the current view:
+        # canvas (x, y) = (a * x + b * y + c, d * x + e * y + f)
+        cos_scaled = math.cos(self.rotation_angle) * self.scale
+        sin_scaled = math.sin(self.rotation_angle) * self.scale
+        return -cos_scaled, sin_scaled, width / 2 + self.offset_x, sin_scaled, cos_scaled, height / 2 - self.offset_y
+
+    @staticmethod
+    def to_canvas(transform, pos):
+        a, b, c, d, e, f = transform
+        return a * pos[0] + b * pos[1] + c, d * pos[0] + e * pos[1] + f
+
+    @staticmethod
+    def to_canvas_array(transform, points):
+        a, b, c, d, e, f = transform
+        return points[:, :2] @ np.array([[a, d], [b, e]]) + (c, f)
+
+    def heat_cell_rect(self, transform, row, column, width, height):
+        # Canvas pixels covered by one occupancy cell, centred on the cell so it follows the view rotation.
+        x, y = self.to_canvas(transform, self.occupancy.cell_center(row, column))
+        half = max(1, round(self.occupancy.cell * self.scale / 2))
+        x0, y0 = max(0, round(x) - half), max(0, round(y) - half)
+        x1, y1 = min(width, round(x) + half), min(height, round(y) + half)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, x1, y1
+
+    def dot(self, transform, pos):
+        x, y = self.to_canvas(transform, pos)
+        return x - self.dot_radius, y - self.dot_radius, x + self.dot_radius, y + self.dot_radius
+
     def init_visualizer(self):
         def on_closing():
             root.destroy()
@@ -88,72 +151,77 @@ class UWBVisualizer:
         tab1.grid(column=4, row=1)
         tab2.grid(column=3, row=4)
 
-        label1 = tk.Label(tab2, text="Set tilt/pan on pos 1")
-        label1.grid(row=0, column=0)
-
-        int_input1 = tk.Entry(tab2, width=5)
-        int_input1.grid(row=0, column=1, padx=5)
-        int_input2 = tk.Entry(tab2, width=5)
-        int_input2.grid(row=0, column=2, padx=5)
-
-        pos1, pos2 = [], []
-        pos1tilt, pos1pan = 0, 1
-        pos2tilt, pos2pan = 0, 1
-
-        def save_pos_1():
-            nonlocal pos1, pos1tilt, pos1pan
-            pos1 = [self.x_filtered, self.y_filtered, self.z_filtered]
-            pos1tilt = int(int_input1.get())
-            pos1pan = int(int_input2.get())
-
-        button1 = tk.Button(tab2, text="Save Pos 1", command=save_pos_1)
-        button1.grid(row=0, column=3, padx=20)
-
-        label2 = tk.Label(tab2, text="Set tilt/pan on pos 2")
-        label2.grid(row=1, column=0, padx=20)
-
-        int_input3 = tk.Entry(tab2, width=5)
-        int_input3.grid(row=1, column=1, padx=5)
-        int_input4 = tk.Entry(tab2, width=5)
-        int_input4.grid(row=1, column=2, padx=5)
-
-        def save_pos_2():
-            nonlocal pos2, pos2tilt, pos2pan
-            pos2 = [self.x_filtered, self.y_filtered, self.z_filtered]
-            pos2tilt = int(int_input3.get())
-            pos2pan = int(int_input4.get())
-
-        button2 = tk.Button(tab2, text="Save Pos 2", command=save_pos_2)
-        button2.grid(row=1, column=3, padx=20)
-
-        def calibrate_system():
-            nonlocal pos1, pos1tilt, pos1pan, pos2, pos2tilt, pos2pan, label3
-            dmx_values = [(pos1tilt, pos1pan), (pos2tilt, pos2pan)]
-            tag_positions = [pos1, pos2]
-
-            dmx_pans, dmx_tilts = zip(*dmx_values)
-            tag_xs, tag_ys, _ = zip(*tag_positions)
-
-            sum_x = sum(tag_xs)
-            sum_y = sum(tag_ys)
-            sum_pan = sum(dmx_pans)
-            sum_tilt = sum(dmx_tilts)
-
-            n = len(tag_xs)
-
-            pan_offset = (sum_pan - sum_x) / n
-            tilt_offset = (sum_tilt - sum_y) / n
-
-            pan_scale = sum([(dmx_pans[i] - pan_offset) / tag_xs[i] for i in range(n)]) / n
-            tilt_scale = sum([(dmx_tilts[i] - tilt_offset) / tag_ys[i] for i in range(n)]) / n
-
-            label3.config(text=f"Pan offset: {pan_offset:.2f}, Tilt offset: {tilt_offset:.2f}, Pan scale: {pan_scale:.2f}, Tilt scale: {tilt_scale:.2f}")
-
-        button3 = tk.Button(tab2, text="Calculate offsets and scales", command=calibrate_system)
-        button3.grid(row=2, column=0, padx=20)
-
-        label3 = tk.Label(tab2, text="xxx")
-        label3.grid(row=2, column=3, padx=20)
+        # Calibration: steer the beam onto the tag, enter the 16 bit pan/tilt DMX values and add the point. Three or
+        # more points spread over the stage fit the fixture's pose, the tracker aims with it once applied.
+        fits = {}
+        light_names = self.calibration.names if self.calibration is not None else [""]
+        light_name = tk.StringVar(value=light_names[0])
+
+        tk.Label(tab2, text="Light").grid(row=0, column=0, padx=5)
+        tk.OptionMenu(tab2, light_name, *light_names).grid(row=0, column=1, padx=5)
+        tk.Label(tab2, text="Pan DMX").grid(row=0, column=2, padx=5)
+        pan_input = tk.Entry(tab2, width=6)
+        pan_input.grid(row=0, column=3, padx=5)
+        tk.Label(tab2, text="Tilt DMX").grid(row=0, column=4, padx=5)
+        tilt_input = tk.Entry(tab2, width=6)
+        tilt_input.grid(row=0, column=5, padx=5)
+
+        calibration_label = tk.Label(tab2, justify="left", anchor="w", font=("Arial", 10))
+        calibration_label.grid(row=2, column=0, columnspan=7, sticky="w", padx=5)
+
+        def show_points(message=""):
+            if self.calibration is None:
+                calibration_label.config(text="Calibration needs a running tracker")
+                return
+            count = len(self.calibration.points[light_name.get()])
+            calibration_label.config(text=f"{count} point(s) for {light_name.get()}. {message}")
+
+        def add_point():
+            try:
+                self.calibration.add_point(light_name.get(), self.position, int(pan_input.get()),
+                                           int(tilt_input.get()))
+            except ValueError as ex:
+                show_points(str(ex))
+                return
+            show_points(f"Added at ({self.position[0]:.2f}, {self.position[1]:.2f}, {self.position[2]:.2f})")
+
+        def remove_point():
+            self.calibration.remove_last(light_name.get())
+            show_points()
+
+        def clear_points():
+            self.calibration.clear(light_name.get())
+            fits.pop(light_name.get(), None)
+            show_points()
+
+        def solve():
+            try:
+                fit = fits[light_name.get()] = self.calibration.solve(light_name.get())
+            except (ValueError, np.linalg.LinAlgError) as ex:
+                show_points(str(ex))
+                return
+            residuals = ", ".join(f"{residual:.2f}" for residual in fit.residuals)
+            show_points(f"Position ({fit.position[0]:.2f}, {fit.position[1]:.2f}, {fit.position[2]:.2f}) m, "
+                        f"orientation {fit.orientation:.1f}, pitch {fit.pitch:.1f}, roll {fit.roll:.1f} deg\n"
+                        f"rms {fit.rms:.2f} deg, per point {residuals}")
+
+        def apply():
+            fit = fits.pop(light_name.get(), None)
+            if fit is None:
+                show_points("Solve first")
+                return
+            self.calibration.apply(light_name.get(), fit)
+            show_points(f"Applied, rms {fit.rms:.2f} deg")
+
+        buttons = tk.Frame(tab2)
+        buttons.grid(row=1, column=0, columnspan=7, sticky="w")
+        for column, (text, command) in enumerate((("Add point", add_point), ("Remove last", remove_point),
+                                                  ("Clear", clear_points), ("Solve", solve), ("Apply", apply))):
+            tk.Button(buttons, text=text, command=command,
+                      state="normal" if self.calibration is not None else "disabled").grid(row=0, column=column,
+                                                                                          padx=5, pady=5)
+        light_name.trace_add("write", lambda *args: show_points())
+        show_points()
 
         frame = tk.Frame(root, width=WIDTH_EXT, height=HEIGHT_EXT)
         frame.pack_propagate(False)  # Prevent the frame to resize to its content
@@ -165,6 +233,11 @@ class UWBVisualizer:
         position_label = tk.Label(root, text="Position: (0.00, 0.00, 0.00)", font=("Arial", 13), pady=10)
         position_label.pack()
 
+        status_bar = tk.Label(root, text="", anchor="w", relief="sunken", font=("Arial", 10))
+        if self.metrics is not None:
+            status_bar.pack(side="bottom", fill="x")
+        status_ticks = 0
+
         self.load_ui_configs()
 
         def rotate_ccw():
@@ -201,8 +274,50 @@ class UWBVisualizer:
         button_cw = tk.Button(rot_frame, text="Rotate CW", command=rotate_cw)
         button_cw.pack()
 
+        # Items are created once and moved with coords/itemconfig, the anchors are rebuilt only when the anchor
+        # list itself is replaced and their coordinates only recomputed when the view changes. The heatmap image
+        # sits at the bottom and is painted one cell at a time, it is only redrawn whole when the view changes.
+        heatmap = tk.PhotoImage(width=WIDTH_INN, height=HEIGHT_INN)
+        heat_item = canvas.create_image(0, 0, image=heatmap, anchor="nw")
+        tag_item = canvas.create_oval(0, 0, 0, 0, fill="purple")
+        anchor_items = []
+        trail_items = {}
+        dirty_trails = set()
+        drawn_anchors = drawn_view = drawn_colors = drawn_position = drawn_label = drawn_snapshot = None
+        transform = None
+
+        show_trails = tk.BooleanVar(value=True)
+        show_heatmap = tk.BooleanVar(value=True)
+
+        def toggle_layers():
+            canvas.itemconfig("trail", state="normal" if show_trails.get() else "hidden")
+            canvas.itemconfig(heat_item, state="normal" if show_heatmap.get() else "hidden")
+
+        def clear_heatmap():
+            self.occupancy.clear()
+            heatmap.blank()
+
+        layers_frame = tk.Frame(tab1)
+        layers_frame.grid(row=0, column=4, padx=20, pady=20)
+        tk.Checkbutton(layers_frame, text="Trails", variable=show_trails, command=toggle_layers).pack(anchor="w")
+        tk.Checkbutton(layers_frame, text="Heatmap", variable=show_heatmap, command=toggle_layers).pack(anchor="w")
+        tk.Button(layers_frame, text="Clear heatmap", command=clear_heatmap).pack(anchor="w")
+
+        def paint_heat(row, column):
+            rect = self.heat_cell_rect(transform, row, column, WIDTH_INN, HEIGHT_INN)
+            if rect is not None:
+                heatmap.put(heat_colors[self.occupancy.level(self.occupancy.counts[row, column])], to=rect)
+
+        def on_anchor_click(event):
+            current = canvas.find_withtag("current")
+            if current and current[0] in anchor_items:
+                self.on_anchor_click(event, anchor_index=anchor_items.index(current[0]))
+
+        canvas.tag_bind("anchor", "<Button-1>", on_anchor_click)
+
         def update():
-            center = (canvas.winfo_width() / 2, canvas.winfo_height() / 2)
+            nonlocal status_ticks, anchor_items, drawn_anchors, drawn_view, drawn_colors, drawn_position, \
+                drawn_label, drawn_snapshot, transform
             dirty = False
             if self.offset_x != offset_x_slider.get():
                 self.offset_x = offset_x_slider.get()
@@ -217,25 +332,72 @@ class UWBVisualizer:
             if dirty:
                 self.save_ui_configs()
 
-            x, y = self.rotate_scale_and_offset(center, (self.x_filtered, self.y_filtered), canvas)
-
-            canvas.delete("all")
-            canvas.create_oval(x - self.dot_radius, y - self.dot_radius, x + self.dot_radius, y + self.dot_radius,
-                               fill="purple")
-
-            for index, (x, y, z) in enumerate(self.anchor_positions):
-                x, y = self.rotate_scale_and_offset(center, (x, y), canvas)
-
-                anchor = canvas.create_oval(x - self.dot_radius, y - self.dot_radius,
-                                            x + self.dot_radius, y + self.dot_radius,
-                                            fill=colors[self.anchor_colors[index]])
-                canvas.tag_bind(anchor, "<Button-1>",
-                                lambda event, anchor_index=index: self.on_anchor_click(event,
-                                                                                       anchor_index=anchor_index))
-
-            position_label.config(
-                text=f"Position: ({self.x_filtered:.2f}, {self.y_filtered:.2f}, {self.z_filtered:.2f})")
-            root.after(100, update)
+            anchor_positions = self.anchor_positions
+            if anchor_positions is not drawn_anchors:
+                canvas.delete("anchor")
+                anchor_items = [canvas.create_oval(0, 0, 0, 0, tags=("anchor",)) for _ in anchor_positions]
+                drawn_anchors = anchor_positions
+                drawn_view = drawn_colors = None
+
+            view = (self.offset_x, self.offset_y, self.scale, self.rotation_angle, canvas.winfo_width(),
+                    canvas.winfo_height())
+            if view != drawn_view:
+                transform = self.view_transform(view[4], view[5])
+                for anchor, position in zip(anchor_items, anchor_positions):
+                    canvas.coords(anchor, *self.dot(transform, position))
+                drawn_view = view
+                drawn_position = None
+
+                heatmap.blank()
+                for row, column, _ in self.occupancy.occupied():
+                    paint_heat(row, column)
+                dirty_trails.update(trail_items)
+
+            snapshot = self.snapshot
+            if snapshot is not drawn_snapshot and snapshot is not None:
+                for tag_id in self.history.add_snapshot(snapshot):
+                    dirty_trails.add(tag_id)
+                    cell = self.occupancy.add(self.history.trail(tag_id, 1)[0])
+                    if cell is not None:
+                        paint_heat(*cell)
+                for tag_id in [tag_id for tag_id in trail_items if tag_id not in self.history]:
+                    canvas.delete(trail_items.pop(tag_id))
+                    dirty_trails.discard(tag_id)
+                drawn_snapshot = snapshot
+
+            for tag_id in dirty_trails:
+                points = self.history.trail(tag_id, TRAIL_POINTS)
+                if len(points) < 2:
+                    continue
+                trail = trail_items.get(tag_id)
+                if trail is None:
+                    trail = trail_items[tag_id] = canvas.create_line(
+                        0, 0, 0, 0, width=2, tags=("trail",), fill=trail_colors[len(trail_items) % len(trail_colors)],
+                        state="normal" if show_trails.get() else "hidden")
+                    canvas.tag_lower(trail, tag_item)
+                canvas.coords(trail, *self.to_canvas_array(transform, points).ravel())
+            dirty_trails.clear()
+
+            anchor_colors = tuple(self.anchor_colors)
+            if anchor_colors != drawn_colors:
+                for index, anchor in enumerate(anchor_items):
+                    canvas.itemconfig(anchor, fill=colors[anchor_colors[index] if index < len(anchor_colors) else 0])
+                drawn_colors = anchor_colors
+
+            position = self.position
+            if position != drawn_position:
+                canvas.coords(tag_item, *self.dot(transform, position))
+                drawn_position = position
+
+            label = f"Position: ({position[0]:.2f}, {position[1]:.2f}, {position[2]:.2f})"
+            if label != drawn_label:
+                position_label.config(text=label)
+                drawn_label = label
+            if self.metrics is not None:
+                status_ticks = (status_ticks + 1) % REFRESH_HZ
+                if status_ticks == 0:
+                    status_bar.config(text=self.metrics.summary())
+            root.after(1000 // REFRESH_HZ, update)
 
         tabControl.add(tab1, text='Setup view')
         tabControl.add(tab2, text='Setup light')